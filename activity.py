@@ -0,0 +1,68 @@
+import logging
+import threading
+from datetime import datetime
+
+from async_db import run_db
+from database import bulk_update_user_activity
+from metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityBuffer:
+    """
+    Буфер отложенной записи last_activity. Каждое действие пользователя только
+    запоминает время в памяти (повторные касания одного пользователя схлопываются),
+    а в БД изменения уходят одной пакетной транзакцией при flush().
+    """
+
+    def __init__(self):
+        self._pending: dict[int, datetime] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def touch(self, user_id: int):
+        """Отмечает активность пользователя (без обращения к БД)."""
+        with self._lock:
+            self._pending[user_id] = datetime.now()
+
+    def _drain(self) -> list[tuple[int, datetime]]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return list(pending.items())
+
+    def _restore(self, items: list[tuple[int, datetime]]):
+        """Возвращает несохранённые записи в буфер, не затирая более свежие касания."""
+        with self._lock:
+            for user_id, last_activity in items:
+                current = self._pending.get(user_id)
+                if current is None or current < last_activity:
+                    self._pending[user_id] = last_activity
+
+    async def flush(self) -> int:
+        """Записывает накопленные касания в БД. Возвращает количество записей."""
+        items = self._drain()
+        if not items:
+            return 0
+
+        saved = await run_db(bulk_update_user_activity, items)
+        if saved is None:
+            logger.warning(f"Не удалось сохранить активность {len(items)} пользователей.")
+            self._restore(items)
+            return 0
+
+        logger.debug(f"Сохранена активность {saved} пользователей.")
+        return saved
+
+
+activity_buffer = ActivityBuffer()
+
+ACTIVITY_PENDING = Gauge("bot_activity_buffer_size", "Пользователи с несохранённой активностью")
+ACTIVITY_PENDING.set_function(lambda: len(activity_buffer))
+
+
+def touch_user_activity(user_id: int):
+    """Отмечает активность пользователя в буфере отложенной записи."""
+    activity_buffer.touch(user_id)
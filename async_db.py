@@ -0,0 +1,141 @@
+import asyncio
+import functools
+import logging
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, TypeVar
+
+import database
+from config import DB_EXECUTOR_THREADS, DB_QUEUE_MAX
+from metrics import Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Отдельные потоки для работы с SQLite: event loop никогда не ждёт диск сам
+_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_THREADS, thread_name_prefix="db")
+# Ограничение глубины очереди: при переполнении вызывающий ждёт свободного места
+_queue_slots = asyncio.Semaphore(DB_QUEUE_MAX)
+
+# --- Метрики ---
+
+
+@dataclass
+class DBExecutorStats:
+    """Накопленные метрики работы с БД через исполнитель."""
+
+    calls: int = 0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+    run_seconds_total: float = 0.0
+
+    def record(self, wait: float, run: float):
+        self.calls += 1
+        self.wait_seconds_total += wait
+        self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        self.run_seconds_total += run
+
+    @property
+    def wait_seconds_avg(self) -> float:
+        return self.wait_seconds_total / self.calls if self.calls else 0.0
+
+
+stats = DBExecutorStats()
+
+DB_QUEUE_DEPTH = Gauge("bot_db_executor_queue_depth", "Запросы к БД в очереди и в работе")
+DB_QUEUE_DEPTH.set_function(lambda: stats.queue_depth)
+DB_WAIT_SECONDS = Histogram(
+    "bot_db_executor_wait_seconds", "Ожидание свободного потока исполнителя БД"
+)
+
+# --- Выполнение ---
+
+
+async def run_db(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Выполняет синхронную функцию работы с БД в потоке исполнителя.
+    Время ожидания (очередь + свободный поток) и время выполнения попадают в stats.
+    """
+    enqueued = time.perf_counter()
+    async with _queue_slots:
+        stats.queue_depth += 1
+        stats.max_queue_depth = max(stats.max_queue_depth, stats.queue_depth)
+
+        def call() -> tuple[T, float, float]:
+            started = time.perf_counter()
+            result = func(*args, **kwargs)
+            return result, started - enqueued, time.perf_counter() - started
+
+        try:
+            loop = asyncio.get_running_loop()
+            result, wait, run = await loop.run_in_executor(_executor, call)
+        finally:
+            stats.queue_depth -= 1
+
+    stats.record(wait, run)
+    DB_WAIT_SECONDS.observe(wait)
+    return result
+
+
+def _async(func: Callable[..., T]) -> Callable[..., Any]:
+    """Создаёт асинхронную обёртку над функцией из database.py."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs) -> T:
+        return await run_db(func, *args, **kwargs)
+
+    return wrapper
+
+
+def _async_cached(func: Callable[..., T], peek: Callable[..., Any]) -> Callable[..., Any]:
+    """Как _async, но сначала пробует ответить из кэша прямо в event loop."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs) -> T:
+        cached = peek(*args, **kwargs)
+        if cached is not None:
+            return cached
+        return await run_db(func, *args, **kwargs)
+
+    return wrapper
+
+
+def shutdown():
+    """Дожидается завершения поставленных запросов и останавливает потоки исполнителя."""
+    _executor.shutdown(wait=True)
+    logger.info(
+        f"Исполнитель БД остановлен: запросов {stats.calls}, "
+        f"среднее ожидание {stats.wait_seconds_avg * 1000:.1f} мс, "
+        f"максимальное {stats.wait_seconds_max * 1000:.1f} мс."
+    )
+
+
+# --- Асинхронные версии функций database.py ---
+
+init_db = _async(database.init_db)
+register_user = _async(database.register_user)
+mark_task_completed = _async(database.mark_task_completed)
+get_today_tasks_status = _async_cached(
+    database.get_today_tasks_status, database.peek_today_tasks_status
+)
+get_user_stats = _async(database.get_user_stats)
+get_completion_rate = _async_cached(database.get_completion_rate, database.peek_completion_rate)
+get_all_active_user_ids = _async(database.get_all_active_user_ids)
+get_today_completion_masks = _async(database.get_today_completion_masks)
+set_user_timezone = _async(database.set_user_timezone)
+get_user_timezone = _async(database.get_user_timezone)
+get_user_today = _async_cached(database.get_user_today, database.peek_user_today)
+refresh_reminder_slots = _async(database.refresh_reminder_slots)
+get_due_reminders = _async(database.get_due_reminders)
+get_user_schedule = _async_cached(database.get_user_schedule, database.peek_user_schedule)
+set_task_time = _async(database.set_task_time)
+add_custom_task = _async(database.add_custom_task)
+remove_task = _async(database.remove_task)
+reset_user_schedule = _async(database.reset_user_schedule)
+get_scheduler_state = _async(database.get_scheduler_state)
+set_scheduler_state = _async(database.set_scheduler_state)
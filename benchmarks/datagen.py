@@ -0,0 +1,124 @@
+import random
+import sqlite3
+from collections.abc import Iterator
+from datetime import date, datetime, timedelta
+
+import database
+from config import COMPACT_STORAGE, SCHEDULE
+
+# Часовые пояса синтетических пользователей (None — пояс по умолчанию)
+ZONES = [None, "Europe/Moscow", "Asia/Yekaterinburg", "Asia/Novosibirsk", "Europe/Berlin"]
+# Доля пользователей со своим расписанием
+OVERRIDE_SHARE = 0.05
+# Вероятность выполнить задачу в активный день и доля активных дней
+COMPLETION_PROBABILITY = 0.6
+ACTIVE_DAY_PROBABILITY = 0.8
+# Доля пользователей, заходивших за последние ACTIVE_USER_DAYS дней
+ACTIVE_USER_SHARE = 0.7
+
+CHUNK = 50_000
+
+
+def _users(rng: random.Random, count: int, today: date) -> Iterator[tuple]:
+    now = datetime.combine(today, datetime.min.time()) + timedelta(hours=12)
+    for user_id in range(1, count + 1):
+        active = rng.random() < ACTIVE_USER_SHARE
+        days_ago = rng.randint(0, database.ACTIVE_USER_DAYS - 1) if active else rng.randint(31, 365)
+        yield (
+            user_id,
+            f"user{user_id}",
+            f"User {user_id}",
+            now - timedelta(days=days_ago),
+            rng.choice(ZONES),
+        )
+
+
+def _completions(rng: random.Random, users: int, days: int, today: date) -> Iterator[tuple]:
+    """(user_id, день, список ключей выполненных задач) за days дней по сегодня включительно."""
+    keys = list(SCHEDULE)
+    for user_id in range(1, users + 1):
+        for offset in range(days):
+            if rng.random() >= ACTIVE_DAY_PROBABILITY:
+                continue
+            done = [key for key in keys if rng.random() < COMPLETION_PROBABILITY]
+            if done:
+                yield user_id, today - timedelta(days=days - 1 - offset), done
+
+
+def _insert_chunked(cursor: sqlite3.Cursor, sql: str, rows: Iterator[tuple]):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK:
+            cursor.executemany(sql, chunk)
+            chunk.clear()
+    if chunk:
+        cursor.executemany(sql, chunk)
+
+
+def generate(path: str, users: int, days: int, seed: int = 1) -> dict:
+    """
+    Создаёт БД со схемой бота и синтетическими данными: users пользователей и
+    days дней истории выполнений (в tasks или, при COMPACT_STORAGE, в дневных
+    масках), агрегаты daily_stats, переопределения расписаний и слоты
+    напоминаний. Данные детерминированы при одинаковых параметрах и seed.
+    """
+    original_path = database.DATABASE_PATH
+    database.DATABASE_PATH = path
+    try:
+        _generate(path, users, days, random.Random(seed))
+    finally:
+        database.close_db()
+        database.DATABASE_PATH = original_path
+    return {"users": users, "days": days, "seed": seed, "compact_storage": COMPACT_STORAGE}
+
+
+def _generate(path: str, users: int, days: int, rng: random.Random):
+    today = date.today()
+    database.init_db()
+    database.close_db()
+
+    conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous = OFF")
+    cursor = conn.cursor()
+    _insert_chunked(
+        cursor,
+        "INSERT INTO users (user_id, username, first_name, last_activity, timezone) "
+        "VALUES (?, ?, ?, ?, ?)",
+        _users(rng, users, today),
+    )
+
+    completions = _completions(rng, users, days, today)
+    if COMPACT_STORAGE:
+        _insert_chunked(
+            cursor,
+            "INSERT INTO daily_completions (user_id, day, mask) VALUES (?, ?, ?)",
+            (
+                (user_id, day, sum(database.TASK_BITS[key] for key in done))
+                for user_id, day, done in completions
+            ),
+        )
+    else:
+        now = datetime.now()
+        _insert_chunked(
+            cursor,
+            "INSERT INTO tasks (user_id, task_key, completion_date, completion_time) "
+            "VALUES (?, ?, ?, ?)",
+            ((user_id, key, day, now) for user_id, day, done in completions for key in done),
+        )
+    database._backfill_daily_stats(cursor)
+
+    overrides = []
+    for user_id in rng.sample(range(1, users + 1), int(users * OVERRIDE_SHARE)):
+        overrides.append((user_id, "breakfast", f"{rng.randint(6, 10):02d}:30", None, 0))
+        overrides.append((user_id, "custom_1", "07:00", "Медитация", 0))
+    cursor.executemany(
+        "INSERT INTO user_tasks (user_id, task_key, time, title, removed) VALUES (?, ?, ?, ?, ?)",
+        overrides,
+    )
+    conn.commit()
+    conn.close()
+
+    # Слоты напоминаний строит сам бот
+    database.refresh_reminder_slots()
@@ -0,0 +1,48 @@
+import asyncio
+import collections
+import random
+import time
+from typing import Optional
+
+from telegram.error import RetryAfter
+
+
+class FakeBot:
+    """
+    Замена Bot для бенчмарков без сети: send_message ждёт latency секунд
+    (± jitter) и, как Telegram, отвечает RetryAfter при превышении rate_limit
+    сообщений в секунду. Запоминает время каждой успешной отправки.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.02,
+        jitter: float = 0.5,
+        rate_limit: Optional[float] = None,
+        seed: int = 1,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.sent_at: list[float] = []
+        self.retry_after = 0
+        self._window: collections.deque[float] = collections.deque()
+        self._rng = random.Random(seed)
+
+    def _over_limit(self, now: float) -> bool:
+        if self.rate_limit is None:
+            return False
+        while self._window and self._window[0] <= now - 1.0:
+            self._window.popleft()
+        if len(self._window) >= self.rate_limit:
+            return True
+        self._window.append(now)
+        return False
+
+    async def send_message(self, chat_id: int, **kwargs):
+        if self._over_limit(time.monotonic()):
+            self.retry_after += 1
+            raise RetryAfter(1)
+        spread = self.latency * self.jitter
+        await asyncio.sleep(max(self.latency + self._rng.uniform(-spread, spread), 0.0))
+        self.sent_at.append(time.perf_counter())
@@ -0,0 +1,338 @@
+"""
+Бенчмарки горячих путей БД и рассылок на синтетических данных, без сети.
+
+    python -m benchmarks.run --users 10000 100000 --days 30
+    python -m benchmarks.run --users 10000 --compare benchmarks/results/baseline.json
+
+Сгенерированные БД кэшируются в benchmarks/.data, каждый прогон работает с копией.
+Результаты (ops/s, p50/p99, пиковый RSS) сохраняются в JSON.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Optional
+
+import broadcast
+import database
+import scheduler
+from benchmarks.datagen import generate
+from benchmarks.fake_bot import FakeBot
+from config import COMPACT_STORAGE, SCHEDULE
+from outbox import OutboxWorker
+from timezones import MINUTES_PER_DAY, current_utc_minute
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BENCH_DIR, ".data")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+
+@dataclass
+class Result:
+    users: int
+    name: str
+    kind: str
+    calls: int
+    seconds: float
+    ops_per_sec: float
+    p50_ms: float
+    p99_ms: float
+    peak_rss_mb: float
+    extra: dict[str, Any] = field(default_factory=dict)
+
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS процесса с момента запуска (монотонно растёт между кейсами)."""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values: list[float], q: int) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def _result(users, name, kind, latencies, seconds, **extra) -> Result:
+    return Result(
+        users=users,
+        name=name,
+        kind=kind,
+        calls=len(latencies),
+        seconds=round(seconds, 4),
+        ops_per_sec=round(len(latencies) / seconds, 1) if seconds > 0 else 0.0,
+        p50_ms=round(percentile(latencies, 50) * 1000, 3),
+        p99_ms=round(percentile(latencies, 99) * 1000, 3),
+        peak_rss_mb=round(peak_rss_mb(), 1),
+        extra=extra,
+    )
+
+
+# --- Функции БД ---
+
+
+def busiest_minute(path: str) -> int:
+    with contextlib.closing(sqlite3.connect(path)) as conn:
+        row = conn.execute(
+            "SELECT due_minute FROM reminder_slots GROUP BY due_minute "
+            "ORDER BY COUNT(*) DESC LIMIT 1"
+        ).fetchone()
+    return row[0] if row else 0
+
+
+# Вызовов выборок по всем пользователям: они на порядки дольше точечных запросов
+BULK_CALLS = 5
+
+
+def db_cases(
+    users: int, minute: int, calls: int, rng: random.Random
+) -> list[tuple[str, Callable, Callable, int]]:
+    """(имя, функция database.py, генератор аргументов одного вызова, число вызовов)."""
+    keys = list(SCHEDULE)
+
+    def none() -> tuple:
+        return ()
+
+    def user() -> tuple:
+        return (rng.randint(1, users),)
+
+    def completion() -> tuple:
+        return (rng.randint(1, users), rng.choice(keys))
+
+    return [
+        ("get_all_active_user_ids", database.get_all_active_user_ids, none, BULK_CALLS),
+        ("get_today_completion_masks", database.get_today_completion_masks, none, BULK_CALLS),
+        ("get_due_reminders", database.get_due_reminders, lambda: (minute,), BULK_CALLS * 4),
+        ("get_today_tasks_status", database.get_today_tasks_status, user, calls),
+        ("get_completion_rate", database.get_completion_rate, user, calls),
+        ("get_user_stats", database.get_user_stats, user, calls),
+        ("get_user_schedule", database.get_user_schedule, user, calls),
+        ("mark_task_completed", database.mark_task_completed, completion, calls),
+    ]
+
+
+def bench_db(users: int, name: str, func: Callable, make_args: Callable, calls: int) -> Result:
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(calls):
+        args = make_args()
+        call_started = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - call_started)
+    return _result(users, name, "db", latencies, time.perf_counter() - started)
+
+
+# --- Задачи планировщика ---
+
+
+async def bench_job(users: int, name: str, job: Callable, bot: FakeBot) -> Result:
+    """
+    Запускает задачу и отправляет всё, что она поставила в outbox. Задержка
+    сообщения — от запуска задачи до его отправки.
+    """
+    already_sent = len(bot.sent_at)
+    retries_before = bot.retry_after
+    worker = OutboxWorker(bot)
+    started = time.perf_counter()
+    await job(None)
+    enqueued = time.perf_counter()
+    while await worker.drain_once():
+        pass
+    finished = time.perf_counter()
+
+    latencies = [sent - started for sent in bot.sent_at[already_sent:]]
+    return _result(
+        users,
+        name,
+        "job",
+        latencies,
+        finished - started,
+        enqueue_seconds=round(enqueued - started, 4),
+        retry_after=bot.retry_after - retries_before,
+    )
+
+
+async def run_jobs(users: int, bot: FakeBot, only: Optional[str]) -> list[Result]:
+    # __wrapped__ — задача без проверки аренды лидера
+    jobs = [
+        ("job:reminders", scheduler.dispatch_reminders_job.__wrapped__),
+        ("job:daily_summary", scheduler.send_daily_summary_job.__wrapped__),
+        ("job:motivational", scheduler.send_motivational_message_job.__wrapped__),
+    ]
+    results = []
+    for name, job in jobs:
+        if only and only not in name:
+            continue
+        results.append(await bench_job(users, name, job, bot))
+    return results
+
+
+# --- Запуск ---
+
+
+@contextlib.contextmanager
+def patched(target: Any, **values) -> Iterator[None]:
+    original = {name: getattr(target, name) for name in values}
+    for name, value in values.items():
+        setattr(target, name, value)
+    try:
+        yield
+    finally:
+        for name, value in original.items():
+            setattr(target, name, value)
+
+
+def dataset_path(users: int, days: int, seed: int, data_dir: str) -> str:
+    """БД с синтетическими данными (генерируется один раз на набор параметров)."""
+    suffix = "-compact" if COMPACT_STORAGE else ""
+    path = os.path.join(data_dir, f"bench-{users}u-{days}d-s{seed}{suffix}.db")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        started = time.perf_counter()
+        generate(path + ".tmp", users, days, seed)
+        os.replace(path + ".tmp", path)
+        print(f"Данные для {users} пользователей созданы за {time.perf_counter() - started:.1f} с")
+    return path
+
+
+def run_scale(args: argparse.Namespace, users: int) -> list[Result]:
+    source = dataset_path(users, args.days, args.seed, args.data_dir)
+    work = source + ".run"
+    shutil.copyfile(source, work)
+    rng = random.Random(args.seed)
+    bot = FakeBot(latency=args.latency, rate_limit=args.rate_limit, seed=args.seed)
+    limits = {}
+    if not args.respect_limits:
+        # Меряем собственные накладные расходы бота, а не лимиты Telegram
+        limits = {
+            "global_limiter": broadcast.TokenBucket(1e9),
+            "chat_limiter": broadcast.PerChatLimiter(0),
+        }
+    spreads = {
+        "REMINDER_SPREAD_SECONDS": 0.0,
+        "DAILY_SUMMARY_SPREAD_SECONDS": 0.0,
+        "MOTIVATIONAL_SPREAD_SECONDS": 0.0,
+    }
+
+    # Задача напоминаний обрабатывает «текущую» минуту: подставляем самую загруженную
+    minute = busiest_minute(work)
+    epoch_minute = current_utc_minute()
+    epoch_minute += (minute - epoch_minute) % MINUTES_PER_DAY
+
+    results = []
+    try:
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(patched(database, DATABASE_PATH=work))
+            stack.enter_context(patched(broadcast, **limits))
+            stack.enter_context(
+                patched(scheduler, current_utc_minute=lambda: epoch_minute, **spreads)
+            )
+            for name, func, make_args, calls in db_cases(users, minute, args.calls, rng):
+                if args.only and args.only not in name:
+                    continue
+                results.append(bench_db(users, name, func, make_args, calls))
+
+            database.set_scheduler_state(
+                scheduler.LAST_DISPATCHED_MINUTE_KEY, str(epoch_minute - 1)
+            )
+            results += asyncio.run(run_jobs(users, bot, args.only))
+            database.close_db()
+    finally:
+        for path in (work, work + "-wal", work + "-shm"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+    return results
+
+
+def print_results(results: list[Result], baseline: Optional[dict] = None):
+    previous = {(r["users"], r["name"]): r for r in (baseline or {}).get("results", [])}
+    header = (
+        f"{'users':>8} {'case':<28} {'calls':>7} {'ops/s':>10} "
+        f"{'p50 ms':>9} {'p99 ms':>9} {'RSS MB':>7}"
+    )
+    print(header + ("  Δops/s   Δp99" if previous else ""))
+    for r in results:
+        line = (
+            f"{r.users:>8} {r.name:<28} {r.calls:>7} {r.ops_per_sec:>10.1f} "
+            f"{r.p50_ms:>9.3f} {r.p99_ms:>9.3f} {r.peak_rss_mb:>7.1f}"
+        )
+        old = previous.get((r.users, r.name))
+        if old:
+            ops = (r.ops_per_sec / old["ops_per_sec"] - 1) * 100 if old["ops_per_sec"] else 0
+            p99 = (r.p99_ms / old["p99_ms"] - 1) * 100 if old["p99_ms"] else 0
+            line += f"  {ops:+6.1f}% {p99:+6.1f}%"
+        print(line)
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000])
+    parser.add_argument("--days", type=int, default=30, help="дней истории выполнений")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--calls", type=int, default=1000, help="вызовов на функцию БД")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка send_message, с")
+    parser.add_argument("--rate-limit", type=float, default=None, help="лимит фейкового бота")
+    parser.add_argument("--respect-limits", action="store_true", help="оставить лимиты рассылок")
+    parser.add_argument("--only", help="запускать кейсы, в имени которых есть подстрока")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--output", help="файл результатов JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> list[Result]:
+    args = parse_args(argv)
+    results = []
+    for users in args.users:
+        results += run_scale(args, users)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{platform.node()}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    meta = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "machine": platform.machine(),
+        "compact_storage": COMPACT_STORAGE,
+        **{key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": [asdict(r) for r in results]}, f, indent=2)
+    print(f"Результаты: {output}")
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    main()
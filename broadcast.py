@@ -0,0 +1,275 @@
+import asyncio
+import inspect
+import logging
+import time
+from collections.abc import AsyncIterable, Awaitable, Callable, Iterable
+from dataclasses import dataclass, field
+from typing import Any, Optional, Union
+
+from telegram import Bot
+from telegram.error import Forbidden, RetryAfter
+
+from config import (
+    BROADCAST_CONCURRENCY,
+    BROADCAST_MAX_RETRIES,
+    BROADCAST_PER_CHAT_INTERVAL,
+    BROADCAST_RATE_LIMIT,
+)
+
+logger = logging.getLogger(__name__)
+
+# Функция, которая по получателю возвращает аргументы для send_message
+# (или None, если пользователю ничего отправлять не нужно).
+MessageBuilder = Callable[
+    [Any], Union[Optional[dict[str, Any]], Awaitable[Optional[dict[str, Any]]]]
+]
+
+# --- Ограничители скорости ---
+
+
+class TokenBucket:
+    """
+    Token bucket для глобального лимита Telegram (~30 сообщений в секунду).
+    Поддерживает паузу всего ведра после RetryAfter.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Приостанавливает выдачу токенов (например, по RetryAfter от Telegram)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        """Ждёт, пока в ведре появится токен, и забирает его."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                elapsed = now - self._updated
+                self._updated = now
+                self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class PerChatLimiter:
+    """Гарантирует минимальный интервал между сообщениями в один и тот же чат."""
+
+    def __init__(self, interval: float, max_tracked: int = 10_000):
+        self.interval = interval
+        self.max_tracked = max_tracked
+        self._next_allowed: dict[int, float] = {}
+
+    async def wait(self, chat_id: int):
+        now = time.monotonic()
+        slot = max(now, self._next_allowed.get(chat_id, 0.0))
+        self._next_allowed[chat_id] = slot + self.interval
+
+        if len(self._next_allowed) > self.max_tracked:
+            self._next_allowed = {
+                key: value for key, value in self._next_allowed.items() if value > now
+            }
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+# Общие лимитеры процесса: одновременные рассылки делят один лимит Telegram
+global_limiter = TokenBucket(BROADCAST_RATE_LIMIT)
+chat_limiter = PerChatLimiter(BROADCAST_PER_CHAT_INTERVAL)
+
+# --- Статистика ---
+
+
+@dataclass
+class BroadcastStats:
+    """Итоги одного запуска рассылки."""
+
+    job_id: str
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+    total: int = 0
+    sent: int = 0
+    skipped: int = 0
+    failed: int = 0
+    retries: int = 0
+
+    @property
+    def duration(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        """Отправленных сообщений в секунду."""
+        duration = self.duration
+        return self.sent / duration if duration > 0 else 0.0
+
+
+# --- Рассылка ---
+
+
+async def _send_with_retry(
+    bot: Bot,
+    user_id: int,
+    message: dict[str, Any],
+    stats: BroadcastStats,
+    limiter: TokenBucket,
+    per_chat: PerChatLimiter,
+    max_retries: int,
+) -> bool:
+    """Отправляет одно сообщение, соблюдая лимиты и повторяя попытку после RetryAfter."""
+    for attempt in range(max_retries + 1):
+        await per_chat.wait(user_id)
+        await limiter.acquire()
+        try:
+            await bot.send_message(chat_id=user_id, **message)
+            return True
+        except RetryAfter as e:
+            limiter.pause(e.retry_after)
+            if attempt == max_retries:
+                break
+            stats.retries += 1
+            logger.warning(
+                "RetryAfter %s с при отправке пользователю %s (%s), повтор %s/%s.",
+                e.retry_after,
+                user_id,
+                stats.job_id,
+                attempt + 1,
+                max_retries,
+            )
+        except Forbidden as e:
+            # Пользователь заблокировал бота: повторять бессмысленно
+            logger.info("Пользователь %s недоступен для рассылки %s: %s", user_id, stats.job_id, e)
+            return False
+        except Exception as e:
+            logger.error("Не удалось отправить %s пользователю %s: %s", stats.job_id, user_id, e)
+            return False
+
+    logger.error("Исчерпаны повторы при отправке %s пользователю %s.", stats.job_id, user_id)
+    return False
+
+
+def _recipient_reader(
+    recipients: Union[Iterable[Any], AsyncIterable[Any]],
+) -> Callable[[], Awaitable[Optional[Any]]]:
+    """
+    Возвращает корутину-функцию, выдающую следующего получателя (None — конец).
+    Асинхронный генератор нельзя продвигать из нескольких воркеров одновременно,
+    поэтому чтение сериализуется блокировкой.
+    """
+    if not isinstance(recipients, AsyncIterable):
+        recipients_iter = iter(recipients)
+
+        async def next_sync() -> Optional[Any]:
+            # Все воркеры работают в одном event loop, поэтому общий итератор безопасен
+            return next(recipients_iter, None)
+
+        return next_sync
+
+    recipients_aiter = recipients.__aiter__()
+    lock = asyncio.Lock()
+
+    async def next_async() -> Optional[Any]:
+        async with lock:
+            try:
+                return await recipients_aiter.__anext__()
+            except StopAsyncIteration:
+                return None
+
+    return next_async
+
+
+async def broadcast(
+    bot: Bot,
+    job_id: str,
+    recipients: Union[Iterable[Any], AsyncIterable[Any]],
+    build_message: MessageBuilder,
+    *,
+    concurrency: Optional[int] = None,
+    limiter: Optional[TokenBucket] = None,
+    per_chat: Optional[PerChatLimiter] = None,
+    max_retries: Optional[int] = None,
+    chat_id_of: Optional[Callable[[Any], int]] = None,
+    on_result: Optional[Callable[[Any, bool], None]] = None,
+    quiet: bool = False,
+) -> BroadcastStats:
+    """
+    Рассылает сообщения получателям через ограниченный пул конкурентных отправителей.
+    Получатели читаются из (асинхронного) итератора лениво, поэтому сюда можно
+    передавать потоковую выборку из БД. Возвращает статистику запуска.
+
+    Получателями по умолчанию являются ID чатов; для других элементов (например,
+    строк outbox) chat_id_of извлекает ID чата. on_result вызывается для каждого
+    получателя с признаком успешной отправки (пропущенные и получатели, для которых
+    не удалось подготовить сообщение, — с False), quiet убирает итоговый лог в DEBUG.
+    """
+    stats = BroadcastStats(job_id=job_id)
+    limiter = limiter or global_limiter
+    per_chat = per_chat or chat_limiter
+    max_retries = BROADCAST_MAX_RETRIES if max_retries is None else max_retries
+    next_recipient = _recipient_reader(recipients)
+
+    async def worker():
+        while (item := await next_recipient()) is not None:
+            stats.total += 1
+            user_id = chat_id_of(item) if chat_id_of else item
+            try:
+                message = build_message(item)
+                if inspect.isawaitable(message):
+                    message = await message
+            except Exception as e:
+                stats.failed += 1
+                logger.error(
+                    "Не удалось подготовить %s для пользователя %s: %s", job_id, user_id, e
+                )
+                if on_result is not None:
+                    on_result(item, False)
+                continue
+
+            if message is None:
+                stats.skipped += 1
+                if on_result is not None:
+                    on_result(item, False)
+                continue
+
+            ok = await _send_with_retry(
+                bot, user_id, message, stats, limiter, per_chat, max_retries
+            )
+            if ok:
+                stats.sent += 1
+            else:
+                stats.failed += 1
+            if on_result is not None:
+                on_result(item, ok)
+
+    workers = concurrency or BROADCAST_CONCURRENCY
+    await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+    stats.finished_at = time.monotonic()
+
+    logger.log(
+        logging.DEBUG if quiet else logging.INFO,
+        "Рассылка %s завершена: отправлено %s из %s, пропущено %s, ошибок %s, повторов %s, "
+        "%.1f с (%.1f сообщ./с).",
+        job_id,
+        stats.sent,
+        stats.total,
+        stats.skipped,
+        stats.failed,
+        stats.retries,
+        stats.duration,
+        stats.throughput,
+    )
+    return stats
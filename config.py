@@ -1,4 +1,5 @@
 import os
+import socket
 from datetime import time
 
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
@@ -38,6 +39,27 @@ SCHEDULE = {
 
 TIMEZONE = os.getenv("TIMEZONE", "UTC")
 DATABASE_PATH = os.getenv("DATABASE_PATH", "bot_data.db")
+# Компактное хранение выполнений: одна строка с битовой маской на (пользователь, день)
+COMPACT_STORAGE = os.getenv("COMPACT_STORAGE", "false").lower() == "true"
+
+# Пул соединений SQLite (см. db_pool.py)
+DB_READER_POOL_SIZE = int(os.getenv("DB_READER_POOL_SIZE", 4))
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", 5.0))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", 16384))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", 64 * 1024 * 1024))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 128))
+# Размер LRU-кэша статуса пользователей на сегодня (см. status_cache.py)
+STATUS_CACHE_SIZE = int(os.getenv("STATUS_CACHE_SIZE", 10000))
+# Окно, в котором повторное нажатие той же inline-кнопки отбрасывается (см. dedup.py)
+CALLBACK_DEDUP_SECONDS = float(os.getenv("CALLBACK_DEDUP_SECONDS", 10))
+CALLBACK_DEDUP_SIZE = int(os.getenv("CALLBACK_DEDUP_SIZE", 10000))
+# Асинхронный доступ к БД (см. async_db.py)
+DB_EXECUTOR_THREADS = int(os.getenv("DB_EXECUTOR_THREADS", 4))
+DB_QUEUE_MAX = int(os.getenv("DB_QUEUE_MAX", 1000))
+# Период сброса буфера активности пользователей в БД, секунды (см. activity.py)
+ACTIVITY_FLUSH_INTERVAL = int(os.getenv("ACTIVITY_FLUSH_INTERVAL", 30))
+# Сколько своих задач пользователь может добавить к расписанию (см. schedules.py)
+MAX_CUSTOM_TASKS = int(os.getenv("MAX_CUSTOM_TASKS", 10))
 
 MESSAGES = {
     "start": (
@@ -45,11 +67,17 @@ MESSAGES = {
         "📋 Доступные команды:\n"
         "• /статус - текущий статус задач\n"
         "• /отчет - отправить отчет за день\n"
-        "• /расписание - показать расписание\n\n"
+        "• /расписание - показать расписание\n"
+        "• /timezone Europe/Moscow - выбрать часовой пояс\n"
+        "• /settime 2 07:30 - перенести задачу №2 из расписания\n"
+        "• /addtask 07:00 Медитация - добавить свою задачу\n"
+        "• /removetask 2 - убрать задачу №2 из расписания\n"
+        "• /resetschedule - вернуть стандартное расписание\n\n"
         "Я буду напоминать тебе о важных делах и следить за их выполнением! 💪"
     ),
     "task_completed": "✅ Отлично! Задача выполнена.",
     "task_already_completed": "ℹ️ Эта задача уже выполнена сегодня.",
+    "task_button_stale": "⌛ Это напоминание за прошлый день — отметить по нему задачу уже нельзя.",
     "unknown_message": "🤔 Не понимаю. Используй команды или отвечай на мои напоминания.",
     "no_tasks_today": "📅 На сегодня задач нет или все выполнены!",
     "status_header": "📊 Статус задач на сегодня:",
@@ -60,6 +88,22 @@ MESSAGES = {
     "task_missed": "❌ Пропущено",
     "report_submitted": "✅ Спасибо! Ваш отчёт сохранён.",
     "cancel_report": "❌ Отчёт отменён.",
+    "timezone_current": (
+        "🌍 Ваш часовой пояс: {timezone}.\n"
+        "Чтобы сменить его, отправьте /timezone и название пояса, например /timezone Europe/Moscow"
+    ),
+    "timezone_set": "✅ Часовой пояс изменён на {timezone}. Напоминания придут по вашему времени.",
+    "timezone_invalid": "⚠️ Не знаю такого часового пояса. Пример: /timezone Europe/Moscow",
+    "schedule_usage": (
+        "Примеры:\n/settime 2 07:30 — перенести задачу №2\n"
+        "/addtask 07:00 Медитация — добавить задачу\n/removetask 2 — убрать задачу №2"
+    ),
+    "schedule_task_not_found": "⚠️ Нет задачи с таким номером. Номера показаны в /schedule.",
+    "schedule_time_set": "✅ Задача «{task}» перенесена на {time}.",
+    "schedule_task_added": "✅ Задача «{task}» добавлена на {time}.",
+    "schedule_task_removed": "🗑 Задача «{task}» убрана из расписания.",
+    "schedule_limit_reached": "⚠️ Нельзя добавить больше {limit} своих задач.",
+    "schedule_reset": "↩️ Расписание возвращено к стандартному.",
     "motivational": [
         "Отличная работа! Продолжай в том же духе! 💪",
         "Ты сегодня просто огонь! 🔥",
@@ -71,4 +115,75 @@ MESSAGES = {
 
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
 PORT = int(os.getenv("PORT", 8000))
+# Логирование (см. logs.py): формат text или json, уровень, файл с ротацией
+# (пусто — только консоль), размер очереди записей и ограничение повторов:
+# не больше LOG_RATE_LIMIT записей с одной строки кода за LOG_RATE_WINDOW секунд
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", 20))
+LOG_RATE_WINDOW = float(os.getenv("LOG_RATE_WINDOW", 60))
+# Порт health-сервера: GET /health и метрики Prometheus GET /metrics
+HEALTH_PORT = int(os.getenv("HEALTH_PORT", 8080))
+# Сколько обновлений обрабатывается одновременно (см. update_processor.py);
+# обновления одного пользователя всегда идут по очереди. 1 — строго последовательно
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", 16))
+
+# Профилирование (см. profiling.py). Процессорное время операций собирается
+# только при включённом профилировании; медленные операции пишутся в лог всегда
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+SLOW_OPERATION_SECONDS = float(os.getenv("SLOW_OPERATION_SECONDS", 0.5))
+# Токен для /debug/* на health-сервере; без токена эти адреса отключены
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", 30))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005))
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".")
 USE_WEBHOOK = os.getenv("USE_WEBHOOK", "false").lower() == "true"
+
+# Параметры массовых рассылок (см. broadcast.py)
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", 20))
+BROADCAST_RATE_LIMIT = float(os.getenv("BROADCAST_RATE_LIMIT", 28))
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv("BROADCAST_PER_CHAT_INTERVAL", 1.0))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", 3))
+
+# Пул HTTP-соединений к Bot API (см. http_pool.py). По умолчанию на рассылку
+# хватает соединений с запасом для ответов на команды во время рассылки
+BOT_CONNECTION_POOL_SIZE = int(os.getenv("BOT_CONNECTION_POOL_SIZE", BROADCAST_CONCURRENCY + 16))
+BOT_HTTP_VERSION = os.getenv("BOT_HTTP_VERSION", "1.1")
+BOT_CONNECT_TIMEOUT = float(os.getenv("BOT_CONNECT_TIMEOUT", 5.0))
+BOT_READ_TIMEOUT = float(os.getenv("BOT_READ_TIMEOUT", 10.0))
+BOT_POOL_TIMEOUT = float(os.getenv("BOT_POOL_TIMEOUT", 5.0))
+
+# Очередь исходящих сообщений (см. outbox.py)
+OUTBOX_PAGE_SIZE = int(os.getenv("OUTBOX_PAGE_SIZE", 500))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 5.0))
+# Сколько дней хранить итоги завершённых пакетов рассылок (outbox_batches)
+OUTBOX_BATCH_RETENTION_DAYS = int(os.getenv("OUTBOX_BATCH_RETENTION_DAYS", 7))
+# Число процессов-отправителей outbox (см. sender_pool.py); 0 — отправка в основном процессе
+SENDER_PROCESSES = int(os.getenv("SENDER_PROCESSES", 0))
+# Окна разнесения рассылок, секунды: каждый получатель получает постоянное
+# смещение внутри окна, чтобы отправка шла ровно, а не всплеском
+REMINDER_SPREAD_SECONDS = float(os.getenv("REMINDER_SPREAD_SECONDS", 60))
+MOTIVATIONAL_SPREAD_SECONDS = float(os.getenv("MOTIVATIONAL_SPREAD_SECONDS", 300))
+DAILY_SUMMARY_SPREAD_SECONDS = float(os.getenv("DAILY_SUMMARY_SPREAD_SECONDS", 300))
+
+# Напоминания по часовым поясам пользователей (см. scheduler.py)
+# Местное время сводки дня: она рассылается через те же слоты, что и напоминания
+DAILY_SUMMARY_TIME = time(22, 0)
+# Сколько пропущенных минут диспетчер догоняет после задержки запуска
+REMINDER_CATCHUP_MINUTES = int(os.getenv("REMINDER_CATCHUP_MINUTES", 10))
+# Период пересчёта слотов напоминаний (переход на летнее/зимнее время), секунды
+REMINDER_SLOTS_REFRESH_INTERVAL = int(os.getenv("REMINDER_SLOTS_REFRESH_INTERVAL", 900))
+
+# Несколько экземпляров бота (см. leader.py): планировщиком владеет один лидер,
+# а отправку outbox делят шарды по user_id % SHARD_COUNT
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", 0))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 1))
+INSTANCE_ID = os.getenv("INSTANCE_ID") or f"{socket.gethostname()}-{SHARD_INDEX}"
+# Обновления Telegram (polling или webhook) принимает только один экземпляр;
+# остальные запускаются с RECEIVE_UPDATES=false и только рассылают свой шард
+RECEIVE_UPDATES = os.getenv("RECEIVE_UPDATES", "true").lower() == "true"
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", 30))
+# Через сколько секунд строка outbox, захваченная упавшим экземпляром, снова уходит в очередь
+OUTBOX_CLAIM_TIMEOUT = float(os.getenv("OUTBOX_CLAIM_TIMEOUT", 300))
@@ -1,42 +1,637 @@
 import logging
 import sqlite3
+from array import array
 from collections.abc import Callable
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, time, timedelta
 from functools import wraps
-from typing import Optional
+from time import perf_counter, thread_time
+from typing import Optional, Union
 
 # Импорты из вашего проекта
-from config import DATABASE_PATH, SCHEDULE
+from config import COMPACT_STORAGE, DAILY_SUMMARY_TIME, DATABASE_PATH, SCHEDULE
+from db_pool import close_pool, get_pool, on_pool_close
+from metrics import Histogram
+from profiling import profiler, record
+from schedules import (
+    CUSTOM_TASK_KEYS,
+    Schedule,
+    build_schedule,
+    parse_task_time,
+    schedule_cache,
+)
+from status_cache import STATUS_WINDOW_DAYS, DailyStatus, status_cache
+from timezones import get_zone, local_date, reminder_minute, reminder_minutes
 
 logger = logging.getLogger(__name__)
 
+# Пользователь считается активным, если проявлял активность за последние N дней
+ACTIVE_USER_DAYS = 30
+
+DB_QUERY_SECONDS = Histogram(
+    "bot_db_query_duration_seconds", "Время выполнения функций database.py", ["function"]
+)
+
 # --- Декоратор для управления подключением к БД ---
 
 
-def db_connection(func: Callable) -> Callable:
+def db_connection(func: Optional[Callable] = None, *, readonly: bool = False) -> Callable:
     """
     Декоратор, который управляет подключением к базе данных.
-    Открывает соединение, создает курсор, выполняет функцию,
-    сохраняет изменения и закрывает соединение.
+    Берёт долгоживущее соединение из пула (писателя или, при readonly=True,
+    одного из читателей), создает курсор, выполняет функцию и
+    сохраняет изменения. Соединения не закрываются между вызовами.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            cpu_started = thread_time() if profiler.enabled else None
+            try:
+                pool = get_pool(DATABASE_PATH)
+                if readonly:
+                    with pool.reader() as conn:
+                        return func(conn.cursor(), *args, **kwargs)
+
+                with pool.writer() as conn:
+                    try:
+                        result = func(conn.cursor(), *args, **kwargs)
+                        conn.commit()
+                        return result
+                    except BaseException:
+                        conn.rollback()
+                        raise
+            except sqlite3.Error as e:
+                # Логируем специфичные ошибки SQLite
+                logger.error("Ошибка базы данных в функции %s: %s", func.__name__, e)
+                # Для некоторых функций может потребоваться вернуть значение по умолчанию
+                return None  # или False, [], {} в зависимости от функции
+            finally:
+                wall = perf_counter() - started
+                DB_QUERY_SECONDS.observe(wall, function=func.__name__)
+                cpu = thread_time() - cpu_started if cpu_started is not None else None
+                record("db", func.__name__, wall, cpu)
+
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def close_db():
+    """Закрывает соединения с БД (вызывается при остановке бота)."""
+    close_pool()
+
+
+# --- Миграции схемы ---
+
+
+def _backfill_daily_stats(cursor: sqlite3.Cursor):
+    """Строит дневные агрегаты и префиксные суммы по уже накопленной истории выполнений."""
+    if COMPACT_STORAGE:
+        # При обновлении существующей БД история ещё лежит в tasks: переносим её
+        # в маски до подсчёта, иначе агрегаты построятся по пустой daily_completions
+        _sync_task_bits(cursor)
+        _backfill_daily_completions(cursor)
+        cursor.connection.create_function(
+            "bit_count", 1, lambda mask: int(mask).bit_count(), deterministic=True
+        )
+        source = """
+            SELECT user_id, day, bit_count(mask) AS completed
+            FROM daily_completions WHERE mask != 0
+        """
+    else:
+        source = """
+            SELECT user_id, completion_date AS day, COUNT(*) AS completed
+            FROM tasks GROUP BY user_id, completion_date
+        """
+    cursor.execute(f"""
+        INSERT OR REPLACE INTO daily_stats (user_id, day, completed, cum_completed, cum_active_days)
+        SELECT user_id, day, completed, SUM(completed) OVER w, COUNT(*) OVER w
+        FROM ({source})
+        WINDOW w AS (PARTITION BY user_id ORDER BY day ROWS UNBOUNDED PRECEDING)
+    """)
+
+
+# Версия 1 — базовая схема, которую создаёт init_db (users, tasks, idx_user_task_date).
+# Каждая следующая миграция — (версия, описание, шаги); шаг — SQL-выражение
+# или функция, принимающая курсор. Шаги должны быть идемпотентными.
+MIGRATIONS: list[tuple[int, str, list[Union[str, Callable[[sqlite3.Cursor], None]]]]] = [
+    (
+        2,
+        "индексы для выборки активных пользователей и статистики по датам",
+        [
+            # Покрывающий индекс для get_all_active_user_ids (user_id — это rowid)
+            "CREATE INDEX IF NOT EXISTS idx_users_last_activity ON users(last_activity)",
+            # Покрывающий индекс для диапазонных запросов по (user_id, completion_date)
+            """
+            CREATE INDEX IF NOT EXISTS idx_tasks_user_date
+            ON tasks(user_id, completion_date, task_key)
+            """,
+        ],
+    ),
+    (
+        3,
+        "компактное хранение выполнений: номера битов задач и дневные маски",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS task_bits (
+                task_key TEXT PRIMARY KEY,
+                bit INTEGER NOT NULL UNIQUE
+            )
+            """,
+            # Одна строка на (пользователь, день) с битовой маской выполненных задач
+            """
+            CREATE TABLE IF NOT EXISTS daily_completions (
+                user_id INTEGER NOT NULL,
+                day DATE NOT NULL,
+                mask INTEGER NOT NULL,
+                PRIMARY KEY (user_id, day)
+            ) WITHOUT ROWID
+            """,
+        ],
+    ),
+    (
+        4,
+        "дневные агрегаты выполнения с префиксными суммами",
+        [
+            # cum_* — накопленные с первого дня суммы: процент за любое окно считается
+            # по двум строкам, независимо от длины окна
+            """
+            CREATE TABLE IF NOT EXISTS daily_stats (
+                user_id INTEGER NOT NULL,
+                day DATE NOT NULL,
+                completed INTEGER NOT NULL,
+                cum_completed INTEGER NOT NULL,
+                cum_active_days INTEGER NOT NULL,
+                PRIMARY KEY (user_id, day)
+            ) WITHOUT ROWID
+            """,
+            _backfill_daily_stats,
+        ],
+    ),
+    (
+        5,
+        "очередь исходящих сообщений (outbox) для рассылок",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS outbox_batches (
+                batch_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                created_at TIMESTAMP NOT NULL,
+                total INTEGER NOT NULL DEFAULT 0,
+                sent INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                finished_at TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY,
+                batch_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                task_key TEXT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                claim_id TEXT,
+                FOREIGN KEY (batch_id) REFERENCES outbox_batches (batch_id) ON DELETE CASCADE
+            )
+            """,
+            # Частичный индекс: воркеры выбирают только ожидающие отправки строки
+            "CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox(id) WHERE status = 'pending'",
+            "CREATE INDEX IF NOT EXISTS idx_outbox_claim ON outbox(claim_id)",
+            "CREATE INDEX IF NOT EXISTS idx_outbox_batch_status ON outbox(batch_id, status)",
+        ],
+    ),
+    (
+        6,
+        "часовые пояса пользователей и слоты напоминаний по UTC-минутам",
+        [
+            # NULL — пояс бота по умолчанию (config.TIMEZONE)
+            "ALTER TABLE users ADD COLUMN timezone TEXT",
+            "CREATE INDEX IF NOT EXISTS idx_users_timezone ON users(timezone)",
+            # Минута суток по UTC, в которую пользователю нужно напомнить о задаче
+            """
+            CREATE TABLE IF NOT EXISTS reminder_slots (
+                due_minute INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                task_key TEXT NOT NULL,
+                PRIMARY KEY (due_minute, user_id, task_key)
+            ) WITHOUT ROWID
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_reminder_slots_user ON reminder_slots(user_id)",
+            # Минуты, по которым построены слоты каждого пояса ('' — пояс по умолчанию)
+            """
+            CREATE TABLE IF NOT EXISTS reminder_zones (
+                zone TEXT PRIMARY KEY,
+                minutes TEXT NOT NULL
+            )
+            """,
+        ],
+    ),
+    (
+        7,
+        "пользовательские переопределения расписания",
+        [
+            # Строка на изменённую задачу: новое время, удаление (removed = 1)
+            # или своя задача custom_<n> с названием
+            """
+            CREATE TABLE IF NOT EXISTS user_tasks (
+                user_id INTEGER NOT NULL,
+                task_key TEXT NOT NULL,
+                time TEXT,
+                title TEXT,
+                removed INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, task_key)
+            ) WITHOUT ROWID
+            """,
+        ],
+    ),
+    (
+        8,
+        "разнесение отправки сообщений outbox во времени",
+        [
+            # Unix-время, раньше которого строку не отправляют
+            "ALTER TABLE outbox ADD COLUMN not_before REAL NOT NULL DEFAULT 0",
+            "DROP INDEX IF EXISTS idx_outbox_pending",
+            """
+            CREATE INDEX IF NOT EXISTS idx_outbox_due
+            ON outbox(not_before, id) WHERE status = 'pending'
+            """,
+        ],
+    ),
+    (
+        9,
+        "аренда лидера планировщика и шардирование outbox",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """,
+            # Состояние задач планировщика, которое должно пережить смену лидера
+            """
+            CREATE TABLE IF NOT EXISTS scheduler_state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+            """,
+            # Кто и когда захватил строку: после перезапуска экземпляр возвращает
+            # в очередь свои строки, а зависшие строки упавших реплик — по таймауту
+            "ALTER TABLE outbox ADD COLUMN claimed_by TEXT",
+            "ALTER TABLE outbox ADD COLUMN claimed_at REAL",
+            # user_id в индексе: шард (user_id % SHARD_COUNT) фильтруется без чтения таблицы
+            "DROP INDEX IF EXISTS idx_outbox_due",
+            """
+            CREATE INDEX IF NOT EXISTS idx_outbox_due
+            ON outbox(not_before, id, user_id) WHERE status = 'pending'
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_outbox_sending ON outbox(claimed_at) "
+            "WHERE status = 'sending'",
+        ],
+    ),
+    (
+        10,
+        "часовой пояс в индексе активных пользователей",
+        [
+            # Сводка по маскам выполнения сверяет даты по местному времени
+            # пользователя: индекс по-прежнему покрывает выборку активных
+            "CREATE INDEX IF NOT EXISTS idx_users_active_tz ON users(last_activity, timezone)",
+            "DROP INDEX IF EXISTS idx_users_last_activity",
+        ],
+    ),
+    (
+        11,
+        "счётчики и индексы пакетов outbox",
+        [
+            # Незавершённые пакеты выбираются при старте и каждой проверке зависших
+            # строк, завершённые — удаляются по сроку хранения
+            """
+            CREATE INDEX IF NOT EXISTS idx_outbox_batches_open
+            ON outbox_batches(batch_id) WHERE finished_at IS NULL
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_outbox_batches_finished
+            ON outbox_batches(finished_at) WHERE finished_at IS NOT NULL
+            """,
+            # sent/failed теперь растут при каждом подтверждении: досчитываем их для
+            # пакетов, которые рассылались до миграции
+            """
+            UPDATE outbox_batches SET
+                sent = (SELECT COUNT(*) FROM outbox o
+                        WHERE o.batch_id = outbox_batches.batch_id AND o.status = 'sent'),
+                failed = (SELECT COUNT(*) FROM outbox o
+                          WHERE o.batch_id = outbox_batches.batch_id AND o.status = 'failed')
+            WHERE finished_at IS NULL
+            """,
+        ],
+    ),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0] if MIGRATIONS else 1
+
+
+def _get_schema_version(cursor: sqlite3.Cursor) -> int:
+    cursor.execute("SELECT MAX(version) FROM schema_version")
+    version = cursor.fetchone()[0]
+    return version if version is not None else 1
+
+
+def _apply_migrations(cursor: sqlite3.Cursor):
+    """Применяет по порядку все миграции новее текущей версии схемы."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        )
+    """)
+    conn = cursor.connection
+    current = _get_schema_version(cursor)
+
+    for version, description, steps in MIGRATIONS:
+        if version <= current:
+            continue
+
+        # Каждая миграция применяется в отдельной транзакции вместе с записью о версии
+        if conn.in_transaction:
+            conn.commit()
+        cursor.execute("BEGIN")
+        for step in steps:
+            if callable(step):
+                step(cursor)
+            else:
+                cursor.execute(step)
+        cursor.execute(
+            "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+            (version, description, datetime.now()),
+        )
+        conn.commit()
+        logger.info(f"Применена миграция схемы {version}: {description}.")
+
+
+# --- Биты задач и компактное хранение ---
+
+# Маска задачи (1 << номер бита). Номера битов хранятся в таблице task_bits и
+# не меняются при правке SCHEDULE; init_db загружает их сюда.
+TASK_BITS = {task_key: 1 << index for index, task_key in enumerate(SCHEDULE)}
+# Обратное соответствие: номер бита -> ключ задачи (короткий код задачи в кнопках)
+TASK_KEYS_BY_BIT = {index: task_key for index, task_key in enumerate(SCHEDULE)}
+
+# Маска хранится в знаковом 64-битном INTEGER SQLite
+MAX_TASK_BITS = 63
+
+
+def _ensure_task_bit(cursor: sqlite3.Cursor, task_key: str) -> Optional[int]:
+    """Возвращает маску задачи, при необходимости назначая ей следующий свободный бит."""
+    mask = TASK_BITS.get(task_key)
+    if mask is not None:
+        return mask
+
+    cursor.execute("SELECT bit FROM task_bits WHERE task_key = ?", (task_key,))
+    row = cursor.fetchone()
+    if row is None:
+        cursor.execute("SELECT COALESCE(MAX(bit) + 1, 0) FROM task_bits")
+        bit = cursor.fetchone()[0]
+        if bit >= MAX_TASK_BITS:
+            logger.error(f"Нет свободного бита для задачи {task_key}: все {MAX_TASK_BITS} заняты.")
+            return None
+        cursor.execute("INSERT INTO task_bits (task_key, bit) VALUES (?, ?)", (task_key, bit))
+    else:
+        bit = row["bit"]
+
+    TASK_BITS[task_key] = 1 << bit
+    TASK_KEYS_BY_BIT[bit] = task_key
+    return TASK_BITS[task_key]
+
+
+def _sync_task_bits(cursor: sqlite3.Cursor):
+    """
+    Загружает номера битов из БД и назначает биты новым задачам из SCHEDULE
+    и ключам пользовательских задач.
+    """
+    cursor.execute("SELECT task_key, bit FROM task_bits")
+    rows = cursor.fetchall()
+    TASK_BITS.clear()
+    TASK_BITS.update({row["task_key"]: 1 << row["bit"] for row in rows})
+    TASK_KEYS_BY_BIT.clear()
+    TASK_KEYS_BY_BIT.update({row["bit"]: row["task_key"] for row in rows})
+    for task_key in [*SCHEDULE, *CUSTOM_TASK_KEYS]:
+        _ensure_task_bit(cursor, task_key)
+
+
+def _task_keys_in_mask(mask: int) -> list[str]:
+    """Ключи задач, биты которых установлены в маске (в порядке номеров битов)."""
+    return [
+        task_key
+        for task_key, bit in sorted(TASK_BITS.items(), key=lambda item: item[1])
+        if mask & bit
+    ]
+
+
+def _backfill_daily_completions(cursor: sqlite3.Cursor):
+    """Переносит построчные выполнения из tasks в дневные маски (идемпотентно)."""
+    cursor.execute("""
+        INSERT INTO daily_completions (user_id, day, mask)
+        SELECT t.user_id, t.completion_date, SUM(1 << b.bit)
+        FROM tasks t JOIN task_bits b ON b.task_key = t.task_key
+        WHERE 1
+        GROUP BY t.user_id, t.completion_date
+        ON CONFLICT (user_id, day) DO UPDATE SET mask = mask | excluded.mask
+    """)
+
+
+def _unfold_daily_completions(cursor: sqlite3.Cursor):
+    """
+    Обратный перенос: выполнения, записанные в компактном режиме, — в строки
+    tasks (идемпотентно). Время выполнения не сохранялось, берётся начало дня.
+    daily_stats уже учитывает эти выполнения и не меняется.
+    """
+    cursor.execute("""
+        INSERT OR IGNORE INTO tasks (user_id, task_key, completion_date, completion_time)
+        SELECT d.user_id, b.task_key, d.day, d.day || ' 00:00:00'
+        FROM daily_completions d JOIN task_bits b ON d.mask & (1 << b.bit) != 0
+    """)
+
+
+# Ключ scheduler_state с режимом хранения выполнений, в котором БД открывали последний раз
+STORAGE_MODE_KEY = "completions_storage"
+
+
+def _convert_completions_storage(cursor: sqlite3.Cursor):
+    """
+    Переносит выполнения в формат текущего режима (COMPACT_STORAGE), только если
+    режим сменился с прошлого запуска: перенос читает всю историю выполнений.
+    """
+    mode = "compact" if COMPACT_STORAGE else "rows"
+    cursor.execute("SELECT value FROM scheduler_state WHERE key = ?", (STORAGE_MODE_KEY,))
+    row = cursor.fetchone()
+    if row is not None and row["value"] == mode:
+        return
+
+    if COMPACT_STORAGE:
+        _backfill_daily_completions(cursor)
+    else:
+        _unfold_daily_completions(cursor)
+    cursor.execute(
+        "INSERT OR REPLACE INTO scheduler_state (key, value) VALUES (?, ?)",
+        (STORAGE_MODE_KEY, mode),
+    )
+    logger.info("Выполнения перенесены в режим хранения %s.", mode)
+
+
+# --- Местная дата пользователя ---
+#
+# «Сегодня» для выполнения задач, напоминаний и статистики — дата по местному
+# времени пользователя (users.timezone), а не по часам сервера.
+
+
+def _user_today(cursor: sqlite3.Cursor, user_id: int) -> tuple[date, Optional[str]]:
+    """(сегодняшняя дата по местному времени пользователя, его часовой пояс)."""
+    cursor.execute("SELECT timezone FROM users WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    timezone_name = row["timezone"] if row else None
+    return local_date(timezone_name), timezone_name
+
+
+def _register_local_date(cursor: sqlite3.Cursor) -> Callable[[Optional[str]], date]:
+    """
+    Регистрирует SQL-функцию local_date(timezone) — сегодняшняя дата по местному
+    времени пояса — и возвращает её аналог для Python. Дата вычисляется один раз
+    на пояс, поэтому все строки одной выборки видят один и тот же «сегодня».
     """
+    days: dict[Optional[str], date] = {}
+
+    def day_of(timezone_name: Optional[str]) -> date:
+        day = days.get(timezone_name)
+        if day is None:
+            day = days[timezone_name] = local_date(timezone_name)
+        return day
+
+    cursor.connection.create_function(
+        "local_date", 1, lambda timezone_name: day_of(timezone_name).isoformat()
+    )
+    return day_of
+
+
+# --- Кэш статуса пользователей на сегодня ---
+
+# Кэши привязаны к файлу БД: сбрасываем их при закрытии или смене пула
+on_pool_close(status_cache.clear)
+on_pool_close(schedule_cache.clear)
+
+
+def _load_daily_status(cursor: sqlite3.Cursor, user_id: int) -> DailyStatus:
+    """Загружает из БД выполнение задач за последние STATUS_WINDOW_DAYS дней и кэширует его."""
+    token = status_cache.begin_load()
+    today, timezone_name = _user_today(cursor, user_id)
+    start_date = today - timedelta(days=STATUS_WINDOW_DAYS - 1)
+    daily_counts = [0] * STATUS_WINDOW_DAYS
+    completed_mask = 0
+
+    if COMPACT_STORAGE:
+        cursor.execute(
+            "SELECT day, mask FROM daily_completions WHERE user_id = ? AND day >= ?",
+            (user_id, start_date),
+        )
+        for row in cursor.fetchall():
+            day_index = (date.fromisoformat(row["day"]) - start_date).days
+            if 0 <= day_index < STATUS_WINDOW_DAYS:
+                daily_counts[day_index] = row["mask"].bit_count()
+            if day_index == STATUS_WINDOW_DAYS - 1:
+                completed_mask = row["mask"]
+
+        status = DailyStatus(today, completed_mask, daily_counts, timezone_name)
+        status_cache.put(user_id, status, token)
+        return status
+
+    cursor.execute(
+        """
+        SELECT completion_date, task_key FROM tasks
+        WHERE user_id = ? AND completion_date >= ?
+    """,
+        (user_id, start_date),
+    )
+    for row in cursor.fetchall():
+        day_index = (date.fromisoformat(row["completion_date"]) - start_date).days
+        if 0 <= day_index < STATUS_WINDOW_DAYS:
+            daily_counts[day_index] += 1
+        if day_index == STATUS_WINDOW_DAYS - 1:
+            completed_mask |= TASK_BITS.get(row["task_key"], 0)
+
+    status = DailyStatus(today, completed_mask, daily_counts, timezone_name)
+    status_cache.put(user_id, status, token)
+    return status
+
+
+def _daily_status(cursor: sqlite3.Cursor, user_id: int) -> DailyStatus:
+    return status_cache.get(user_id) or _load_daily_status(cursor, user_id)
+
+
+def _status_to_dict(status: DailyStatus, schedule: Schedule) -> dict[str, bool]:
+    return {
+        task_key: bool(status.completed_mask & TASK_BITS.get(task_key, 0)) for task_key in schedule
+    }
+
+
+def _rate_from_counts(daily_counts: list[int], days: int, tasks_per_day: int) -> float:
+    window = daily_counts[-days:] if days > 0 else []
+    active_days = sum(1 for count in window if count)
+    total_possible_tasks = tasks_per_day * active_days
+    if total_possible_tasks == 0:
+        return 0.0
+    return (sum(window) / total_possible_tasks) * 100
+
+
+def peek_today_tasks_status(user_id: int) -> Optional[dict[str, bool]]:
+    """Статус задач на сегодня из кэша без обращения к БД (None — нет в кэше)."""
+    schedule = schedule_cache.get(user_id)
+    status = status_cache.get(user_id) if schedule is not None else None
+    return None if status is None else _status_to_dict(status, schedule)
+
+
+def peek_completion_rate(user_id: int, days: int = 7) -> Optional[float]:
+    """Процент выполнения из кэша без обращения к БД (None — нет в кэше)."""
+    if days > STATUS_WINDOW_DAYS:
+        return None
+    schedule = schedule_cache.get(user_id)
+    status = status_cache.get(user_id) if schedule is not None else None
+    return None if status is None else _rate_from_counts(status.daily_counts, days, len(schedule))
+
 
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        try:
-            with sqlite3.connect(DATABASE_PATH) as conn:
-                # Row_factory позволяет получать результаты в виде словарей
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                result = func(cursor, *args, **kwargs)
-                conn.commit()
-                return result
-        except sqlite3.Error as e:
-            # Логируем специфичные ошибки SQLite
-            logger.error(f"Ошибка базы данных в функции {func.__name__}: {e}")
-            # Для некоторых функций может потребоваться вернуть значение по умолчанию
-            return None  # или False, [], {} в зависимости от функции
+def peek_user_schedule(user_id: int) -> Optional[Schedule]:
+    """Действующее расписание пользователя из кэша (None — нет в кэше)."""
+    return schedule_cache.get(user_id)
 
-    return wrapper
+
+def peek_task_completed_today(user_id: int, task_key: str) -> Optional[bool]:
+    """Выполнена ли задача сегодня — из кэша без обращения к БД (None — нет в кэше)."""
+    bit = TASK_BITS.get(task_key)
+    status = status_cache.get(user_id) if bit is not None else None
+    return None if status is None else bool(status.completed_mask & bit)
+
+
+# --- Расписание пользователя ---
+
+
+def _load_user_schedule(cursor: sqlite3.Cursor, user_id: int) -> Schedule:
+    token = schedule_cache.begin_load()
+    cursor.execute(
+        "SELECT task_key, time, title, removed FROM user_tasks WHERE user_id = ?", (user_id,)
+    )
+    schedule = build_schedule(tuple(row) for row in cursor.fetchall())
+    schedule_cache.put(user_id, schedule, token)
+    return schedule
+
+
+def _user_schedule(cursor: sqlite3.Cursor, user_id: int) -> Schedule:
+    """Действующее расписание пользователя: SCHEDULE с его переопределениями."""
+    schedule = schedule_cache.get(user_id)
+    return schedule if schedule is not None else _load_user_schedule(cursor, user_id)
 
 
 # --- Функции для работы с БД ---
@@ -45,7 +640,7 @@ def db_connection(func: Callable) -> Callable:
 @db_connection
 def init_db(cursor: sqlite3.Cursor):
     """
-    Инициализирует таблицы и индексы в базе данных.
+    Инициализирует таблицы и индексы в базе данных и применяет миграции схемы.
     Добавлен UNIQUE constraint для предотвращения дубликатов задач.
     """
     # Таблица пользователей
@@ -76,6 +671,15 @@ def init_db(cursor: sqlite3.Cursor):
         ON tasks(user_id, task_key, completion_date)
     """)
 
+    # Доводим схему до актуальной версии
+    _apply_migrations(cursor)
+
+    # Загружаем номера битов задач и, если режим хранения сменился с прошлого
+    # запуска, переносим выполнения: построчные данные — в маски или обратно
+    _sync_task_bits(cursor)
+    status_cache.clear()
+    _convert_completions_storage(cursor)
+
     logger.info("База данных успешно инициализирована.")
 
 
@@ -98,7 +702,12 @@ def register_user(
     """,
         (user_id, username, first_name, datetime.now()),
     )
-    logger.info(f"Пользователь {user_id} зарегистрирован или обновлен.")
+    # Новому пользователю сразу строим слоты напоминаний
+    cursor.execute("SELECT 1 FROM reminder_slots WHERE user_id = ? LIMIT 1", (user_id,))
+    if cursor.fetchone() is None:
+        cursor.execute("SELECT timezone FROM users WHERE user_id = ?", (user_id,))
+        _rebuild_user_slots(cursor, user_id, cursor.fetchone()["timezone"])
+    logger.debug("Пользователь %s зарегистрирован или обновлен.", user_id)
 
 
 @db_connection
@@ -110,48 +719,169 @@ def update_user_activity(cursor: sqlite3.Cursor, user_id: int):
     )
 
 
+@db_connection
+def bulk_update_user_activity(cursor: sqlite3.Cursor, activity: list[tuple[int, datetime]]) -> int:
+    """
+    Обновляет время последней активности сразу для многих пользователей
+    одной транзакцией. Возвращает количество переданных записей.
+    """
+    cursor.executemany(
+        "UPDATE users SET last_activity = ? WHERE user_id = ?",
+        [(last_activity, user_id) for user_id, last_activity in activity],
+    )
+    return len(activity)
+
+
+def _record_daily_completion(cursor: sqlite3.Cursor, user_id: int, day: date):
+    """
+    Увеличивает дневной агрегат пользователя на одну выполненную задачу.
+    Вызывается в той же транзакции, что и запись о выполнении.
+    """
+    cursor.execute(
+        """
+        UPDATE daily_stats SET completed = completed + 1, cum_completed = cum_completed + 1
+        WHERE user_id = ? AND day = ?
+    """,
+        (user_id, day),
+    )
+    new_active_day = cursor.rowcount == 0
+    if new_active_day:
+        cursor.execute(
+            """
+            SELECT cum_completed, cum_active_days FROM daily_stats
+            WHERE user_id = ? AND day < ?
+            ORDER BY day DESC LIMIT 1
+        """,
+            (user_id, day),
+        )
+        row = cursor.fetchone()
+        cum_completed, cum_active_days = (row[0], row[1]) if row else (0, 0)
+        cursor.execute(
+            """
+            INSERT INTO daily_stats (user_id, day, completed, cum_completed, cum_active_days)
+            VALUES (?, ?, 1, ?, ?)
+        """,
+            (user_id, day, cum_completed + 1, cum_active_days + 1),
+        )
+
+    # Обычно запись идёт в последний день пользователя, но если часы были переведены
+    # назад, префиксные суммы более поздних дней тоже нужно сдвинуть
+    cursor.execute(
+        """
+        UPDATE daily_stats
+        SET cum_completed = cum_completed + 1, cum_active_days = cum_active_days + ?
+        WHERE user_id = ? AND day > ?
+    """,
+        (1 if new_active_day else 0, user_id, day),
+    )
+
+
+def _prefix_totals(cursor: sqlite3.Cursor, user_id: int, day: date) -> tuple[int, int]:
+    """Накопленные (выполнено задач, активных дней) по указанный день включительно."""
+    cursor.execute(
+        """
+        SELECT cum_completed, cum_active_days FROM daily_stats
+        WHERE user_id = ? AND day <= ?
+        ORDER BY day DESC LIMIT 1
+    """,
+        (user_id, day),
+    )
+    row = cursor.fetchone()
+    return (row[0], row[1]) if row else (0, 0)
+
+
 @db_connection
 def mark_task_completed(cursor: sqlite3.Cursor, user_id: int, task_key: str) -> bool:
     """
     Отмечает задачу как выполненную. Возвращает True, если задача была отмечена,
     и False, если она уже была выполнена ранее.
     """
+    today, _ = _user_today(cursor, user_id)
+    if COMPACT_STORAGE:
+        return _mark_task_completed_compact(cursor, user_id, task_key, today)
+
     try:
         cursor.execute(
             """
             INSERT INTO tasks (user_id, task_key, completion_date, completion_time)
             VALUES (?, ?, ?, ?)
         """,
-            (user_id, task_key, date.today(), datetime.now()),
+            (user_id, task_key, today, datetime.now()),
         )
-        logger.info(f"Задача {task_key} отмечена как выполненная для user {user_id}.")
+        _record_daily_completion(cursor, user_id, today)
+        # Сначала фиксируем запись, затем обновляем кэш (сквозная запись)
+        cursor.connection.commit()
+        status_cache.mark_completed(user_id, today, TASK_BITS.get(task_key, 0))
+        logger.debug("Задача %s отмечена как выполненная для user %s.", task_key, user_id)
         return True
     except sqlite3.IntegrityError:
         # Эта ошибка возникнет, если сработает UNIQUE constraint (задача уже есть)
-        logger.warning(f"Попытка повторно отметить задачу {task_key} для user {user_id}.")
+        logger.info("Попытка повторно отметить задачу %s для user %s.", task_key, user_id)
         return False
 
 
-@db_connection
-def get_today_tasks_status(cursor: sqlite3.Cursor, user_id: int) -> dict[str, bool]:
-    """Получает словарь со статусом выполнения всех задач из SCHEDULE на сегодня."""
+def _mark_task_completed_compact(
+    cursor: sqlite3.Cursor, user_id: int, task_key: str, today: date
+) -> bool:
+    """mark_task_completed для компактного режима: установка бита в дневной маске."""
+    bit = _ensure_task_bit(cursor, task_key)
+    if bit is None:
+        return False
+
     cursor.execute(
         """
-        SELECT task_key FROM tasks WHERE user_id = ? AND completion_date = ?
+        INSERT INTO daily_completions (user_id, day, mask) VALUES (?, ?, 0)
+        ON CONFLICT (user_id, day) DO NOTHING
     """,
-        (user_id, date.today()),
+        (user_id, today),
     )
+    cursor.execute(
+        """
+        UPDATE daily_completions SET mask = mask | ?
+        WHERE user_id = ? AND day = ? AND (mask & ?) = 0
+    """,
+        (bit, user_id, today, bit),
+    )
+    if cursor.rowcount == 0:
+        logger.info("Попытка повторно отметить задачу %s для user %s.", task_key, user_id)
+        return False
 
-    completed_tasks = {row["task_key"] for row in cursor.fetchall()}
+    _record_daily_completion(cursor, user_id, today)
+    cursor.connection.commit()
+    status_cache.mark_completed(user_id, today, bit)
+    logger.debug("Задача %s отмечена как выполненная для user %s.", task_key, user_id)
+    return True
 
-    status = {task_key: task_key in completed_tasks for task_key in SCHEDULE}
-    return status
+
+@db_connection(readonly=True)
+def get_today_tasks_status(cursor: sqlite3.Cursor, user_id: int) -> dict[str, bool]:
+    """Получает словарь со статусом выполнения задач из расписания пользователя на сегодня."""
+    return _status_to_dict(_daily_status(cursor, user_id), _user_schedule(cursor, user_id))
 
 
-@db_connection
+@db_connection(readonly=True)
 def get_user_stats(cursor: sqlite3.Cursor, user_id: int, days: int = 7) -> dict[str, list[str]]:
     """Получает статистику выполненных задач за последние N дней."""
-    start_date = date.today() - timedelta(days=days - 1)
+    today, _ = _user_today(cursor, user_id)
+    start_date = today - timedelta(days=days - 1)
+    schedule = _user_schedule(cursor, user_id)
+    if COMPACT_STORAGE:
+        cursor.execute(
+            """
+            SELECT day, mask FROM daily_completions
+            WHERE user_id = ? AND day >= ? AND mask != 0
+            ORDER BY day DESC
+        """,
+            (user_id, start_date),
+        )
+        return {
+            row["day"]: [
+                schedule.get(task_key, {}).get("button_text", task_key)
+                for task_key in _task_keys_in_mask(row["mask"])
+            ]
+            for row in cursor.fetchall()
+        }
+
     cursor.execute(
         """
         SELECT completion_date, task_key FROM tasks
@@ -164,7 +894,7 @@ def get_user_stats(cursor: sqlite3.Cursor, user_id: int, days: int = 7) -> dict[
     stats = {}
     for row in cursor.fetchall():
         date_str = row["completion_date"]
-        task_name = SCHEDULE.get(row["task_key"], {}).get("button_text", row["task_key"])
+        task_name = schedule.get(row["task_key"], {}).get("button_text", row["task_key"])
 
         if date_str not in stats:
             stats[date_str] = []
@@ -173,46 +903,39 @@ def get_user_stats(cursor: sqlite3.Cursor, user_id: int, days: int = 7) -> dict[
     return stats
 
 
-@db_connection
+@db_connection(readonly=True)
 def get_completion_rate(cursor: sqlite3.Cursor, user_id: int, days: int = 7) -> float:
     """
     Рассчитывает процент выполнения задач за N дней.
-    Примечание: расчет предполагает, что расписание (SCHEDULE) было неизменным.
+    Примечание: расчет предполагает, что расписание пользователя было неизменным.
     """
-    start_date = date.today() - timedelta(days=days - 1)
-
-    # Считаем количество уникальных дней, когда пользователь выполнил хотя бы одну задачу
-    cursor.execute(
-        """
-        SELECT COUNT(DISTINCT completion_date) FROM tasks WHERE user_id = ? AND completion_date >= ?
-    """,
-        (user_id, start_date),
-    )
-    active_days = cursor.fetchone()[0]
+    tasks_per_day = len(_user_schedule(cursor, user_id))
+    # Окно до STATUS_WINDOW_DAYS дней считается по кэшируемым дневным счётчикам
+    if days <= STATUS_WINDOW_DAYS:
+        return _rate_from_counts(_daily_status(cursor, user_id).daily_counts, days, tasks_per_day)
 
-    if active_days == 0:
-        return 0.0
+    # Более длинные окна — по префиксным суммам daily_stats: две строки на любой период
+    today, _ = _user_today(cursor, user_id)
+    completed_tasks, active_days = _prefix_totals(cursor, user_id, today)
+    before_completed, before_active = _prefix_totals(cursor, user_id, today - timedelta(days=days))
+    completed_tasks -= before_completed
+    active_days -= before_active
 
-    total_possible_tasks = len(SCHEDULE) * active_days
+    total_possible_tasks = tasks_per_day * active_days
     if total_possible_tasks == 0:
         return 0.0
 
-    cursor.execute(
-        """
-        SELECT COUNT(*) FROM tasks WHERE user_id = ? AND completion_date >= ?
-    """,
-        (user_id, start_date),
-    )
-    completed_tasks = cursor.fetchone()[0]
-
     return (completed_tasks / total_possible_tasks) * 100
 
 
-@db_connection
+@db_connection(readonly=True)
 def is_task_completed_today(cursor: sqlite3.Cursor, user_id: int, task_key: str) -> bool:
     """Проверка, выполнена ли задача сегодня (по наличию записи в tasks)."""
+    if task_key in TASK_BITS:
+        return bool(_daily_status(cursor, user_id).completed_mask & TASK_BITS[task_key])
+
     try:
-        today = date.today()
+        today, _ = _user_today(cursor, user_id)
         cursor.execute(
             """
             SELECT COUNT(*) FROM tasks
@@ -222,20 +945,414 @@ def is_task_completed_today(cursor: sqlite3.Cursor, user_id: int, task_key: str)
         )
         return cursor.fetchone()[0] > 0
     except sqlite3.Error as e:
-        logger.error(f"Ошибка при проверке задачи {task_key} для пользователя {user_id}: {e}")
+        logger.error("Ошибка при проверке задачи %s для пользователя %s: %s", task_key, user_id, e)
         return False
 
 
-@db_connection
+@db_connection(readonly=True)
 def get_all_active_user_ids(cursor: sqlite3.Cursor) -> list[int]:
     """
     Возвращает список ID всех пользователей, которые были активны
     за последние 30 дней.
     """
     # Считаем активными тех, кто проявлял активность за последние 30 дней
-    thirty_days_ago = datetime.now() - timedelta(days=30)
+    thirty_days_ago = datetime.now() - timedelta(days=ACTIVE_USER_DAYS)
     cursor.execute("SELECT user_id FROM users WHERE last_activity > ?", (thirty_days_ago,))
 
     # fetchall() вернет список кортежей, например [(123,), (456,)]
     # Преобразуем его в простой список [123, 456]
     return [row["user_id"] for row in cursor.fetchall()]
+
+
+@db_connection(readonly=True)
+def get_today_completion_masks(
+    cursor: sqlite3.Cursor, due_minute: Optional[int] = None
+) -> tuple[array, array]:
+    """
+    Одним запросом возвращает маски выполненных сегодня (по местному времени)
+    задач активных пользователей в виде двух параллельных массивов: (user_ids, masks).
+    Если задана due_minute — только тем, чей слот сводки дня приходится на эту
+    минуту суток (UTC); выборка тогда идёт по первичному ключу reminder_slots.
+    """
+    active_since = datetime.now() - timedelta(days=ACTIVE_USER_DAYS)
+    _register_local_date(cursor)
+    if due_minute is None:
+        source, where, params = "users u", "u.last_activity > ?", (active_since,)
+    else:
+        source = "reminder_slots s JOIN users u ON u.user_id = s.user_id"
+        where = "s.due_minute = ? AND s.task_key = ? AND u.last_activity > ?"
+        params = (due_minute, SUMMARY_SLOT, active_since)
+
+    if COMPACT_STORAGE:
+        cursor.execute(
+            f"""
+            SELECT u.user_id, COALESCE(d.mask, 0) FROM {source}
+            LEFT JOIN daily_completions d
+              ON d.user_id = u.user_id AND d.day = local_date(u.timezone)
+            WHERE {where}
+        """,
+            params,
+        )
+        rows = cursor.fetchall()
+    else:
+        cursor.execute(
+            f"""
+            SELECT u.user_id, t.task_key FROM {source}
+            LEFT JOIN tasks t
+              ON t.user_id = u.user_id AND t.completion_date = local_date(u.timezone)
+            WHERE {where}
+        """,
+            params,
+        )
+        # Складываем построчные выполнения в маски по пользователям
+        masks_by_user: dict[int, int] = {}
+        for user_id, task_key in cursor.fetchall():
+            bit = TASK_BITS.get(task_key, 0) if task_key is not None else 0
+            masks_by_user[user_id] = masks_by_user.get(user_id, 0) | bit
+        rows = masks_by_user.items()
+
+    user_ids = array("q")
+    masks = array("q")
+    for user_id, mask in rows:
+        user_ids.append(user_id)
+        masks.append(mask)
+    return user_ids, masks
+
+
+# --- Часовые пояса и слоты напоминаний ---
+
+# Ключ слота сводки дня: она рассылается в DAILY_SUMMARY_TIME по местному времени
+# пользователя, поэтому её UTC-минута хранится в reminder_slots рядом с напоминаниями
+SUMMARY_SLOT = "daily_summary"
+
+
+def _slot_minutes(timezone_name: Optional[str], schedule: Optional[dict] = None) -> dict[str, int]:
+    """UTC-минуты слотов пояса: напоминания по расписанию и сводка дня."""
+    minutes = reminder_minutes(timezone_name, schedule=schedule)
+    minutes[SUMMARY_SLOT] = reminder_minute(DAILY_SUMMARY_TIME, timezone_name)
+    return minutes
+
+
+def _rebuild_user_slots(cursor: sqlite3.Cursor, user_id: int, timezone_name: Optional[str]):
+    schedule = _load_user_schedule(cursor, user_id)
+    cursor.execute("DELETE FROM reminder_slots WHERE user_id = ?", (user_id,))
+    cursor.executemany(
+        "INSERT OR IGNORE INTO reminder_slots (due_minute, user_id, task_key) VALUES (?, ?, ?)",
+        [
+            (minute, user_id, task_key)
+            for task_key, minute in _slot_minutes(timezone_name, schedule).items()
+        ],
+    )
+
+
+@db_connection
+def set_user_timezone(cursor: sqlite3.Cursor, user_id: int, timezone_name: str) -> bool:
+    """
+    Сохраняет часовой пояс пользователя и перестраивает его слоты напоминаний.
+    Возвращает False, если пояс неизвестен или пользователь не зарегистрирован.
+    """
+    zone = get_zone(timezone_name)
+    if zone is None:
+        return False
+    cursor.execute("UPDATE users SET timezone = ? WHERE user_id = ?", (zone.zone, user_id))
+    if cursor.rowcount == 0:
+        return False
+    _rebuild_user_slots(cursor, user_id, zone.zone)
+    # Кэш статуса хранит дни по прежнему поясу
+    cursor.connection.commit()
+    status_cache.invalidate(user_id)
+    logger.info("Пользователь %s сменил часовой пояс на %s.", user_id, zone.zone)
+    return True
+
+
+@db_connection(readonly=True)
+def get_user_timezone(cursor: sqlite3.Cursor, user_id: int) -> Optional[str]:
+    """Возвращает часовой пояс пользователя или None, если используется пояс по умолчанию."""
+    cursor.execute("SELECT timezone FROM users WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    return row["timezone"] if row else None
+
+
+@db_connection(readonly=True)
+def get_user_today(cursor: sqlite3.Cursor, user_id: int) -> date:
+    """Сегодняшняя дата по местному времени пользователя."""
+    return _user_today(cursor, user_id)[0]
+
+
+def peek_user_today(user_id: int) -> Optional[date]:
+    """Сегодняшняя дата пользователя по поясу из кэша статуса (None — нет в кэше)."""
+    status = status_cache.get(user_id)
+    return None if status is None else status.day
+
+
+@db_connection
+def refresh_reminder_slots(cursor: sqlite3.Cursor) -> int:
+    """
+    Пересчитывает UTC-минуты напоминаний для каждого часового пояса пользователей
+    и перестраивает слоты тех поясов, у которых минуты изменились (переход на
+    летнее/зимнее время, новое расписание или смена пояса по умолчанию).
+    Возвращает количество перестроенных поясов.
+    """
+    cursor.execute("SELECT zone, minutes FROM reminder_zones")
+    applied = {row["zone"]: row["minutes"] for row in cursor.fetchall()}
+    cursor.execute("SELECT DISTINCT timezone FROM users")
+    zones = [row["timezone"] for row in cursor.fetchall()]
+
+    rebuilt = 0
+    for timezone_name in zones:
+        minutes = _slot_minutes(timezone_name)
+        signature = ",".join(f"{task_key}={minute}" for task_key, minute in minutes.items())
+        zone_key = timezone_name or ""
+        if applied.get(zone_key) == signature:
+            continue
+
+        cursor.execute(
+            """
+            DELETE FROM reminder_slots
+            WHERE user_id IN (SELECT user_id FROM users WHERE timezone IS ?)
+        """,
+            (timezone_name,),
+        )
+        # Стандартные задачи и сводка — всем пользователям пояса, кроме изменивших задачу
+        for task_key, minute in minutes.items():
+            cursor.execute(
+                """
+                INSERT OR IGNORE INTO reminder_slots (due_minute, user_id, task_key)
+                SELECT ?, u.user_id, ? FROM users u
+                WHERE u.timezone IS ? AND NOT EXISTS (
+                    SELECT 1 FROM user_tasks o WHERE o.user_id = u.user_id AND o.task_key = ?
+                )
+            """,
+                (minute, task_key, timezone_name, task_key),
+            )
+        # Перенесённые и свои задачи — по времени из переопределений
+        cursor.execute(
+            """
+            SELECT o.user_id, o.task_key, o.time FROM user_tasks o
+            JOIN users u ON u.user_id = o.user_id
+            WHERE u.timezone IS ? AND o.removed = 0 AND o.time IS NOT NULL
+        """,
+            (timezone_name,),
+        )
+        overrides = cursor.fetchall()
+        override_minutes = {
+            time_text: reminder_minute(parse_task_time(time_text), timezone_name)
+            for time_text in {row["time"] for row in overrides}
+        }
+        cursor.executemany(
+            "INSERT OR IGNORE INTO reminder_slots (due_minute, user_id, task_key) VALUES (?, ?, ?)",
+            [
+                (override_minutes[time_text], user_id, task_key)
+                for user_id, task_key, time_text in overrides
+            ],
+        )
+        cursor.execute(
+            "INSERT OR REPLACE INTO reminder_zones (zone, minutes) VALUES (?, ?)",
+            (zone_key, signature),
+        )
+        rebuilt += 1
+
+    if rebuilt:
+        logger.info(f"Слоты напоминаний перестроены для {rebuilt} часовых поясов.")
+    return rebuilt
+
+
+@db_connection(readonly=True)
+def get_due_reminders(
+    cursor: sqlite3.Cursor, due_minute: int
+) -> list[tuple[int, str, Optional[str], date]]:
+    """
+    Возвращает четвёрки (user_id, task_key, название своей задачи или None,
+    сегодняшняя дата пользователя) для напоминаний, назначенных на минуту суток
+    due_minute (UTC), — только активным пользователям, ещё не выполнившим задачу
+    сегодня по своему местному времени. Выборка идёт по первичному ключу
+    reminder_slots.
+    """
+    active_since = datetime.now() - timedelta(days=ACTIVE_USER_DAYS)
+    day_of = _register_local_date(cursor)
+    if COMPACT_STORAGE:
+        cursor.execute(
+            """
+            SELECT s.user_id, s.task_key, o.title, u.timezone, COALESCE(d.mask, 0)
+            FROM reminder_slots s
+            JOIN users u ON u.user_id = s.user_id
+            LEFT JOIN user_tasks o ON o.user_id = s.user_id AND o.task_key = s.task_key
+            LEFT JOIN daily_completions d
+              ON d.user_id = s.user_id AND d.day = local_date(u.timezone)
+            WHERE s.due_minute = ? AND s.task_key != ? AND u.last_activity > ?
+        """,
+            (due_minute, SUMMARY_SLOT, active_since),
+        )
+        return [
+            (user_id, task_key, title, day_of(timezone_name))
+            for user_id, task_key, title, timezone_name, mask in cursor.fetchall()
+            if not mask & TASK_BITS.get(task_key, 0)
+        ]
+
+    cursor.execute(
+        """
+        SELECT s.user_id, s.task_key, o.title, u.timezone FROM reminder_slots s
+        JOIN users u ON u.user_id = s.user_id
+        LEFT JOIN user_tasks o ON o.user_id = s.user_id AND o.task_key = s.task_key
+        WHERE s.due_minute = ? AND s.task_key != ? AND u.last_activity > ?
+          AND NOT EXISTS (
+              SELECT 1 FROM tasks t
+              WHERE t.user_id = s.user_id AND t.task_key = s.task_key
+                AND t.completion_date = local_date(u.timezone)
+          )
+    """,
+        (due_minute, SUMMARY_SLOT, active_since),
+    )
+    return [
+        (row["user_id"], row["task_key"], row["title"], day_of(row["timezone"]))
+        for row in cursor.fetchall()
+    ]
+
+
+# --- Пользовательские расписания ---
+
+
+def _after_schedule_change(cursor: sqlite3.Cursor, user_id: int):
+    """Перестраивает слоты напоминаний пользователя после изменения расписания."""
+    schedule_cache.invalidate(user_id)
+    cursor.execute("SELECT timezone FROM users WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    if row is not None:
+        _rebuild_user_slots(cursor, user_id, row["timezone"])
+    # Кэш сбрасываем и после фиксации, чтобы в него не попала загрузка из середины транзакции
+    cursor.connection.commit()
+    schedule_cache.invalidate(user_id)
+
+
+@db_connection(readonly=True)
+def get_user_schedule(cursor: sqlite3.Cursor, user_id: int) -> Schedule:
+    """Действующее расписание пользователя (нельзя изменять)."""
+    return _user_schedule(cursor, user_id)
+
+
+@db_connection(readonly=True)
+def get_schedule_override_user_ids(cursor: sqlite3.Cursor) -> set[int]:
+    """ID пользователей, у которых расписание отличается от общего SCHEDULE."""
+    cursor.execute("SELECT DISTINCT user_id FROM user_tasks")
+    return {row["user_id"] for row in cursor.fetchall()}
+
+
+@db_connection
+def set_task_time(cursor: sqlite3.Cursor, user_id: int, task_key: str, task_time: time) -> bool:
+    """Переносит задачу расписания пользователя на другое время."""
+    if task_key not in _user_schedule(cursor, user_id):
+        return False
+    cursor.execute(
+        """
+        INSERT INTO user_tasks (user_id, task_key, time) VALUES (?, ?, ?)
+        ON CONFLICT (user_id, task_key) DO UPDATE SET time = excluded.time
+    """,
+        (user_id, task_key, task_time.strftime("%H:%M")),
+    )
+    _after_schedule_change(cursor, user_id)
+    logger.info(
+        "Пользователь %s перенёс задачу %s на %02d:%02d.",
+        user_id,
+        task_key,
+        task_time.hour,
+        task_time.minute,
+    )
+    return True
+
+
+@db_connection
+def add_custom_task(
+    cursor: sqlite3.Cursor, user_id: int, task_time: time, title: str
+) -> Optional[str]:
+    """
+    Добавляет пользователю свою задачу. Возвращает её ключ (custom_<n>) или None,
+    если все MAX_CUSTOM_TASKS ключей уже заняты.
+    """
+    cursor.execute("SELECT task_key FROM user_tasks WHERE user_id = ?", (user_id,))
+    used = {row["task_key"] for row in cursor.fetchall()}
+    task_key = next((key for key in CUSTOM_TASK_KEYS if key not in used), None)
+    if task_key is None:
+        return None
+    cursor.execute(
+        "INSERT INTO user_tasks (user_id, task_key, time, title) VALUES (?, ?, ?, ?)",
+        (user_id, task_key, task_time.strftime("%H:%M"), title),
+    )
+    _after_schedule_change(cursor, user_id)
+    logger.info(
+        "Пользователь %s добавил задачу %s на %02d:%02d.",
+        user_id,
+        task_key,
+        task_time.hour,
+        task_time.minute,
+    )
+    return task_key
+
+
+@db_connection
+def remove_task(cursor: sqlite3.Cursor, user_id: int, task_key: str) -> bool:
+    """Убирает задачу из расписания пользователя (свою — удаляет совсем)."""
+    if task_key not in _user_schedule(cursor, user_id):
+        return False
+    if task_key in SCHEDULE:
+        cursor.execute(
+            """
+            INSERT INTO user_tasks (user_id, task_key, removed) VALUES (?, ?, 1)
+            ON CONFLICT (user_id, task_key) DO UPDATE SET removed = 1
+        """,
+            (user_id, task_key),
+        )
+    else:
+        cursor.execute(
+            "DELETE FROM user_tasks WHERE user_id = ? AND task_key = ?", (user_id, task_key)
+        )
+    _after_schedule_change(cursor, user_id)
+    logger.info("Пользователь %s убрал задачу %s из расписания.", user_id, task_key)
+    return True
+
+
+@db_connection
+def reset_user_schedule(cursor: sqlite3.Cursor, user_id: int):
+    """Удаляет все переопределения — пользователь возвращается к общему SCHEDULE."""
+    cursor.execute("DELETE FROM user_tasks WHERE user_id = ?", (user_id,))
+    _after_schedule_change(cursor, user_id)
+
+
+# --- Аренда лидера и состояние планировщика ---
+
+
+@db_connection
+def try_acquire_lease(cursor: sqlite3.Cursor, name: str, holder: str, ttl: float) -> bool:
+    """
+    Берёт или продлевает аренду name для holder на ttl секунд. Возвращает True,
+    если аренда принадлежит holder; чужую аренду можно забрать только после истечения.
+    """
+    now = datetime.now().timestamp()
+    cursor.execute(
+        """
+        INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+        WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+    """,
+        (name, holder, now + ttl, now),
+    )
+    return cursor.rowcount > 0
+
+
+@db_connection
+def release_lease(cursor: sqlite3.Cursor, name: str, holder: str):
+    """Отдаёт аренду досрочно (при остановке экземпляра)."""
+    cursor.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+
+
+@db_connection(readonly=True)
+def get_scheduler_state(cursor: sqlite3.Cursor, key: str) -> Optional[str]:
+    cursor.execute("SELECT value FROM scheduler_state WHERE key = ?", (key,))
+    row = cursor.fetchone()
+    return row["value"] if row else None
+
+
+@db_connection
+def set_scheduler_state(cursor: sqlite3.Cursor, key: str, value: str):
+    cursor.execute(
+        "INSERT OR REPLACE INTO scheduler_state (key, value) VALUES (?, ?)", (key, value)
+    )
@@ -0,0 +1,138 @@
+import logging
+import queue
+import sqlite3
+import threading
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Optional
+
+from config import (
+    DB_BUSY_TIMEOUT,
+    DB_CACHE_SIZE_KB,
+    DB_MMAP_SIZE,
+    DB_READER_POOL_SIZE,
+    DB_STATEMENT_CACHE_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+# PRAGMA, которые применяются к каждому соединению
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}",
+    f"PRAGMA mmap_size = {DB_MMAP_SIZE}",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+class ConnectionPool:
+    """
+    Долгоживущие соединения с SQLite: одно соединение-писатель (доступ под
+    блокировкой) и небольшой пул соединений для чтения. База работает в режиме
+    WAL, поэтому читатели не блокируют писателя и наоборот. Подготовленные
+    выражения кэшируются самим модулем sqlite3 (cached_statements).
+    """
+
+    def __init__(self, path: str, reader_pool_size: int = DB_READER_POOL_SIZE):
+        self.path = path
+        self.reader_pool_size = max(1, reader_pool_size)
+        self._writer_lock = threading.Lock()
+        self._readers: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._readers_created = 0
+        self._readers_lock = threading.Lock()
+        self._all: list[sqlite3.Connection] = []
+
+        self._writer = self._connect()
+        # WAL сохраняется в файле БД, достаточно включить его один раз
+        mode = self._writer.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        if mode.lower() != "wal":
+            logger.warning(f"Не удалось включить WAL для {path}, режим журнала: {mode}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE_SIZE,
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        self._all.append(conn)
+        return conn
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """Эксклюзивный доступ к соединению-писателю."""
+        with self._writer_lock:
+            yield self._writer
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Берёт соединение для чтения из пула (создаёт новое, если пул не заполнен)."""
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._readers_lock:
+                can_create = self._readers_created < self.reader_pool_size
+                if can_create:
+                    self._readers_created += 1
+            conn = self._connect() if can_create else self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def close(self):
+        """Закрывает все соединения пула."""
+        with self._writer_lock:
+            for conn in self._all:
+                try:
+                    conn.close()
+                except sqlite3.Error as e:
+                    logger.warning(f"Ошибка при закрытии соединения с {self.path}: {e}")
+            self._all.clear()
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+# Функции, вызываемые при закрытии пула (сброс кэшей, привязанных к файлу БД)
+_close_callbacks: list[Callable[[], None]] = []
+
+
+def on_pool_close(callback: Callable[[], None]):
+    """Регистрирует функцию, которая будет вызвана при закрытии или смене пула."""
+    _close_callbacks.append(callback)
+
+
+def _close_locked(pool: ConnectionPool):
+    pool.close()
+    for callback in _close_callbacks:
+        callback()
+
+
+def get_pool(path: str) -> ConnectionPool:
+    """
+    Возвращает пул соединений для указанного файла БД. Если путь к БД изменился
+    (например, в тестах), старый пул закрывается и создаётся новый.
+    """
+    global _pool
+    pool = _pool
+    if pool is not None and pool.path == path:
+        return pool
+
+    with _pool_lock:
+        if _pool is None or _pool.path != path:
+            if _pool is not None:
+                _close_locked(_pool)
+            _pool = ConnectionPool(path)
+        return _pool
+
+
+def close_pool():
+    """Закрывает текущий пул соединений (при остановке бота)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _close_locked(_pool)
+            _pool = None
@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Optional, Union
+
+from config import CALLBACK_DEDUP_SECONDS, CALLBACK_DEDUP_SIZE
+from metrics import Counter
+
+CALLBACK_DEDUP = Counter(
+    "bot_callback_dedup_total",
+    "Проверки повторных нажатий inline-кнопок (hit — повтор отброшен)",
+    ["result"],
+)
+
+
+class DedupWindow:
+    """
+    Ключи, увиденные за последние ttl секунд. Все записи живут одинаковое время,
+    поэтому в OrderedDict они упорядочены по сроку истечения и устаревшие
+    удаляются с начала. Размер ограничен maxsize (вытесняются самые старые).
+    Используется только из event loop.
+    """
+
+    def __init__(
+        self,
+        ttl: float = CALLBACK_DEDUP_SECONDS,
+        maxsize: int = CALLBACK_DEDUP_SIZE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._expires: OrderedDict[Hashable, float] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def _purge(self, now: float):
+        while self._expires and next(iter(self._expires.values())) <= now:
+            self._expires.popitem(last=False)
+
+    def seen(self, key: Hashable) -> bool:
+        """True — ключ уже встречался в окне (повтор); иначе ключ запоминается."""
+        now = self._clock()
+        self._purge(now)
+        if key in self._expires:
+            CALLBACK_DEDUP.inc(result="hit")
+            return True
+        CALLBACK_DEDUP.inc(result="miss")
+        self._expires[key] = now + self.ttl
+        if len(self._expires) > self.maxsize:
+            self._expires.popitem(last=False)
+        return False
+
+    def forget(self, key: Hashable):
+        """Убирает ключ, чтобы повторное нажатие снова обработалось (например, после ошибки)."""
+        self._expires.pop(key, None)
+
+
+# Повторные нажатия одной и той же кнопки одного сообщения (двойной тап)
+callback_dedup = DedupWindow()
+
+
+def callback_key(user_id: int, message_id: Optional[Union[int, str]], data: str) -> tuple:
+    """
+    Ключ нажатия. У каждого тапа свой id callback-запроса, поэтому повтор
+    распознаётся по сообщению и данным кнопки.
+    """
+    return user_id, message_id, data
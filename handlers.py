@@ -1,22 +1,45 @@
 import logging
 import random
-from datetime import date, datetime, timedelta
+from datetime import datetime, timedelta
+from typing import Optional
 
-from telegram import KeyboardButton, ReplyKeyboardMarkup, Update
+from telegram import ReplyKeyboardMarkup, Update
 from telegram.ext import ContextTypes
 
-from config import MESSAGES, SCHEDULE
+from activity import touch_user_activity
 
-# Предполагается, что эти файлы существуют и настроены корректно
-from database import (
+# Асинхронные обёртки над database.py: запросы выполняются вне event loop
+from async_db import (
+    add_custom_task,
     get_completion_rate,
     get_today_tasks_status,
+    get_user_schedule,
     get_user_stats,
-    is_task_completed_today,
+    get_user_timezone,
+    get_user_today,
     mark_task_completed,
     register_user,
-    update_user_activity,
+    remove_task,
+    reset_user_schedule,
+    set_task_time,
+    set_user_timezone,
 )
+from config import MAX_CUSTOM_TASKS, MESSAGES
+from dedup import callback_dedup, callback_key
+from profiling import profiled_handler
+from rendering import (
+    BUTTON_HELP,
+    BUTTON_REPORT,
+    BUTTON_SCHEDULE,
+    BUTTON_STATUS,
+    MAIN_KEYBOARD,
+    display_name,
+    render_schedule_lines,
+    render_status_lines,
+)
+from routing import COMPLETE_CODE, LEGACY_COMPLETE_CODE, Router, parse_complete
+from schedules import ordered_task_keys, parse_task_time
+from timezones import effective_timezone, get_zone
 
 logger = logging.getLogger(__name__)
 
@@ -24,69 +47,63 @@ logger = logging.getLogger(__name__)
 
 
 def get_main_keyboard() -> ReplyKeyboardMarkup:
-    """Возвращает основную клавиатуру с кнопками."""
-    keyboard = [
-        [KeyboardButton("📊 Статус"), KeyboardButton("📈 Отчёт")],
-        [KeyboardButton("🗓 Расписание"), KeyboardButton("ℹ️ Помощь")],
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
+    """Возвращает основную клавиатуру с кнопками (одна на всех, см. rendering.py)."""
+    return MAIN_KEYBOARD
 
 
 # --- Обработчики команд и кнопок ---
 
 
+@profiled_handler
 async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start и кнопки 'Помощь'."""
     user = update.effective_user
     try:
         # Регистрация или обновление данных пользователя в БД
-        register_user(user_id=user.id, username=user.username, first_name=user.first_name)
-        logger.info(f"Пользователь {user.id} ({user.username}) запустил/перезапустил бота.")
+        await register_user(user_id=user.id, username=user.username, first_name=user.first_name)
+        logger.info("Пользователь %s (%s) запустил/перезапустил бота.", user.id, user.username)
 
         await update.message.reply_text(
             MESSAGES.get("start", "Добро пожаловать!"),
             reply_markup=get_main_keyboard(),
         )
     except Exception as e:
-        logger.error(f"Ошибка в start_handler для user_id {user.id}: {e}")
+        logger.error("Ошибка в start_handler для user_id %s: %s", user.id, e)
         await update.message.reply_text("Произошла ошибка при запуске. Попробуйте позже.")
 
 
+@profiled_handler
 async def status_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает статус выполнения задач на сегодня."""
     user = update.effective_user
     try:
-        update_user_activity(user.id)
-        tasks_status = get_today_tasks_status(user.id)
+        touch_user_activity(user.id)
+        tasks_status = await get_today_tasks_status(user.id)
+        schedule = await get_user_schedule(user.id)
 
         if not tasks_status:
             await update.message.reply_text(MESSAGES.get("no_tasks_today", "На сегодня задач нет."))
             return
 
         status_lines = [MESSAGES.get("status_header", "Статус на сегодня:")]
-        for task_key, is_completed in tasks_status.items():
-            task_config = SCHEDULE.get(task_key)
-            if task_config:
-                task_name = task_config.get("button_text", task_key).replace(" ✅", "")
-                task_time = task_config.get("time").strftime("%H:%M")
-                status_icon = "✅" if is_completed else "⏳"
-                status_lines.append(f"{status_icon} {task_time} - {task_name}")
-
-        completion_rate = get_completion_rate(user.id, days=7)
+        status_lines += render_status_lines(tasks_status, schedule)
+
+        completion_rate = await get_completion_rate(user.id, days=7)
         status_lines.append(f"\n📈 Выполнение за неделю: {completion_rate:.1f}%")
 
         await update.message.reply_text("\n".join(status_lines))
     except Exception as e:
-        logger.error(f"Ошибка в status_handler для user_id {user.id}: {e}")
+        logger.error("Ошибка в status_handler для user_id %s: %s", user.id, e)
         await update.message.reply_text("Не удалось получить статус. Попробуйте снова.")
 
 
+@profiled_handler
 async def report_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает отчёт о выполненных задачах за последнюю неделю."""
     user = update.effective_user
     try:
-        update_user_activity(user.id)
-        stats = get_user_stats(user.id, days=7)
+        touch_user_activity(user.id)
+        stats = await get_user_stats(user.id, days=7)
 
         if not stats:
             await update.message.reply_text("📊 За последние 7 дней данных для отчёта нет.")
@@ -94,103 +111,253 @@ async def report_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         report_lines = [MESSAGES.get("report_header", "Отчёт за 7 дней:")]
         sorted_dates = sorted(stats.keys(), reverse=True)
+        # Дни в статистике — по местному времени пользователя, подписи тоже
+        today = await get_user_today(user.id)
 
         for date_str in sorted_dates:
             tasks = stats[date_str]
             date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
 
             day_label = ""
-            if date_obj == date.today():
+            if date_obj == today:
                 day_label = " (сегодня)"
-            elif date_obj == date.today() - timedelta(days=1):
+            elif date_obj == today - timedelta(days=1):
                 day_label = " (вчера)"
 
             report_lines.append(f"\n📅 {date_obj.strftime('%d.%m.%Y')}{day_label}:")
             for task in tasks:
-                task_name = task.get("task_name", "Неизвестная задача").replace(" ✅", "")
-                report_lines.append(f"  ✅ {task_name}")
+                report_lines.append(f"  ✅ {display_name(task)}")
 
-        completion_rate = get_completion_rate(user.id, days=7)
+        completion_rate = await get_completion_rate(user.id, days=7)
         report_lines.append(f"\n\n📊 Общая эффективность: {completion_rate:.1f}%")
 
         await update.message.reply_text("\n".join(report_lines))
     except Exception as e:
-        logger.error(f"Ошибка в report_handler для user_id {user.id}: {e}")
+        logger.error("Ошибка в report_handler для user_id %s: %s", user.id, e)
         await update.message.reply_text("Не удалось создать отчёт.")
 
 
+@profiled_handler
 async def schedule_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает полное расписание задач."""
     user = update.effective_user
     try:
-        update_user_activity(user.id)
+        touch_user_activity(user.id)
         schedule_lines = [MESSAGES.get("schedule_header", "Ваше расписание:")]
 
-        sorted_tasks = sorted(SCHEDULE.items(), key=lambda item: item[1].get("time"))
+        schedule = await get_user_schedule(user.id)
+        tasks_status = await get_today_tasks_status(user.id)
 
-        for task_key, task_config in sorted_tasks:
-            task_time = task_config.get("time").strftime("%H:%M")
-            task_name = task_config.get("button_text", task_key).replace(" ✅", "")
-            is_completed = is_task_completed_today(user.id, task_key)
-            status_icon = "✅" if is_completed else "⏰"
-            schedule_lines.append(f"{status_icon} {task_time} - {task_name}")
+        # Номера задач используются командами /settime и /removetask
+        schedule_lines += render_schedule_lines(tasks_status, schedule)
 
+        schedule_lines.append(f"\n{MESSAGES['schedule_usage']}")
         await update.message.reply_text("\n".join(schedule_lines))
     except Exception as e:
-        logger.error(f"Ошибка в schedule_handler для user_id {user.id}: {e}")
+        logger.error("Ошибка в schedule_handler для user_id %s: %s", user.id, e)
         await update.message.reply_text("Не удалось показать расписание.")
 
 
+async def _task_by_number(user_id: int, number_text: str) -> tuple[Optional[str], Optional[dict]]:
+    """Находит задачу по её номеру в /schedule."""
+    schedule = await get_user_schedule(user_id)
+    keys = ordered_task_keys(schedule)
+    if not number_text.isdigit() or not 1 <= int(number_text) <= len(keys):
+        return None, None
+    task_key = keys[int(number_text) - 1]
+    return task_key, schedule[task_key]
+
+
+@profiled_handler
+async def settime_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Переносит задачу расписания на другое время (/settime 2 07:30)."""
+    user = update.effective_user
+    try:
+        touch_user_activity(user.id)
+        task_time = parse_task_time(context.args[1]) if len(context.args) == 2 else None
+        if task_time is None:
+            await update.message.reply_text(MESSAGES["schedule_usage"])
+            return
+
+        task_key, task_config = await _task_by_number(user.id, context.args[0])
+        if task_key is None or not await set_task_time(user.id, task_key, task_time):
+            await update.message.reply_text(MESSAGES["schedule_task_not_found"])
+            return
+
+        task_name = display_name(task_config["button_text"])
+        await update.message.reply_text(
+            MESSAGES["schedule_time_set"].format(task=task_name, time=task_time.strftime("%H:%M"))
+        )
+    except Exception as e:
+        logger.error("Ошибка в settime_handler для user_id %s: %s", user.id, e)
+        await update.message.reply_text("Не удалось изменить расписание. Попробуйте позже.")
+
+
+@profiled_handler
+async def addtask_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Добавляет свою задачу в расписание (/addtask 07:00 Медитация)."""
+    user = update.effective_user
+    try:
+        touch_user_activity(user.id)
+        task_time = parse_task_time(context.args[0]) if len(context.args) >= 2 else None
+        title = " ".join(context.args[1:]).strip()[:64]
+        if task_time is None or not title:
+            await update.message.reply_text(MESSAGES["schedule_usage"])
+            return
+
+        if await add_custom_task(user.id, task_time, title) is None:
+            await update.message.reply_text(
+                MESSAGES["schedule_limit_reached"].format(limit=MAX_CUSTOM_TASKS)
+            )
+            return
+
+        await update.message.reply_text(
+            MESSAGES["schedule_task_added"].format(task=title, time=task_time.strftime("%H:%M"))
+        )
+    except Exception as e:
+        logger.error("Ошибка в addtask_handler для user_id %s: %s", user.id, e)
+        await update.message.reply_text("Не удалось изменить расписание. Попробуйте позже.")
+
+
+@profiled_handler
+async def removetask_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Убирает задачу из расписания (/removetask 2)."""
+    user = update.effective_user
+    try:
+        touch_user_activity(user.id)
+        if len(context.args) != 1:
+            await update.message.reply_text(MESSAGES["schedule_usage"])
+            return
+
+        task_key, task_config = await _task_by_number(user.id, context.args[0])
+        if task_key is None or not await remove_task(user.id, task_key):
+            await update.message.reply_text(MESSAGES["schedule_task_not_found"])
+            return
+
+        task_name = display_name(task_config["button_text"])
+        await update.message.reply_text(MESSAGES["schedule_task_removed"].format(task=task_name))
+    except Exception as e:
+        logger.error("Ошибка в removetask_handler для user_id %s: %s", user.id, e)
+        await update.message.reply_text("Не удалось изменить расписание. Попробуйте позже.")
+
+
+@profiled_handler
+async def resetschedule_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Возвращает стандартное расписание (/resetschedule)."""
+    user = update.effective_user
+    try:
+        touch_user_activity(user.id)
+        await reset_user_schedule(user.id)
+        await update.message.reply_text(MESSAGES["schedule_reset"])
+    except Exception as e:
+        logger.error("Ошибка в resetschedule_handler для user_id %s: %s", user.id, e)
+        await update.message.reply_text("Не удалось изменить расписание. Попробуйте позже.")
+
+
+@profiled_handler
+async def timezone_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает или меняет часовой пояс пользователя (/timezone Europe/Moscow)."""
+    user = update.effective_user
+    try:
+        touch_user_activity(user.id)
+        if not context.args:
+            timezone_name = effective_timezone(await get_user_timezone(user.id))
+            await update.message.reply_text(
+                MESSAGES["timezone_current"].format(timezone=timezone_name)
+            )
+            return
+
+        zone = get_zone(context.args[0])
+        if zone is None:
+            await update.message.reply_text(MESSAGES["timezone_invalid"])
+            return
+
+        if not await set_user_timezone(user.id, zone.zone):
+            # Пользователь ещё не зарегистрирован — регистрируем и повторяем
+            await register_user(user_id=user.id, username=user.username, first_name=user.first_name)
+            await set_user_timezone(user.id, zone.zone)
+        await update.message.reply_text(MESSAGES["timezone_set"].format(timezone=zone.zone))
+    except Exception as e:
+        logger.error("Ошибка в timezone_handler для user_id %s: %s", user.id, e)
+        await update.message.reply_text("Не удалось изменить часовой пояс. Попробуйте позже.")
+
+
+async def _complete_task(update: Update, context: ContextTypes.DEFAULT_TYPE, task_key: str):
+    """Отмечает задачу выполненной по кнопке из напоминания."""
+    query = update.callback_query
+    user = query.from_user
+    task_config = (await get_user_schedule(user.id)).get(task_key)
+
+    if not task_config:
+        await query.edit_message_text("Ошибка: задача не найдена.")
+        return
+
+    if await mark_task_completed(user.id, task_key):
+        msg = f"{task_config.get('message', '')}\n\n"
+        msg += MESSAGES.get("task_completed", "Задача выполнена!")
+        await query.edit_message_text(msg)
+        motivational_message = random.choice(MESSAGES.get("motivational", ["Отлично!"]))
+        await context.bot.send_message(chat_id=user.id, text=motivational_message)
+    else:
+        msg = f"{task_config.get('message', '')}\n\n"
+        msg += MESSAGES.get("task_already_completed", "Задача уже была выполнена.")
+        await query.edit_message_text(msg)
+
+
+async def complete_callback(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, code: str, args: list[str]
+):
+    """Кнопка выполнения задачи (формат callback_data — в routing.py)."""
+    query = update.callback_query
+    target = parse_complete(code, args, await get_user_today(query.from_user.id))
+    if target is None:
+        await query.edit_message_text("Ошибка: задача не найдена.")
+        return
+    if target.stale:
+        # Кнопка из напоминания за другой (местный) день: задачу не отмечаем
+        await query.edit_message_text(MESSAGES["task_button_stale"])
+        return
+    await _complete_task(update, context, target.task_key)
+
+
+@profiled_handler
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик нажатий на inline-кнопки (например, 'Выполнить')."""
     query = update.callback_query
     await query.answer()  # Обязательно подтвердить получение callback'а
 
     user = query.from_user
-    task_key = query.data.replace("complete_", "")
+    # Повторное нажатие той же кнопки (двойной тап) отбрасываем до БД и правки сообщения
+    message_id = query.message.message_id if query.message else query.inline_message_id
+    key = callback_key(user.id, message_id, query.data)
+    if callback_dedup.seen(key):
+        return
 
     try:
-        update_user_activity(user.id)
-        task_config = SCHEDULE.get(task_key)
-
-        if not task_config:
+        touch_user_activity(user.id)
+        handler, code, args = router.callback_handler(query.data)
+        if handler is None:
             await query.edit_message_text("Ошибка: задача не найдена.")
             return
-
-        task_name = task_config.get("button_text", "Задача")
-        if mark_task_completed(user.id, task_key, task_name):
-            msg = f"{task_config.get('message', '')}\n\n"
-            msg += MESSAGES.get("task_completed", "Задача выполнена!")
-            await query.edit_message_text(msg)
-            motivational_message = random.choice(MESSAGES.get("motivational", ["Отлично!"]))
-            await context.bot.send_message(chat_id=user.id, text=motivational_message)
-        else:
-            msg = f"{task_config.get('message', '')}\n\n"
-            msg += MESSAGES.get("task_already_completed", "Задача уже была выполнена.")
-            await query.edit_message_text(msg)
+        await handler(update, context, code, args)
     except Exception as e:
-        logger.error(f"Ошибка в button_handler для user_id {user.id} и task_key {task_key}: {e}")
+        # После ошибки пользователь должен иметь возможность нажать ещё раз
+        callback_dedup.forget(key)
+        logger.error("Ошибка в button_handler для user_id %s и data %s: %s", user.id, query.data, e)
         await query.edit_message_text("Произошла ошибка при обработке нажатия.")
 
 
+@profiled_handler
 async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик всех текстовых сообщений, включая нажатия на Reply-кнопки."""
     user = update.effective_user
-    text = update.message.text.lower().strip()
-
-    # Убираем эмодзи для более простого сравнения
-    clean_text = text.replace("📊 ", "").replace("📈 ", "").replace("🗓 ", "").replace("ℹ️ ", "")
+    text = update.message.text
 
     try:
         # Маршрутизация на основе текста кнопки
-        if clean_text == "статус":
-            await status_handler(update, context)
-        elif clean_text == "отчёт":
-            await report_handler(update, context)
-        elif clean_text == "расписание":
-            await schedule_handler(update, context)
-        elif clean_text == "помощь":
-            await start_handler(update, context)
+        handler = router.text_handler(text)
+        if handler is not None:
+            await handler(update, context)
         else:
             # Если текст не похож на кнопку, отправляем стандартный ответ
             await update.message.reply_text(
@@ -198,5 +365,15 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 reply_markup=get_main_keyboard(),
             )
     except Exception as e:
-        logger.error(f"Ошибка в message_handler для user_id {user.id} с текстом '{text}': {e}")
+        logger.error("Ошибка в message_handler для user_id %s с текстом '%s': %s", user.id, text, e)
         await update.message.reply_text("Произошла ошибка при обработке вашего сообщения.")
+
+
+# --- Маршруты ---
+
+router = Router()
+router.add_text(status_handler, BUTTON_STATUS)
+router.add_text(report_handler, BUTTON_REPORT)
+router.add_text(schedule_handler, BUTTON_SCHEDULE)
+router.add_text(start_handler, BUTTON_HELP)
+router.add_callback(complete_callback, COMPLETE_CODE, LEGACY_COMPLETE_CODE)
@@ -0,0 +1,158 @@
+import importlib.util
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+from telegram.error import TimedOut
+from telegram.request import HTTPXRequest, RequestData
+
+from config import (
+    BOT_CONNECT_TIMEOUT,
+    BOT_CONNECTION_POOL_SIZE,
+    BOT_HTTP_VERSION,
+    BOT_POOL_TIMEOUT,
+    BOT_READ_TIMEOUT,
+    BROADCAST_CONCURRENCY,
+)
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Пул для getUpdates: long polling держит одно соединение
+GET_UPDATES_POOL_SIZE = 2
+
+HTTP_REQUESTS = Counter("bot_http_requests_total", "Запросы к Bot API", ["pool"])
+HTTP_POOL_TIMEOUTS = Counter(
+    "bot_http_pool_timeouts_total", "Запросы, не дождавшиеся свободного соединения", ["pool"]
+)
+HTTP_IN_FLIGHT = Gauge(
+    "bot_http_in_flight", "Запросы к Bot API в работе, включая ждущие соединения", ["pool"]
+)
+HTTP_POOL_SIZE = Gauge("bot_http_pool_size", "Размер пула соединений", ["pool"])
+
+
+@dataclass(frozen=True)
+class PoolStats:
+    """Снимок загрузки пула соединений к Bot API."""
+
+    name: str
+    size: int
+    in_flight: int
+    peak: int
+    requests: int
+    pool_timeouts: int
+    avg_latency: float
+
+    @property
+    def load(self) -> float:
+        """Запросы в работе на одно соединение; больше 1 — часть запросов ждёт соединения."""
+        return self.in_flight / self.size if self.size else 0.0
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """
+    HTTPXRequest со счётчиками: сколько запросов сейчас в работе, их пик и сколько
+    запросов не дождались свободного соединения. Запрос считается с момента
+    вызова, ещё до получения соединения, поэтому счётчик может превышать размер пула.
+    """
+
+    def __init__(self, name: str, connection_pool_size: int, **kwargs):
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+        self.name = name
+        self.size = connection_pool_size
+        self.in_flight = 0
+        self.peak = 0
+        self.requests = 0
+        self.pool_timeouts = 0
+        self._latency_total = 0.0
+        HTTP_POOL_SIZE.set(connection_pool_size, pool=name)
+
+    def stats(self) -> PoolStats:
+        return PoolStats(
+            name=self.name,
+            size=self.size,
+            in_flight=self.in_flight,
+            peak=self.peak,
+            requests=self.requests,
+            pool_timeouts=self.pool_timeouts,
+            avg_latency=self._latency_total / self.requests if self.requests else 0.0,
+        )
+
+    async def do_request(
+        self, url: str, method: str, request_data: Optional[RequestData] = None, **kwargs
+    ) -> tuple[int, bytes]:
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        HTTP_IN_FLIGHT.set(self.in_flight, pool=self.name)
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, request_data, **kwargs)
+        except TimedOut as e:
+            if isinstance(e.__cause__, httpx.PoolTimeout):
+                self.pool_timeouts += 1
+                HTTP_POOL_TIMEOUTS.inc(pool=self.name)
+            raise
+        finally:
+            self.in_flight -= 1
+            self.requests += 1
+            HTTP_IN_FLIGHT.set(self.in_flight, pool=self.name)
+            HTTP_REQUESTS.inc(pool=self.name)
+            self._latency_total += time.perf_counter() - started
+
+    async def shutdown(self):
+        await super().shutdown()
+        stats = self.stats()
+        if stats.requests:
+            logger.info(
+                f"HTTP-пул {stats.name} закрыт: запросов {stats.requests}, "
+                f"пик одновременных запросов {stats.peak} при пуле {stats.size}, "
+                f"таймаутов пула {stats.pool_timeouts}, "
+                f"средняя задержка {stats.avg_latency * 1000:.0f} мс."
+            )
+
+
+# Все созданные пулы процесса — для метрик
+_requests: list[InstrumentedRequest] = []
+
+
+def http_version() -> str:
+    """HTTP/2 требует пакет h2 (httpx[http2]); без него остаёмся на HTTP/1.1."""
+    if BOT_HTTP_VERSION.startswith("2") and importlib.util.find_spec("h2") is None:
+        logger.warning("BOT_HTTP_VERSION=2, но пакет h2 не установлен; использую HTTP/1.1.")
+        return "1.1"
+    return BOT_HTTP_VERSION
+
+
+def build_request(name: str, pool_size: int = BOT_CONNECTION_POOL_SIZE) -> InstrumentedRequest:
+    """Пул соединений к Bot API с таймаутами и версией HTTP из конфигурации."""
+    request = InstrumentedRequest(
+        name,
+        connection_pool_size=pool_size,
+        connect_timeout=BOT_CONNECT_TIMEOUT,
+        read_timeout=BOT_READ_TIMEOUT,
+        pool_timeout=BOT_POOL_TIMEOUT,
+        http_version=http_version(),
+    )
+    _requests.append(request)
+    return request
+
+
+def build_get_updates_request() -> InstrumentedRequest:
+    """Отдельный пул для getUpdates, чтобы long polling не занимал соединения рассылок."""
+    return build_request("get_updates", GET_UPDATES_POOL_SIZE)
+
+
+def check_pool_size(pool_size: int = BOT_CONNECTION_POOL_SIZE):
+    """Предупреждает, если рассылка может занять больше соединений, чем есть в пуле."""
+    if pool_size <= BROADCAST_CONCURRENCY:
+        logger.warning(
+            f"BOT_CONNECTION_POOL_SIZE={pool_size} не больше BROADCAST_CONCURRENCY="
+            f"{BROADCAST_CONCURRENCY}: во время рассылок ответам на команды "
+            f"не останется свободных соединений."
+        )
+
+
+def pool_stats() -> list[PoolStats]:
+    return [request.stats() for request in _requests]
@@ -0,0 +1,76 @@
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Optional
+
+from async_db import run_db
+from config import INSTANCE_ID, LEADER_LEASE_SECONDS
+from database import release_lease, try_acquire_lease
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    """
+    Аренда роли лидера через строку в таблице leases: когда несколько экземпляров
+    бота работают с одной БД, задачи планировщика выполняет только лидер.
+    Аренда продлевается каждую треть ttl; если лидер перестал её продлевать,
+    роль после истечения срока забирает другой экземпляр.
+    """
+
+    def __init__(self, name: str, holder: str = INSTANCE_ID, ttl: float = LEADER_LEASE_SECONDS):
+        self.name = name
+        self.holder = holder
+        self.ttl = ttl
+        # До этого момента (по монотонным часам) аренда точно наша
+        self._valid_until = 0.0
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    async def renew(self) -> bool:
+        """Берёт или продлевает аренду. Возвращает True, если экземпляр — лидер."""
+        was_leader = self.is_leader
+        started = time.monotonic()
+        if await run_db(try_acquire_lease, self.name, self.holder, self.ttl):
+            # Запас на рассинхронизацию часов между экземплярами
+            self._valid_until = started + self.ttl * 0.8
+        else:
+            self._valid_until = 0.0
+
+        if self.is_leader != was_leader:
+            role = "стал лидером" if self.is_leader else "больше не лидер"
+            logger.info(f"Экземпляр {self.holder} {role} ({self.name}).")
+        return self.is_leader
+
+    async def run(self):
+        while not self._stopping.is_set():
+            try:
+                await self.renew()
+            except Exception as e:
+                self._valid_until = 0.0
+                logger.error(f"Ошибка при продлении аренды {self.name}: {e}")
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._stopping.wait(), self.ttl / 3)
+
+    async def start(self):
+        """Сразу пытается взять аренду и запускает её продление в фоне."""
+        await self.renew()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Останавливает продление и отдаёт аренду, чтобы другой экземпляр не ждал ttl."""
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        if self.is_leader:
+            self._valid_until = 0.0
+            await run_db(release_lease, self.name, self.holder)
+
+
+scheduler_lease = LeaderLease("scheduler")
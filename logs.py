@@ -0,0 +1,166 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from collections.abc import Callable
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+from config import (
+    LOG_FILE,
+    LOG_FORMAT,
+    LOG_LEVEL,
+    LOG_QUEUE_SIZE,
+    LOG_RATE_LIMIT,
+    LOG_RATE_WINDOW,
+)
+from metrics import Counter
+
+# Логирование без блокировок event loop: обработчики только кладут запись в
+# очередь, а форматирование и запись в файл/консоль выполняет фоновый поток
+# QueueListener. Повторяющиеся сообщения (одна и та же строка кода, например
+# ошибка отправки каждому получателю рассылки) ограничиваются RateLimitFilter.
+# Сообщения горячих путей пишутся с ленивыми аргументами
+# (logger.info("... %s", user_id)): отброшенные записи не форматируются вовсе.
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+LOG_DROPPED = Counter(
+    "bot_log_records_dropped_total", "Записи лога, отброшенные до записи", ["reason"]
+)
+
+# Атрибуты LogRecord; всё остальное — поля, переданные через extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON; поля из extra= попадают в запись как есть."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.processName,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Не больше limit записей за window секунд с одной строки кода (CRITICAL не
+    ограничивается). Первая запись следующего окна сообщает, сколько похожих
+    было пропущено. limit <= 0 отключает ограничение.
+    """
+
+    def __init__(
+        self,
+        limit: int = LOG_RATE_LIMIT,
+        window: float = LOG_RATE_WINDOW,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Место вызова -> [начало окна, записей в окне, пропущено]
+        self._windows: dict[tuple[str, int], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit <= 0 or record.levelno >= logging.CRITICAL:
+            return True
+        key = (record.pathname, record.lineno)
+        now = self._clock()
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._windows[key] = [now, 1, 0]
+            elif state[1] < self.limit:
+                state[1] += 1
+                return True
+            else:
+                state[2] += 1
+                LOG_DROPPED.inc(reason="rate_limited")
+                return False
+        if suppressed:
+            record.msg = f"{record.msg} [пропущено похожих: {suppressed}]"
+            record.suppressed = suppressed
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    Кладёт запись в очередь как есть: сообщение форматирует поток записи, а не
+    вызывающий код. При переполненной очереди запись отбрасывается.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc(reason="queue_full")
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(
+    filename: Optional[str] = LOG_FILE,
+    fmt: str = LOG_FORMAT,
+    level: str = LOG_LEVEL,
+    text_format: str = TEXT_FORMAT,
+) -> QueueListener:
+    """
+    Настраивает корневой логгер: очередь, фильтр повторов и фоновый поток,
+    пишущий в консоль и (если задан filename) в файл с ротацией.
+    """
+    global _listener
+    stop_logging()
+
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(text_format)
+    handlers: list[logging.Handler] = [logging.StreamHandler()]
+    if filename:
+        handlers.insert(0, RotatingFileHandler(filename, maxBytes=5 * 1024 * 1024, backupCount=3))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = _NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Дописывает накопленные записи и останавливает поток записи."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
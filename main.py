@@ -1,6 +1,8 @@
 import asyncio
+import hmac
 import logging
-from logging.handlers import RotatingFileHandler
+import signal
+from urllib.parse import parse_qs, urlsplit
 
 from telegram import Update
 from telegram.ext import (
@@ -12,51 +14,131 @@ from telegram.ext import (
     filters,
 )
 
-from config import BOT_TOKEN, PORT, USE_WEBHOOK, WEBHOOK_URL
-from database import init_db
+import async_db
+from activity import activity_buffer
+from config import (
+    BOT_TOKEN,
+    HEALTH_PORT,
+    PORT,
+    PROFILE_SECONDS,
+    PROFILING_TOKEN,
+    RECEIVE_UPDATES,
+    SENDER_PROCESSES,
+    UPDATE_CONCURRENCY,
+    USE_WEBHOOK,
+    WEBHOOK_URL,
+)
+from database import close_db, init_db
 from handlers import (
+    addtask_handler,
     button_handler,
     message_handler,
+    removetask_handler,
     report_handler,
+    resetschedule_handler,
     schedule_handler,
+    settime_handler,
     start_handler,
     status_handler,
+    timezone_handler,
 )
+from http_pool import build_get_updates_request, build_request, check_pool_size
+from leader import scheduler_lease
+from logs import setup_logging
+from metrics import REGISTRY, Gauge, monitor_loop_lag
+from outbox import start_outbox_worker, stop_outbox_worker
+from profiling import collect_profile, install_signal_handlers, profiler
 from scheduler import shutdown_scheduler, start_scheduler
+from sender_pool import start_sender_pool
+from update_processor import PerUserUpdateProcessor
 
-# Structured logging with rotation
-handler = RotatingFileHandler("bot.log", maxBytes=5 * 1024 * 1024, backupCount=3)
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-    handlers=[handler, logging.StreamHandler()],
-)
+# Логи пишет фоновый поток (см. logs.py), event loop только ставит записи в очередь
+setup_logging()
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+UPDATE_QUEUE_DEPTH = Gauge("bot_update_queue_depth", "Обновления Telegram, ожидающие обработки")
 
-async def health_server():
-    """Simple health endpoint on port 8080."""
-
-    async def handle_client(_reader, writer):
-        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n\r\nok")
-        await writer.drain()
-        writer.close()
 
-    server = await asyncio.start_server(handle_client, "0.0.0.0", 8080, reuse_address=True)
-    logger.info("Health endpoint listening on port 8080")
+async def health_response(target: str) -> tuple[bytes, bytes, bytes]:
+    """
+    Ответ health-сервера: (статус, Content-Type, тело). Адреса /debug/* требуют
+    ?token=PROFILING_TOKEN и отключены, если токен не задан:
+    /debug/profile?seconds=N — стеки за N секунд в формате flamegraph,
+    /debug/profiling?enabled=1|0 — включить/выключить профилирование.
+    """
+    url = urlsplit(target)
+    query = parse_qs(url.query)
+    if url.path == "/metrics":
+        body = (await REGISTRY.collect()).encode()
+        return b"200 OK", b"text/plain; version=0.0.4; charset=utf-8", body
+    if not url.path.startswith("/debug/"):
+        return b"200 OK", b"text/plain", b"ok"
+
+    token = query.get("token", [""])[0]
+    if not PROFILING_TOKEN or not hmac.compare_digest(token, PROFILING_TOKEN):
+        return b"404 Not Found", b"text/plain", b"not found"
+    if url.path == "/debug/profile":
+        seconds = min(float(query.get("seconds", [PROFILE_SECONDS])[0]), 300.0)
+        folded = await collect_profile(seconds)
+        if folded is None:
+            return b"409 Conflict", b"text/plain", b"profiler is busy"
+        return b"200 OK", b"text/plain; charset=utf-8", folded.encode()
+    if url.path == "/debug/profiling":
+        if "enabled" in query:
+            profiler.enabled = query["enabled"][0] == "1"
+        return b"200 OK", b"text/plain", f"enabled={int(profiler.enabled)}".encode()
+    return b"404 Not Found", b"text/plain", b"not found"
+
+
+async def health_server(port: int = HEALTH_PORT):
+    """Health endpoint (GET /health), метрики Prometheus (GET /metrics) и /debug/*."""
+
+    async def handle_client(reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            parts = request_line.decode("latin-1").split()
+            status, content_type, body = await health_response(parts[1] if len(parts) > 1 else "/")
+            writer.write(
+                b"HTTP/1.1 " + status + b"\r\nContent-Type: " + content_type + b"\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                b"Connection: close\r\n\r\n" + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle_client, "0.0.0.0", port, reuse_address=True)
+    logger.info(f"Health endpoint listening on port {port}")
     async with server:
         await server.serve_forever()
 
 
+# Фоновые задачи процесса: health/metrics и замер задержки event loop
+_background_tasks: list[asyncio.Task] = []
+
+
 async def post_init(application: Application):
     """
     Функция, которая будет выполнена после инициализации приложения.
     Идеальное место для запуска фоновых задач, таких как планировщик.
     """
-    await start_scheduler(application)
-    # Здесь можно инициализировать соединение с БД, если это необходимо
     init_db()
+    UPDATE_QUEUE_DEPTH.set_function(application.update_queue.qsize)
+    _background_tasks.append(asyncio.create_task(health_server()))
+    _background_tasks.append(asyncio.create_task(monitor_loop_lag()))
+    install_signal_handlers(asyncio.get_running_loop())
+    # Досылаем рассылки, прерванные перезапуском, и запускаем воркер outbox
+    # (или процессы-отправители, чтобы рассылки не нагружали этот event loop)
+    if SENDER_PROCESSES > 0:
+        await start_sender_pool(SENDER_PROCESSES)
+    else:
+        await start_outbox_worker(application.bot)
+    # Задачи планировщика выполняет только экземпляр, удерживающий аренду лидера
+    await scheduler_lease.start()
+    await start_scheduler(application)
 
 
 async def post_shutdown(application: Application):
@@ -66,20 +148,70 @@ async def post_shutdown(application: Application):
     """
     await shutdown_scheduler()
     logger.info("Планировщик остановлен.")
+    await scheduler_lease.stop()
+    await stop_outbox_worker()
+    for task in _background_tasks:
+        task.cancel()
+    _background_tasks.clear()
+    # Сохраняем накопленную активность до остановки исполнителя БД
+    await activity_buffer.flush()
+    async_db.shutdown()
+    close_db()
+
+
+async def run_without_updates(application: Application):
+    """
+    Экземпляр без приёма обновлений (RECEIVE_UPDATES=false): те же хуки
+    жизненного цикла, аренда, планировщик и воркер outbox, но без polling и
+    webhook. Работает до SIGINT/SIGTERM.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await application.initialize()
+    await post_init(application)
+    await application.start()
+    logger.info("Запуск без приёма обновлений: только планировщик и рассылки.")
+    try:
+        await stop.wait()
+    finally:
+        await application.stop()
+        await application.shutdown()
+        await post_shutdown(application)
 
 
 def main() -> None:
     """Основная функция для запуска бота."""
     logger.info("Запуск бота...")
 
-    # Создание приложения с указанием хуков жизненного цикла
-    application = ApplicationBuilder().token(BOT_TOKEN).build()
+    # Создание приложения с указанием хуков жизненного цикла. Исходящие запросы
+    # и getUpdates идут через разные пулы соединений (см. http_pool.py)
+    check_pool_size()
+    builder = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .request(build_request("bot"))
+        .get_updates_request(build_get_updates_request())
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    # Обновления разных пользователей параллельно, одного пользователя — по очереди
+    if UPDATE_CONCURRENCY > 1:
+        builder = builder.concurrent_updates(PerUserUpdateProcessor(UPDATE_CONCURRENCY))
+    application = builder.build()
 
     # Регистрация обработчиков команд
     application.add_handler(CommandHandler("start", start_handler))
     application.add_handler(CommandHandler("status", status_handler))
     application.add_handler(CommandHandler("report", report_handler))
     application.add_handler(CommandHandler("schedule", schedule_handler))
+    application.add_handler(CommandHandler("timezone", timezone_handler))
+    application.add_handler(CommandHandler("settime", settime_handler))
+    application.add_handler(CommandHandler("addtask", addtask_handler))
+    application.add_handler(CommandHandler("removetask", removetask_handler))
+    application.add_handler(CommandHandler("resetschedule", resetschedule_handler))
 
     # Обработчик кнопок
     application.add_handler(CallbackQueryHandler(button_handler))
@@ -88,7 +220,9 @@ def main() -> None:
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler))
 
     # Запуск бота в зависимости от настроек
-    if USE_WEBHOOK and WEBHOOK_URL and PORT:
+    if not RECEIVE_UPDATES:
+        asyncio.run(run_without_updates(application))
+    elif USE_WEBHOOK and WEBHOOK_URL and PORT:
         logger.info(f"Запуск с webhook на порту {PORT}")
         application.run_webhook(
             listen="0.0.0.0",
@@ -0,0 +1,230 @@
+import asyncio
+import contextlib
+import inspect
+import logging
+import threading
+import time
+from collections.abc import Awaitable, Callable, Iterable, Sequence
+from typing import Any, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Метрики в текстовом формате Prometheus без внешних зависимостей: счётчики,
+# значения и гистограммы с метками. Метрики определяются на уровне модулей,
+# которые их собирают, и регистрируются в общем REGISTRY.
+
+LabelValues = tuple[str, ...]
+
+# Границы гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}, получены {labels}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterable[tuple[str, Sequence[str], Sequence[str], float]]:
+        """(имя, имена меток, значения меток, значение) для каждой строки вывода."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labelnames, labelvalues, value in self.samples():
+            lines.append(f"{name}{_format_labels(labelnames, labelvalues)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, self.labelnames, key, value
+
+
+class Gauge(_Metric):
+    """Текущее значение. set_function задаёт значение, которое читается при сборе."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def value(self, **labels) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        if self._function is not None:
+            yield self.name, (), (), self._function()
+            return
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, self.labelnames, key, value
+
+
+class Histogram(_Metric):
+    """Распределение значений (обычно длительностей) по корзинам."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # Для каждой комбинации меток: [счётчики корзин..., сумма]
+        self._values: dict[LabelValues, list[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0.0] * (len(self.buckets) + 1)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            counts[-1] += value
+
+    def count(self, **labels) -> float:
+        counts = self._values.get(self._key(labels))
+        return sum(counts[:-1]) if counts else 0.0
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(counts)) for key, counts in self._values.items())
+        bucket_labels = (*self.labelnames, "le")
+        for key, counts in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f"{self.name}_bucket", bucket_labels, (*key, _format_value(bound)), cumulative
+            yield f"{self.name}_sum", self.labelnames, key, counts[-1]
+            yield f"{self.name}_count", self.labelnames, key, cumulative
+
+
+Collector = Callable[[], Union[None, Awaitable[None]]]
+
+
+class Registry:
+    """Набор метрик процесса и функций, которые обновляют значения перед выводом."""
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Collector] = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def add_collector(self, collector: Collector):
+        """Функция (обычная или async), вызываемая перед каждым выводом метрик."""
+        self._collectors.append(collector)
+
+    async def collect(self) -> str:
+        for collector in self._collectors:
+            try:
+                result = collector()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Ошибка при сборе метрик ({collector.__name__}): {e}")
+        return self.render()
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- Общие метрики бота ---
+
+HANDLER_SECONDS = Histogram(
+    "bot_handler_duration_seconds", "Время обработки обновления обработчиком", ["handler"]
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Необработанные исключения в обработчиках", ["handler"]
+)
+LOOP_LAG_SECONDS = Histogram(
+    "bot_event_loop_lag_seconds",
+    "Задержка пробуждения event loop относительно запланированного",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+
+async def monitor_loop_lag(interval: float = 1.0):
+    """Фоновая задача: насколько позже запланированного просыпается event loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        LOOP_LAG_SECONDS.observe(max(loop.time() - expected, 0.0))
@@ -0,0 +1,523 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import time
+import uuid
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Optional
+
+from telegram import Bot, InlineKeyboardMarkup
+
+from async_db import run_db
+from broadcast import broadcast
+from config import (
+    INSTANCE_ID,
+    OUTBOX_BATCH_RETENTION_DAYS,
+    OUTBOX_CLAIM_TIMEOUT,
+    OUTBOX_PAGE_SIZE,
+    OUTBOX_POLL_INTERVAL,
+    SHARD_COUNT,
+    SHARD_INDEX,
+)
+from database import db_connection
+from metrics import REGISTRY, Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Элемент пакета рассылки: (user_id, task_key или None, payload в JSON)
+OutboxItem = tuple[int, Optional[str], str]
+
+BROADCAST_MESSAGES = Counter(
+    "bot_broadcast_messages_total", "Сообщения завершённых рассылок", ["job", "result"]
+)
+BROADCAST_SECONDS = Histogram(
+    "bot_broadcast_duration_seconds",
+    "Длительность рассылки от постановки в outbox до последней отправки",
+    ["job"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+)
+BROADCAST_THROUGHPUT = Gauge(
+    "bot_broadcast_throughput", "Сообщений в секунду в последней рассылке", ["job"]
+)
+OUTBOX_PENDING = Gauge("bot_outbox_pending", "Строки outbox, ожидающие отправки")
+
+
+@dataclass(frozen=True)
+class OutboxRow:
+    """Строка outbox, захваченная воркером для отправки."""
+
+    id: int
+    batch_id: int
+    user_id: int
+    payload: str
+
+
+@dataclass(frozen=True)
+class FinishedBatch:
+    """Итоги завершённого пакета рассылки."""
+
+    batch_id: int
+    job_id: str
+    total: int
+    sent: int
+    failed: int
+    duration: float
+
+    @property
+    def throughput(self) -> float:
+        return self.sent / self.duration if self.duration > 0 else 0.0
+
+    @property
+    def job_label(self) -> str:
+        """job_id без времени запуска (reminders_08:15 -> reminders) — метка метрик."""
+        return re.sub(r"_[\d:]+$", "", self.job_id)
+
+    def record_metrics(self):
+        BROADCAST_MESSAGES.inc(self.sent, job=self.job_label, result="sent")
+        BROADCAST_MESSAGES.inc(self.failed, job=self.job_label, result="failed")
+        BROADCAST_SECONDS.observe(self.duration, job=self.job_label)
+        BROADCAST_THROUGHPUT.set(self.throughput, job=self.job_label)
+
+
+# --- Сообщения ---
+
+
+def encode_payload(
+    text: str,
+    parse_mode: Optional[str] = None,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+) -> str:
+    """Сериализует аргументы send_message для хранения в outbox."""
+    payload: dict[str, Any] = {"text": text}
+    if parse_mode:
+        payload["parse_mode"] = parse_mode
+    if reply_markup is not None:
+        payload["reply_markup"] = reply_markup.to_dict()
+    return json.dumps(payload, ensure_ascii=False)
+
+
+@lru_cache(maxsize=256)
+def decode_payload(payload: str) -> dict[str, Any]:
+    """Восстанавливает аргументы send_message. У массовых рассылок payload повторяются,
+    поэтому результат кэшируется; возвращаемый словарь нельзя изменять."""
+    message = json.loads(payload)
+    if "reply_markup" in message:
+        message["reply_markup"] = InlineKeyboardMarkup.de_json(message["reply_markup"], None)
+    return message
+
+
+# --- Разнесение во времени ---
+
+
+def jitter_offset(spread_key: str, user_id: int, window: float) -> float:
+    """
+    Смещение отправки пользователю внутри окна [0, window) секунд. Зависит только
+    от spread_key и user_id, поэтому пользователь каждый раз получает сообщения
+    этого вида в одно и то же время, а получатели равномерно распределены по окну.
+    """
+    if window <= 0:
+        return 0.0
+    # crc32 для соседних user_id даёт заметно неравномерное распределение
+    digest = hashlib.blake2b(f"{spread_key}:{user_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2**64 * window
+
+
+# --- Хранилище ---
+
+
+@db_connection
+def enqueue_batch(
+    cursor: sqlite3.Cursor,
+    job_id: str,
+    items: Iterable[OutboxItem],
+    spread: float = 0.0,
+    spread_key: Optional[str] = None,
+) -> int:
+    """
+    Создаёт пакет рассылки и одним executemany кладёт в outbox все его сообщения.
+    Возвращает ID пакета. items можно передавать генератором: он читается
+    внутри транзакции, в потоке исполнителя БД, поэтому сам генератор не должен
+    обращаться к БД — такие пакеты собираются заранее. При spread > 0 отправка каждому
+    получателю откладывается на jitter_offset(spread_key, user_id, spread).
+    """
+    cursor.execute(
+        "INSERT INTO outbox_batches (job_id, created_at) VALUES (?, ?)",
+        (job_id, datetime.now()),
+    )
+    batch_id = cursor.lastrowid
+    spread_key = spread_key or job_id
+    started = time.time()
+    cursor.executemany(
+        """
+        INSERT INTO outbox (batch_id, user_id, task_key, payload, not_before)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+        (
+            (
+                batch_id,
+                user_id,
+                task_key,
+                payload,
+                started + jitter_offset(spread_key, user_id, spread),
+            )
+            for user_id, task_key, payload in items
+        ),
+    )
+    total = max(cursor.rowcount, 0)
+    cursor.execute("UPDATE outbox_batches SET total = ? WHERE batch_id = ?", (total, batch_id))
+    if total == 0:
+        _finish_batches(cursor, [batch_id])
+    return batch_id
+
+
+@db_connection
+def claim_rows(
+    cursor: sqlite3.Cursor,
+    limit: int,
+    now: Optional[float] = None,
+    shard_index: int = SHARD_INDEX,
+    shard_count: int = SHARD_COUNT,
+    instance_id: str = INSTANCE_ID,
+) -> list[OutboxRow]:
+    """
+    Атомарно захватывает до limit ожидающих строк своего шарда
+    (user_id % shard_count == shard_index), срок отправки которых наступил
+    (status pending -> sending).
+    """
+    claim_id = uuid.uuid4().hex
+    now = time.time() if now is None else now
+    cursor.execute(
+        """
+        UPDATE outbox
+        SET status = 'sending', claim_id = ?, claimed_by = ?, claimed_at = ?,
+            attempts = attempts + 1
+        WHERE id IN (
+            SELECT id FROM outbox
+            WHERE status = 'pending' AND not_before <= ? AND user_id % ? = ?
+            ORDER BY not_before, id LIMIT ?
+        )
+    """,
+        (claim_id, instance_id, now, now, shard_count, shard_index, limit),
+    )
+    cursor.execute(
+        "SELECT id, batch_id, user_id, payload FROM outbox WHERE claim_id = ? ORDER BY id",
+        (claim_id,),
+    )
+    return [OutboxRow(*row) for row in cursor.fetchall()]
+
+
+@db_connection
+def ack_rows(
+    cursor: sqlite3.Cursor, sent_ids: list[int], failed_ids: list[int]
+) -> list[FinishedBatch]:
+    """
+    Подтверждает результат отправки, прибавляет его к счётчикам пакетов и
+    закрывает пакеты, в которых не осталось работы. Считаются только строки в
+    статусе sending: повторное подтверждение строки счётчики не меняет.
+    """
+    acked: dict[int, dict[str, int]] = {}
+    for status, row_ids in (("sent", sent_ids), ("failed", failed_ids)):
+        for offset in range(0, len(row_ids), 500):
+            chunk = row_ids[offset : offset + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(
+                f"""
+                SELECT batch_id, COUNT(*) FROM outbox
+                WHERE id IN ({placeholders}) AND status = 'sending' GROUP BY batch_id
+            """,
+                chunk,
+            )
+            for batch_id, count in cursor.fetchall():
+                counts = acked.setdefault(batch_id, {"sent": 0, "failed": 0})
+                counts[status] += count
+            cursor.execute(
+                f"""
+                UPDATE outbox SET status = ?, claim_id = NULL
+                WHERE id IN ({placeholders}) AND status = 'sending'
+            """,
+                (status, *chunk),
+            )
+
+    cursor.executemany(
+        "UPDATE outbox_batches SET sent = sent + ?, failed = failed + ? WHERE batch_id = ?",
+        [(counts["sent"], counts["failed"], batch_id) for batch_id, counts in acked.items()],
+    )
+    return _finish_batches(cursor, sorted(acked))
+
+
+def _finish_batches(cursor: sqlite3.Cursor, batch_ids: list[int]) -> list[FinishedBatch]:
+    """
+    Закрывает пакеты, все строки которых подтверждены (sent + failed = total), и
+    удаляет их строки, чтобы outbox не разрастался; итоги остаются в outbox_batches.
+    """
+    finished = []
+    now = datetime.now()
+    for batch_id in batch_ids:
+        cursor.execute(
+            """
+            UPDATE outbox_batches SET finished_at = ?
+            WHERE batch_id = ? AND finished_at IS NULL AND sent + failed >= total
+        """,
+            (now, batch_id),
+        )
+        if cursor.rowcount == 0:
+            continue
+        cursor.execute("DELETE FROM outbox WHERE batch_id = ?", (batch_id,))
+
+        cursor.execute(
+            "SELECT job_id, total, sent, failed, created_at FROM outbox_batches WHERE batch_id = ?",
+            (batch_id,),
+        )
+        job_id, total, sent, failed, created_at = cursor.fetchone()
+        duration = (now - datetime.fromisoformat(str(created_at))).total_seconds()
+        finished.append(FinishedBatch(batch_id, job_id, total, sent, failed, duration))
+    return finished
+
+
+@db_connection
+def prune_finished_batches(
+    cursor: sqlite3.Cursor, retention_days: int = OUTBOX_BATCH_RETENTION_DAYS
+) -> int:
+    """Удаляет итоги пакетов, завершённых больше retention_days дней назад."""
+    cursor.execute(
+        "DELETE FROM outbox_batches WHERE finished_at < ?",
+        (datetime.now() - timedelta(days=retention_days),),
+    )
+    return cursor.rowcount
+
+
+@db_connection(readonly=True)
+def next_due_at(
+    cursor: sqlite3.Cursor, shard_index: int = SHARD_INDEX, shard_count: int = SHARD_COUNT
+) -> Optional[float]:
+    """Unix-время ближайшей ожидающей отправки строки шарда (None — шард пуст)."""
+    cursor.execute(
+        """
+        SELECT not_before FROM outbox
+        WHERE status = 'pending' AND user_id % ? = ?
+        ORDER BY not_before LIMIT 1
+    """,
+        (shard_count, shard_index),
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+@db_connection(readonly=True)
+def count_pending(cursor: sqlite3.Cursor) -> int:
+    """Число строк outbox, ожидающих отправки (все шарды)."""
+    cursor.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'")
+    return cursor.fetchone()[0]
+
+
+@db_connection
+def resume_unfinished(
+    cursor: sqlite3.Cursor,
+    instance_id: Optional[str] = INSTANCE_ID,
+    stale_after: float = OUTBOX_CLAIM_TIMEOUT,
+) -> int:
+    """
+    Возвращает в очередь строки, захваченные экземпляром instance_id до перезапуска
+    (None — только чужие), и строки, зависшие у других экземпляров дольше
+    stale_after секунд; закрывает пакеты, которые успели отправиться полностью.
+    Возвращает число строк к отправке.
+    """
+    cursor.execute(
+        """
+        UPDATE outbox SET status = 'pending', claim_id = NULL, claimed_by = NULL
+        WHERE status = 'sending' AND (claimed_by = ? OR claimed_at < ?)
+    """,
+        (instance_id, time.time() - stale_after),
+    )
+    if cursor.rowcount:
+        logger.warning(f"В очередь outbox возвращено {cursor.rowcount} незавершённых строк.")
+    cursor.execute("SELECT batch_id FROM outbox_batches WHERE finished_at IS NULL")
+    _finish_batches(cursor, [row[0] for row in cursor.fetchall()])
+    cursor.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'")
+    return cursor.fetchone()[0]
+
+
+# --- Воркер ---
+
+
+class OutboxWorker:
+    """
+    Фоновая задача, которая выбирает из outbox страницы ожидающих сообщений,
+    отправляет их через движок рассылок и подтверждает результат. Скорость
+    отправки задаётся параметрами рассылки, а не расписанием задач. Каждый
+    экземпляр бота отправляет только свой шард получателей.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        page_size: int = OUTBOX_PAGE_SIZE,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        shard_index: int = SHARD_INDEX,
+        shard_count: int = SHARD_COUNT,
+        instance_id: str = INSTANCE_ID,
+    ):
+        self.bot = bot
+        self.page_size = page_size
+        self.poll_interval = poll_interval
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.instance_id = instance_id
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    def notify(self):
+        """Будит воркер после постановки нового пакета."""
+        self._wakeup.set()
+
+    async def drain_once(self) -> int:
+        """Отправляет одну страницу outbox. Возвращает количество обработанных строк."""
+        rows = await run_db(
+            claim_rows,
+            self.page_size,
+            shard_index=self.shard_index,
+            shard_count=self.shard_count,
+            instance_id=self.instance_id,
+        )
+        if not rows:
+            return 0
+
+        sent_ids: list[int] = []
+        failed_ids: list[int] = []
+        try:
+            await broadcast(
+                self.bot,
+                "outbox",
+                rows,
+                lambda row: decode_payload(row.payload),
+                chat_id_of=lambda row: row.user_id,
+                on_result=lambda row, ok: (sent_ids if ok else failed_ids).append(row.id),
+                quiet=True,
+            )
+        finally:
+            # Подтверждаем отправленное и при отмене (остановка посреди страницы):
+            # иначе после перезапуска эти строки ушли бы повторно
+            if sent_ids or failed_ids:
+                await asyncio.shield(self._ack(sent_ids, failed_ids))
+        return len(rows)
+
+    async def _ack(self, sent_ids: list[int], failed_ids: list[int]):
+        for batch in await run_db(ack_rows, sent_ids, failed_ids) or []:
+            batch.record_metrics()
+            logger.info(
+                f"Рассылка {batch.job_id} (пакет {batch.batch_id}) завершена: "
+                f"отправлено {batch.sent} из {batch.total}, ошибок {batch.failed}, "
+                f"{batch.duration:.1f} с ({batch.throughput:.1f} сообщ./с)."
+            )
+
+    async def run(self):
+        while not self._stopping:
+            self._wakeup.clear()
+            timeout = self.poll_interval
+            try:
+                if await self.drain_once():
+                    continue
+                # Просыпаемся к сроку ближайшей отложенной строки
+                due_at = await run_db(next_due_at, self.shard_index, self.shard_count)
+                if due_at is not None:
+                    timeout = min(timeout, max(due_at - time.time(), 0.05))
+            except Exception as e:
+                logger.error(f"Ошибка при отправке сообщений из outbox: {e}")
+
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        Даёт воркеру дослать текущую страницу, затем останавливает его; уже
+        отправленные строки недосланной страницы подтверждаются.
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Воркер outbox не успел дослать страницу, остаток уйдёт после старта.")
+        self._task = None
+
+
+# Воркер этого процесса или пул процессов-отправителей (см. sender_pool.py):
+# любой объект с методами notify() и async stop()
+_worker: Optional[Any] = None
+
+
+async def resume_outbox(instance_id: str = INSTANCE_ID):
+    """Возвращает в очередь строки, захваченные instance_id до перезапуска."""
+    pending = await run_db(resume_unfinished, instance_id)
+    if pending:
+        logger.info(f"Возобновляю незавершённые рассылки: {pending} сообщений в outbox.")
+
+
+def attach_worker(worker: Any):
+    """Подключает воркер, которого будит enqueue_broadcast и останавливает stop_outbox_worker."""
+    global _worker
+    _worker = worker
+
+
+async def start_outbox_worker(bot: Bot):
+    """Возобновляет незавершённые пакеты и запускает воркер (вызывается из post_init)."""
+    await resume_outbox()
+    worker = OutboxWorker(bot)
+    worker.start()
+    attach_worker(worker)
+    if SHARD_COUNT > 1:
+        logger.info(f"Воркер outbox {INSTANCE_ID}: шард {SHARD_INDEX} из {SHARD_COUNT}.")
+
+
+async def stop_outbox_worker():
+    global _worker
+    if _worker is not None:
+        await _worker.stop()
+        _worker = None
+
+
+async def requeue_stale_claims():
+    """
+    Возвращает в очередь строки упавших экземпляров и удаляет старые итоги
+    пакетов (периодическая задача лидера).
+    """
+    await run_db(resume_unfinished, None)
+    pruned = await run_db(prune_finished_batches)
+    if pruned:
+        logger.info("Удалено %s завершённых пакетов outbox.", pruned)
+
+
+async def enqueue_broadcast(
+    job_id: str,
+    items: Iterable[OutboxItem],
+    spread: float = 0.0,
+    spread_key: Optional[str] = None,
+) -> int:
+    """
+    Ставит пакет рассылки в outbox и будит воркер. Возвращает ID пакета.
+    spread — окно разнесения отправки в секундах (см. jitter_offset).
+    """
+    batch_id = await run_db(enqueue_batch, job_id, items, spread, spread_key)
+    if _worker is not None:
+        _worker.notify()
+    return batch_id
+
+
+async def _collect_outbox_metrics():
+    OUTBOX_PENDING.set(await run_db(count_pending) or 0)
+
+
+REGISTRY.add_collector(_collect_outbox_metrics)
@@ -0,0 +1,227 @@
+import asyncio
+import collections
+import functools
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections.abc import Awaitable, Callable, Generator
+from datetime import datetime
+from typing import Any, Optional
+
+from config import (
+    PROFILE_DIR,
+    PROFILE_SAMPLE_INTERVAL,
+    PROFILE_SECONDS,
+    PROFILING_ENABLED,
+    SLOW_OPERATION_SECONDS,
+)
+from metrics import HANDLER_ERRORS, HANDLER_SECONDS, Histogram
+
+logger = logging.getLogger(__name__)
+
+CPU_SECONDS = Histogram(
+    "bot_operation_cpu_seconds",
+    "Процессорное время операции (только при включённом профилировании)",
+    ["kind", "name"],
+)
+
+
+class _ProfilerState:
+    """Включено ли подробное профилирование (меняется без перезапуска)."""
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+
+    def toggle(self) -> bool:
+        self.enabled = not self.enabled
+        logger.info(f"Профилирование {'включено' if self.enabled else 'выключено'}.")
+        return self.enabled
+
+
+profiler = _ProfilerState(PROFILING_ENABLED)
+
+
+def record(kind: str, name: str, wall: float, cpu: Optional[float] = None):
+    """Учитывает процессорное время операции и пишет в лог слишком медленные."""
+    if cpu is not None:
+        CPU_SECONDS.observe(cpu, kind=kind, name=name)
+    if wall >= SLOW_OPERATION_SECONDS:
+        cpu_text = f", CPU {cpu * 1000:.0f} мс" if cpu is not None else ""
+        logger.warning("Медленная операция %s %s: %.0f мс%s.", kind, name, wall * 1000, cpu_text)
+
+
+class _CpuTimed:
+    """
+    Выполняет корутину, суммируя процессорное время её шагов между await:
+    время, пока event loop занят другими задачами, не учитывается.
+    """
+
+    def __init__(self, coro: Awaitable[Any]):
+        self.coro = coro
+        self.cpu = 0.0
+
+    def __await__(self) -> Generator[Any, Any, Any]:
+        iterator = self.coro.__await__()
+        value: Any = None
+        error: Optional[BaseException] = None
+        while True:
+            started = time.thread_time()
+            try:
+                future = iterator.send(value) if error is None else iterator.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.cpu += time.thread_time() - started
+            try:
+                value, error = (yield future), None
+            except BaseException as e:
+                value, error = None, e
+
+
+def profiled(kind: str, name: Optional[str] = None):
+    """
+    Декоратор корутин горячего пути: медленные вызовы пишутся в лог всегда,
+    процессорное время — только при включённом профилировании.
+    """
+
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            timed: Optional[_CpuTimed] = None
+            try:
+                if profiler.enabled:
+                    timed = _CpuTimed(func(*args, **kwargs))
+                    return await timed
+                return await func(*args, **kwargs)
+            finally:
+                record(kind, label, time.perf_counter() - started, timed.cpu if timed else None)
+
+        return wrapper
+
+    return decorator
+
+
+def profiled_handler(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """
+    Обработчик обновлений: длительность и ошибки в метриках (метка — имя функции
+    без _handler) плюс всё, что делает profiled.
+    """
+    name = func.__name__
+    label = name[: -len("_handler")] if name.endswith("_handler") else name
+    inner = profiled("handler", label)(func)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await inner(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=label)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, handler=label)
+
+    return wrapper
+
+
+# --- Семплирующий профайлер ---
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Семплирующий профайлер: фоновый поток периодически снимает стеки всех
+    потоков процесса. Результат — стеки в формате «collapsed» (одна строка
+    «поток;функция;...;функция N»), который понимают flamegraph.pl и speedscope.
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._busy = threading.Lock()
+
+    def sample(self, seconds: float) -> Optional[collections.Counter]:
+        """Снимает стеки seconds секунд (блокирующий вызов). None — профайлер уже занят."""
+        if not self._busy.acquire(blocking=False):
+            return None
+        try:
+            own = threading.get_ident()
+            counts: collections.Counter = collections.Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_name(frame))
+                        frame = frame.f_back
+                    stack.append(names.get(ident, str(ident)))
+                    counts[";".join(reversed(stack))] += 1
+                time.sleep(self.interval)
+            return counts
+        finally:
+            self._busy.release()
+
+    @staticmethod
+    def render(counts: collections.Counter) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+sampler = StackSampler()
+
+
+async def collect_profile(seconds: float = PROFILE_SECONDS) -> Optional[str]:
+    """Профилирует процесс seconds секунд, не блокируя event loop. None — уже идёт."""
+    counts = await asyncio.to_thread(sampler.sample, seconds)
+    return None if counts is None else sampler.render(counts)
+
+
+async def dump_profile(seconds: float = PROFILE_SECONDS) -> Optional[str]:
+    """Профилирует процесс и сохраняет стеки в PROFILE_DIR. Возвращает путь к файлу."""
+    logger.info(f"Запускаю семплирующий профайлер на {seconds:.0f} с.")
+    folded = await collect_profile(seconds)
+    if folded is None:
+        logger.warning("Профайлер уже запущен, новый запуск пропущен.")
+        return None
+    path = os.path.join(PROFILE_DIR, f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded")
+    await asyncio.to_thread(_write_text, path, folded)
+    logger.info(f"Профиль сохранён: {path}")
+    return path
+
+
+def _write_text(path: str, text: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+_profile_tasks: set[asyncio.Task] = set()
+
+
+def install_signal_handlers(loop: asyncio.AbstractEventLoop):
+    """SIGUSR1 — снять профиль на PROFILE_SECONDS, SIGUSR2 — переключить профилирование."""
+    usr1 = getattr(signal, "SIGUSR1", None)
+    usr2 = getattr(signal, "SIGUSR2", None)
+    if usr1 is None or usr2 is None:
+        return
+
+    def start_dump():
+        task = loop.create_task(dump_profile())
+        _profile_tasks.add(task)
+        task.add_done_callback(_profile_tasks.discard)
+
+    try:
+        loop.add_signal_handler(usr1, start_dump)
+        loop.add_signal_handler(usr2, profiler.toggle)
+    except (NotImplementedError, RuntimeError) as e:
+        logger.warning(f"Не удалось установить сигналы профилирования: {e}")
@@ -0,0 +1,214 @@
+from datetime import date, time
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
+from telegram.helpers import escape_markdown
+
+from config import SCHEDULE
+from database import TASK_BITS
+from outbox import encode_payload
+from routing import complete_callback_data
+from schedules import Schedule, custom_task_config, ordered_task_keys
+
+# Всё, что зависит только от SCHEDULE, строится один раз при импорте;
+# в ответ пользователю подставляются только его значки выполнения. Объекты
+# telegram неизменяемы, поэтому одну клавиатуру можно отправлять всем.
+
+# --- Клавиатуры ---
+
+# Тексты кнопок; по ним же маршрутизируются сообщения (см. handlers.py)
+BUTTON_STATUS = "📊 Статус"
+BUTTON_REPORT = "📈 Отчёт"
+BUTTON_SCHEDULE = "🗓 Расписание"
+BUTTON_HELP = "ℹ️ Помощь"
+
+MAIN_KEYBOARD = ReplyKeyboardMarkup(
+    [
+        [KeyboardButton(BUTTON_STATUS), KeyboardButton(BUTTON_REPORT)],
+        [KeyboardButton(BUTTON_SCHEDULE), KeyboardButton(BUTTON_HELP)],
+    ],
+    resize_keyboard=True,
+    one_time_keyboard=False,
+)
+
+# --- Названия и строки задач ---
+
+
+@lru_cache(maxsize=1024)
+def display_name(button_text: str) -> str:
+    """Название задачи для текстов (текст кнопки без галочки)."""
+    return button_text.replace(" ✅", "")
+
+
+def task_display_name(task_key: str, schedule: Optional[dict] = None) -> str:
+    """Название задачи расписания по ключу."""
+    schedule = SCHEDULE if schedule is None else schedule
+    return display_name(schedule[task_key]["button_text"])
+
+
+class TaskRow(NamedTuple):
+    """Строка задачи в /status и /schedule без значка: «ЧЧ:ММ - Название»."""
+
+    task_key: str
+    label: str
+
+
+def _build_rows(schedule: Schedule) -> dict[str, TaskRow]:
+    return {
+        task_key: TaskRow(
+            task_key,
+            f"{config['time'].strftime('%H:%M')} - "
+            f"{display_name(config.get('button_text', task_key))}",
+        )
+        for task_key, config in schedule.items()
+    }
+
+
+# Строки общего расписания: в порядке SCHEDULE и по времени (нумерация /schedule)
+_DEFAULT_ROWS = _build_rows(SCHEDULE)
+_DEFAULT_ROWS_BY_TIME = tuple(_DEFAULT_ROWS[key] for key in ordered_task_keys(SCHEDULE))
+
+
+def task_rows(schedule: Schedule) -> dict[str, TaskRow]:
+    """Строки задач по ключу. Для пользователей без своего расписания — готовые."""
+    return _DEFAULT_ROWS if schedule is SCHEDULE else _build_rows(schedule)
+
+
+def rows_by_time(schedule: Schedule) -> tuple[TaskRow, ...]:
+    """Строки задач по времени — в этом порядке задачи нумеруются в /schedule."""
+    if schedule is SCHEDULE:
+        return _DEFAULT_ROWS_BY_TIME
+    rows = _build_rows(schedule)
+    return tuple(rows[key] for key in ordered_task_keys(schedule))
+
+
+def render_status_lines(tasks_status: dict[str, bool], schedule: Schedule) -> list[str]:
+    """Строки /status: значок выполнения и строка задачи."""
+    rows = task_rows(schedule)
+    return [
+        f"{'✅' if is_completed else '⏳'} {rows[task_key].label}"
+        for task_key, is_completed in tasks_status.items()
+        if task_key in rows
+    ]
+
+
+def render_schedule_lines(tasks_status: dict[str, bool], schedule: Schedule) -> list[str]:
+    """Нумерованные строки /schedule (номера используют /settime и /removetask)."""
+    return [
+        f"{number}. {'✅' if tasks_status.get(row.task_key) else '⏰'} {row.label}"
+        for number, row in enumerate(rows_by_time(schedule), start=1)
+    ]
+
+
+# --- Напоминания ---
+
+
+# Кнопка напоминания содержит дату (см. routing.py), поэтому напоминания строятся
+# один раз в день, а не при импорте
+
+
+def _build_reminder_payload(task_key: str, task_config: dict, day: date) -> str:
+    button = InlineKeyboardButton(
+        task_config["button_text"], callback_data=complete_callback_data(task_key, day)
+    )
+    return encode_payload(task_config["message"], reply_markup=InlineKeyboardMarkup([[button]]))
+
+
+# У получателей в разных поясах одновременно не больше трёх разных местных дат
+@lru_cache(maxsize=4)
+def _default_reminders(day: date) -> dict[str, str]:
+    return {
+        task_key: _build_reminder_payload(task_key, config, day)
+        for task_key, config in SCHEDULE.items()
+    }
+
+
+@lru_cache(maxsize=1024)
+def _custom_reminder_payload(task_key: str, title: str, day: date) -> str:
+    # У своих задач время в тексте не используется, важно только название
+    return _build_reminder_payload(task_key, custom_task_config(time(), title), day)
+
+
+def reminder_payload(task_key: str, title: Optional[str], day: date) -> Optional[str]:
+    """
+    Сериализованное напоминание за день day с кнопкой выполнения задачи
+    (стандартной или своей). None — задачи нет в SCHEDULE.
+    """
+    if title:
+        return _custom_reminder_payload(task_key, title, day)
+    return _default_reminders(day).get(task_key)
+
+
+# --- Сводка дня ---
+
+SUMMARY_EMPTY = "📅 Сегодня не было выполненных задач. Новый день — новые достижения!"
+
+
+def schedule_mask() -> int:
+    """Маска всех задач из SCHEDULE."""
+    mask = 0
+    for task_key in SCHEDULE:
+        mask |= TASK_BITS[task_key]
+    return mask
+
+
+def render_daily_summary(completed_keys: list[str], schedule: Optional[dict] = None) -> str:
+    """
+    Текст сводки дня (Markdown) по списку выполненных задач в порядке расписания.
+    Названия экранируются: у своих задач их задаёт пользователь (/addtask).
+    """
+    if not completed_keys:
+        return SUMMARY_EMPTY
+
+    summary = "🌟 **Сводка дня:**\n\n"
+    summary += "\n".join(
+        f"✅ {escape_markdown(task_display_name(key, schedule), version=1)}"
+        for key in completed_keys
+    )
+    summary += f"\n\nОтличная работа! Выполнено задач: **{len(completed_keys)}** 💪"
+    return summary
+
+
+# Шаблоны зависят от номеров битов, которые init_db загружает из БД, поэтому
+# они строятся при первом запуске сводки и кэшируются по снимку битов SCHEDULE
+
+
+@lru_cache(maxsize=1)
+def _summary_templates(bits: tuple[int, ...]) -> dict[int, dict]:
+    keys = list(SCHEDULE)
+    templates = {}
+    for combination in range(1 << len(keys)):
+        completed_keys = [key for index, key in enumerate(keys) if combination >> index & 1]
+        mask = 0
+        for index, bit in enumerate(bits):
+            if combination >> index & 1:
+                mask |= bit
+        templates[mask] = {"text": render_daily_summary(completed_keys), "parse_mode": "Markdown"}
+    return templates
+
+
+@lru_cache(maxsize=1)
+def _summary_payloads(bits: tuple[int, ...]) -> dict[int, str]:
+    return {
+        mask: encode_payload(message["text"], parse_mode=message["parse_mode"])
+        for mask, message in _summary_templates(bits).items()
+    }
+
+
+def _schedule_bits() -> tuple[int, ...]:
+    return tuple(TASK_BITS[task_key] for task_key in SCHEDULE)
+
+
+def daily_summary_templates() -> dict[int, dict]:
+    """
+    Готовые аргументы send_message для каждой возможной маски выполненных задач
+    из SCHEDULE (2^N вариантов; нельзя изменять). Маску пользователя нужно сначала
+    ограничить schedule_mask(), чтобы отбросить биты удалённых из расписания задач.
+    """
+    return _summary_templates(_schedule_bits())
+
+
+def daily_summary_payloads() -> dict[int, str]:
+    """Шаблоны сводки, сериализованные для outbox (по маске; нельзя изменять)."""
+    return _summary_payloads(_schedule_bits())
@@ -0,0 +1,108 @@
+from collections.abc import Awaitable, Callable
+from datetime import date
+from typing import Any, NamedTuple, Optional
+
+from database import TASK_BITS, TASK_KEYS_BY_BIT
+
+# Маршрутизация обновлений по словарям, построенным при запуске: текст кнопки
+# reply-клавиатуры или код callback_data -> обработчик, без цепочек if/elif.
+
+Handler = Callable[..., Awaitable[Any]]
+
+# --- callback_data ---
+#
+# Формат: "<код>:<аргумент>:...", код включает версию формата. Кнопка
+# выполнения задачи — "c1:<номер бита задачи>:<ГГГГММДД>": номер бита не
+# меняется при правке SCHEDULE, а местная дата пользователя, на которую
+# отправлено напоминание, позволяет отклонить кнопку за прошлый день. Старый формат
+# "complete_<ключ задачи>" (кнопки, отправленные до обновления) по-прежнему
+# разбирается: код — часть до первого "_".
+
+COMPLETE_CODE = "c1"
+LEGACY_COMPLETE_CODE = "complete"
+CALLBACK_SEPARATOR = ":"
+
+
+def day_code(day: date) -> str:
+    return f"{day:%Y%m%d}"
+
+
+def complete_callback_data(task_key: str, day: date) -> str:
+    """callback_data кнопки выполнения задачи в напоминании за день day."""
+    mask = TASK_BITS.get(task_key)
+    if mask is None:
+        return f"{LEGACY_COMPLETE_CODE}_{task_key}"
+    return CALLBACK_SEPARATOR.join((COMPLETE_CODE, str(mask.bit_length() - 1), day_code(day)))
+
+
+class CompleteTarget(NamedTuple):
+    """Задача из кнопки выполнения; stale — кнопка из напоминания за другой день."""
+
+    task_key: str
+    stale: bool = False
+
+
+def parse_complete(code: str, args: list[str], today: date) -> Optional[CompleteTarget]:
+    """
+    Разбирает аргументы кнопки выполнения; today — сегодняшняя дата по местному
+    времени пользователя. None — кнопка повреждена.
+    """
+    if code == LEGACY_COMPLETE_CODE:
+        return CompleteTarget(args[0]) if len(args) == 1 and args[0] else None
+    if len(args) != 2 or not args[0].isdigit():
+        return None
+    task_key = TASK_KEYS_BY_BIT.get(int(args[0]))
+    if task_key is None:
+        return None
+    return CompleteTarget(task_key, stale=args[1] != day_code(today))
+
+
+def split_callback(data: str) -> tuple[str, list[str]]:
+    """(код, аргументы) из callback_data нового или старого формата."""
+    if CALLBACK_SEPARATOR in data:
+        code, *args = data.split(CALLBACK_SEPARATOR)
+        return code, args
+    code, _, arg = data.partition("_")
+    return code, [arg]
+
+
+# --- Текст ---
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class Router:
+    """
+    Таблицы маршрутов: нормализованный текст кнопки -> обработчик и код
+    callback_data -> обработчик. Поиск маршрута — одно обращение к словарю.
+    """
+
+    def __init__(self):
+        self._text: dict[str, Handler] = {}
+        self._callbacks: dict[str, Handler] = {}
+
+    def add_text(self, handler: Handler, *labels: str):
+        """
+        Текст кнопки reply-клавиатуры. Для кнопок с эмодзи в начале
+        («📊 Статус») принимается и текст без него («статус»).
+        """
+        for label in labels:
+            normalized = normalize_text(label)
+            self._text[normalized] = handler
+            first, _, rest = normalized.partition(" ")
+            if rest and not first.isalnum():
+                self._text[rest] = handler
+
+    def add_callback(self, handler: Handler, *codes: str):
+        for code in codes:
+            self._callbacks[code] = handler
+
+    def text_handler(self, text: str) -> Optional[Handler]:
+        return self._text.get(normalize_text(text))
+
+    def callback_handler(self, data: str) -> tuple[Optional[Handler], str, list[str]]:
+        """(обработчик или None, код, аргументы) для callback_data."""
+        code, args = split_callback(data)
+        return self._callbacks.get(code), code, args
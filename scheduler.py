@@ -1,17 +1,45 @@
-import asyncio
+import functools
 import logging
 import random
+from collections.abc import Awaitable, Callable
+from datetime import date
+from typing import Any, Optional
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application
 
-from config import MESSAGES, SCHEDULE, TIMEZONE  # Конфигурация задач и сообщений
-from database import (
-    get_all_active_user_ids,
-    get_today_tasks_status,
-    is_task_completed_today,
-)  # Новая функция в database.py
+import database
+from activity import activity_buffer
+from async_db import (
+    get_due_reminders,
+    get_scheduler_state,
+    refresh_reminder_slots,
+    run_db,
+    set_scheduler_state,
+)
+from config import (  # Конфигурация задач и сообщений
+    ACTIVITY_FLUSH_INTERVAL,
+    DAILY_SUMMARY_SPREAD_SECONDS,
+    DAILY_SUMMARY_TIME,
+    MESSAGES,
+    MOTIVATIONAL_SPREAD_SECONDS,
+    OUTBOX_CLAIM_TIMEOUT,
+    REMINDER_CATCHUP_MINUTES,
+    REMINDER_SLOTS_REFRESH_INTERVAL,
+    REMINDER_SPREAD_SECONDS,
+    SCHEDULE,
+    TIMEZONE,
+)
+from leader import scheduler_lease
+from outbox import encode_payload, enqueue_broadcast, requeue_stale_claims
+from profiling import profiled
+from rendering import (
+    daily_summary_payloads,
+    reminder_payload,
+    render_daily_summary,
+    schedule_mask,
+)
+from timezones import MINUTES_PER_DAY, current_utc_minute
 
 logger = logging.getLogger(__name__)
 
@@ -19,70 +47,144 @@ logger = logging.getLogger(__name__)
 scheduler = AsyncIOScheduler(timezone=TIMEZONE)
 
 # --- Функции-задачи (Jobs) ---
+#
+# Задачи только ставят пакет сообщений в outbox (см. outbox.py); отправкой
+# занимается воркер outbox, поэтому рассылка переживает перезапуск процесса.
 
 
-async def send_reminder_job(app: Application, task_key: str):
-    """Задача: отправить напоминание по конкретной задаче всем активным пользователям."""
-    task_config = SCHEDULE.get(task_key)
-    if not task_config:
-        logger.warning(f"Конфигурация для задачи {task_key} не найдена.")
-        return
+def _reminder_payload(task_key: str, title: Optional[str], day: date) -> Optional[str]:
+    """Готовое сообщение-напоминание с кнопкой выполнения (см. rendering.py)."""
+    payload = reminder_payload(task_key, title, day)
+    if payload is None:
+        logger.warning("Конфигурация для задачи %s не найдена.", task_key)
+    return payload
 
-    logger.info(f"Запускаю рассылку напоминания для задачи: {task_key}")
 
-    # 1. Получаем ID всех активных пользователей прямо из БД
-    user_ids = get_all_active_user_ids()
-    if not user_ids:
-        logger.info("Нет активных пользователей для отправки напоминаний.")
-        return
+def leader_only(job: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """
+    Задача выполняется только на экземпляре-лидере (см. leader.py). Планировщик
+    работает на каждом экземпляре, но рассылки ставит в outbox только один.
+    """
 
-    # 2. Создаем кнопку один раз
-    keyboard = InlineKeyboardMarkup(
-        [[InlineKeyboardButton(task_config["button_text"], callback_data=f"complete_{task_key}")]]
-    )
+    @functools.wraps(job)
+    async def wrapper(*args, **kwargs):
+        if not scheduler_lease.is_leader:
+            return None
+        return await job(*args, **kwargs)
+
+    return wrapper
+
+
+# Ключ scheduler_state с последней обработанной минутой (от начала эпохи, UTC):
+# хранится в БД, чтобы новый лидер или перезапущенный бот продолжил с неё
+LAST_DISPATCHED_MINUTE_KEY = "reminders_last_minute"
+
+
+@leader_only
+@profiled("job")
+async def dispatch_reminders_job(app: Application):
+    """
+    Задача: раз в минуту выбрать пользователей, у которых по их местному времени
+    наступил срок напоминания, и поставить напоминания в outbox. Если запуск
+    задержался (или сменился лидер), пропущенные минуты
+    (не больше REMINDER_CATCHUP_MINUTES) обрабатываются догоняющим образом.
+    """
+    now_minute = current_utc_minute()
+    last_minute = await get_scheduler_state(LAST_DISPATCHED_MINUTE_KEY)
+    if last_minute is None:
+        first_minute = now_minute
+    else:
+        first_minute = max(int(last_minute) + 1, now_minute - REMINDER_CATCHUP_MINUTES)
 
-    # 3. Рассылаем напоминания
-    for user_id in user_ids:
-        # Проверяем, не выполнил ли пользователь уже эту задачу
-        if not is_task_completed_today(user_id, task_key):
-            try:
-                await app.bot.send_message(
-                    chat_id=user_id, text=task_config["message"], reply_markup=keyboard
-                )
-                await asyncio.sleep(0.1)  # Небольшая задержка между отправками
-            except Exception as e:
-                logger.error(
-                    f"Не удалось отправить напоминание {task_key} пользователю {user_id}: {e}"
-                )
+    for minute in range(first_minute, now_minute + 1):
+        due_minute = minute % MINUTES_PER_DAY
+        # Сводки дня — тем, у кого по местному времени наступило DAILY_SUMMARY_TIME
+        await _enqueue_daily_summaries(due_minute)
+        due = await get_due_reminders(due_minute)
+        if not due:
+            continue
+
+        # Сообщение строится один раз на задачу (для своих задач — на название) и
+        # местную дату получателя: она попадает в кнопку выполнения
+        payloads: dict[tuple[str, Optional[str], date], Optional[str]] = {}
+        items = []
+        for user_id, task_key, title, day in due:
+            key = (task_key, title, day)
+            if key not in payloads:
+                payloads[key] = _reminder_payload(task_key, title, day)
+            if payloads[key] is not None:
+                items.append((user_id, task_key, payloads[key]))
+
+        hh_mm = f"{due_minute // 60:02d}:{due_minute % 60:02d}"
+        logger.info("Ставлю %s напоминаний (минута UTC %s).", len(items), hh_mm)
+        await enqueue_broadcast(
+            f"reminders_{hh_mm}", items, REMINDER_SPREAD_SECONDS, spread_key="reminder"
+        )
+
+    await set_scheduler_state(LAST_DISPATCHED_MINUTE_KEY, str(now_minute))
+
+
+def _daily_summary_items(due_minute: Optional[int] = None):
+    """Пакет сводок: маски выполненных задач получателей (см.
+    get_today_completion_masks) — одним запросом; текст сводки берётся из заранее
+    построенных шаблонов по маске. Пользователям со своим расписанием сводка
+    собирается отдельно."""
+    user_ids, masks = database.get_today_completion_masks(due_minute) or ((), ())
+    full_mask = schedule_mask()
+    payloads = daily_summary_payloads()
+    customized = database.get_schedule_override_user_ids() or set()
+
+    completed_total = 0
+    for user_id, mask in zip(user_ids, masks):
+        if user_id in customized:
+            schedule = database.get_user_schedule(user_id) or SCHEDULE
+            completed_keys = [key for key in schedule if mask & database.TASK_BITS.get(key, 0)]
+            completed_total += len(completed_keys)
+            text = render_daily_summary(completed_keys, schedule)
+            yield user_id, None, encode_payload(text, parse_mode="Markdown")
+            continue
+
+        mask &= full_mask
+        completed_total += mask.bit_count()
+        yield user_id, None, payloads[mask]
+
+    if user_ids:
+        logger.info(
+            f"Сводка дня: {len(user_ids)} пользователей, "
+            f"в среднем {completed_total / len(user_ids):.1f} задач на пользователя."
+        )
 
 
+async def _enqueue_daily_summaries(due_minute: Optional[int] = None):
+    """
+    Ставит в outbox сводки дня тем, чей слот сводки приходится на минуту суток
+    due_minute (UTC), — у них по местному времени наступило DAILY_SUMMARY_TIME, и
+    сводка подводит их текущий день. Без due_minute — всем активным пользователям.
+    """
+    # Сводки собираются (чтения расписаний, рендеринг) до транзакции писателя,
+    # которая держится только на время вставки в outbox
+    items = await run_db(list, _daily_summary_items(due_minute))
+    if not items:
+        return
+    job_id = "daily_summary"
+    if due_minute is not None:
+        job_id += f"_{due_minute // 60:02d}:{due_minute % 60:02d}"
+    logger.info("Ставлю %s сводок дня (%s).", len(items), job_id)
+    await enqueue_broadcast(job_id, items, DAILY_SUMMARY_SPREAD_SECONDS, spread_key="daily_summary")
+
+
+@leader_only
+@profiled("job")
 async def send_daily_summary_job(app: Application):
-    """Задача: отправить в конце дня сводку о выполненных задачах."""
-    logger.info("Запускаю рассылку ежедневных сводок.")
-    user_ids = get_all_active_user_ids()
-
-    for user_id in user_ids:
-        try:
-            tasks_status = get_today_tasks_status(user_id)
-            completed_tasks = [
-                SCHEDULE[key]["button_text"].replace(" ✅", "")
-                for key, done in tasks_status.items()
-                if done
-            ]
-
-            if completed_tasks:
-                summary = "🌟 **Сводка дня:**\n\n"
-                summary += "\n".join(f"✅ {name}" for name in completed_tasks)
-                summary += f"\n\nОтличная работа! Выполнено задач: **{len(completed_tasks)}** 💪"
-            else:
-                summary = "📅 Сегодня не было выполненных задач. Новый день — новые достижения!"
-
-            await app.bot.send_message(chat_id=user_id, text=summary, parse_mode="Markdown")
-            await asyncio.sleep(0.1)
-        except Exception as e:
-            logger.error(f"Не удалось отправить сводку пользователю {user_id}: {e}")
+    """
+    Задача: отправить сводку дня сразу всем активным пользователям (ручной запуск,
+    бенчмарки). По расписанию сводки рассылает dispatch_reminders_job.
+    """
+    await _enqueue_daily_summaries()
 
 
+@leader_only
+@profiled("job")
 async def send_motivational_message_job(app: Application):
     """Задача: отправить случайное мотивационное сообщение."""
     logger.info("Запускаю рассылку мотивационных сообщений.")
@@ -90,13 +192,12 @@ async def send_motivational_message_job(app: Application):
     if not message:
         return
 
-    user_ids = get_all_active_user_ids()
-    for user_id in user_ids:
-        try:
-            await app.bot.send_message(chat_id=user_id, text=message)
-            await asyncio.sleep(0.1)
-        except Exception as e:
-            logger.error(f"Не удалось отправить мотивацию пользователю {user_id}: {e}")
+    payload = encode_payload(message)
+    # Выборка получателей — в исполнителе БД, а не в event loop
+    items = await run_db(
+        lambda: [(user_id, None, payload) for user_id in database.get_all_active_user_ids() or []]
+    )
+    await enqueue_broadcast("motivational", items, MOTIVATIONAL_SPREAD_SECONDS)
 
 
 # --- Управление планировщиком ---
@@ -107,31 +208,33 @@ async def start_scheduler(app: Application):
     Инициализирует и запускает все задачи в планировщике.
     Вызывается один раз при старте бота через post_init.
     """
-    # 1. Добавляем задачу-напоминание для каждого элемента в SCHEDULE
-    for task_key, config in SCHEDULE.items():
-        task_time = config["time"]
-        scheduler.add_job(
-            send_reminder_job,
-            trigger="cron",
-            hour=task_time.hour,
-            minute=task_time.minute,
-            args=[app, task_key],
-            id=f"reminder_{task_key}",  # Уникальный ID для каждой задачи
-        )
-        logger.info(
-            f"Задача-напоминание '{task_key}' запланирована на {task_time.strftime('%H:%M')}."
-        )
-
-    # 2. Добавляем задачу для ежедневной сводки
+    # 1. Напоминания: слоты по UTC-минутам с учётом часовых поясов пользователей
+    #    строятся заранее, диспетчер раз в минуту выбирает наступившие
+    if scheduler_lease.is_leader:
+        await refresh_reminder_slots()
+    scheduler.add_job(
+        leader_only(refresh_reminder_slots),
+        trigger="interval",
+        seconds=REMINDER_SLOTS_REFRESH_INTERVAL,
+        id="reminder_slots_refresh",
+    )
     scheduler.add_job(
-        send_daily_summary_job,
+        dispatch_reminders_job,
         trigger="cron",
-        hour=22,
-        minute=0,
+        minute="*",
         args=[app],
-        id="daily_summary",
+        id="reminder_dispatch",
+        max_instances=1,
+        coalesce=True,
+    )
+    logger.info("Диспетчер напоминаний запущен (проверка каждую минуту).")
+
+    # 2. Сводки дня рассылает тот же диспетчер: у каждого пользователя есть слот
+    #    на DAILY_SUMMARY_TIME по его местному времени
+    logger.info(
+        "Ежедневная сводка — в %s по местному времени пользователей.",
+        DAILY_SUMMARY_TIME.strftime("%H:%M"),
     )
-    logger.info("Задача для ежедневной сводки запланирована на 22:00.")
 
     # 3. Добавляем задачу для мотивационных сообщений (например, в 10, 14, 18 часов)
     scheduler.add_job(
@@ -144,6 +247,22 @@ async def start_scheduler(app: Application):
     )
     logger.info("Задача для мотивационных сообщений запланирована на 10:05, 14:05, 18:05.")
 
+    # 4. Периодически сбрасываем накопленную активность пользователей в БД
+    scheduler.add_job(
+        activity_buffer.flush,
+        trigger="interval",
+        seconds=ACTIVITY_FLUSH_INTERVAL,
+        id="activity_flush",
+    )
+
+    # 5. Возвращаем в очередь строки outbox, зависшие у упавших экземпляров
+    scheduler.add_job(
+        leader_only(requeue_stale_claims),
+        trigger="interval",
+        seconds=OUTBOX_CLAIM_TIMEOUT,
+        id="outbox_requeue",
+    )
+
     # Запускаем сам планировщик
     scheduler.start()
     logger.info("Планировщик запущен со всеми задачами.")
@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from datetime import datetime, time
+from typing import Optional
+
+from config import MAX_CUSTOM_TASKS, SCHEDULE, STATUS_CACHE_SIZE
+
+# Ключи пользовательских задач: custom_1 ... custom_<MAX_CUSTOM_TASKS>.
+# Ключи общие для всех пользователей, поэтому им заранее назначаются биты масок.
+CUSTOM_TASK_PREFIX = "custom_"
+CUSTOM_TASK_KEYS = [f"{CUSTOM_TASK_PREFIX}{n}" for n in range(1, MAX_CUSTOM_TASKS + 1)]
+
+# Расписание пользователя: task_key -> {"time", "message", "button_text"}
+Schedule = dict[str, dict]
+# Строка user_tasks: (task_key, время "HH:MM" или None, название или None, удалена ли)
+Override = tuple[str, Optional[str], Optional[str], int]
+
+
+def parse_task_time(text: str) -> Optional[time]:
+    """Разбирает время задачи в формате ЧЧ:ММ (например, 07:30 или 7:30)."""
+    try:
+        return datetime.strptime(text.strip(), "%H:%M").time()
+    except ValueError:
+        return None
+
+
+def custom_task_config(task_time: time, title: str) -> dict:
+    """Описание пользовательской задачи в том же виде, что и записи SCHEDULE."""
+    return {"time": task_time, "message": f"⏰ Время: {title}!", "button_text": f"{title} ✅"}
+
+
+def build_schedule(overrides: Iterable[Override]) -> Schedule:
+    """
+    Применяет переопределения пользователя к общему SCHEDULE: перенос времени,
+    удаление задач и добавление своих. Без переопределений возвращается сам
+    SCHEDULE — результат нельзя изменять.
+    """
+    overrides = list(overrides)
+    if not overrides:
+        return SCHEDULE
+
+    schedule = dict(SCHEDULE)
+    for task_key, time_text, title, removed in overrides:
+        if removed:
+            schedule.pop(task_key, None)
+            continue
+        task_time = parse_task_time(time_text) if time_text else None
+        base = SCHEDULE.get(task_key)
+        if base is not None:
+            schedule[task_key] = {**base, "time": task_time or base["time"]}
+        elif task_time is not None:
+            schedule[task_key] = custom_task_config(task_time, title or task_key)
+    return schedule
+
+
+def ordered_task_keys(schedule: Schedule) -> list[str]:
+    """Ключи задач по времени — в этом порядке задачи нумеруются в /schedule."""
+    return [task_key for task_key, _ in sorted(schedule.items(), key=lambda item: item[1]["time"])]
+
+
+class ScheduleCache:
+    """
+    LRU-кэш действующего расписания по user_id. Пользователи без переопределений
+    хранят ссылку на общий SCHEDULE. Загрузка, начатая до изменения расписания
+    любого пользователя, в кэш не попадает (изменения редки).
+    """
+
+    def __init__(self, maxsize: int = STATUS_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[int, Schedule] = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, user_id: int) -> Optional[Schedule]:
+        with self._lock:
+            schedule = self._entries.get(user_id)
+            if schedule is not None:
+                self._entries.move_to_end(user_id)
+            return schedule
+
+    def begin_load(self) -> int:
+        with self._lock:
+            return self._writes
+
+    def put(self, user_id: int, schedule: Schedule, token: int):
+        with self._lock:
+            if token != self._writes:
+                return
+            self._entries[user_id] = schedule
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._writes += 1
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._writes += 1
+            self._entries.clear()
+
+
+schedule_cache = ScheduleCache()
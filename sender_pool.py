@@ -0,0 +1,156 @@
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import queue
+import signal
+from typing import Any
+
+from telegram import Bot
+
+import async_db
+import database
+from config import BOT_TOKEN, INSTANCE_ID, SHARD_COUNT, SHARD_INDEX
+from http_pool import build_request
+from logs import setup_logging
+from outbox import OutboxWorker, attach_worker, resume_outbox
+
+logger = logging.getLogger(__name__)
+
+# Как часто процесс-отправитель проверяет, жив ли основной процесс, секунды
+PARENT_CHECK_INTERVAL = 1.0
+
+
+def sub_shard(index: int, processes: int) -> tuple[int, int]:
+    """
+    Шард процесса-отправителя index из processes: (shard_index, shard_count).
+    Шард экземпляра (SHARD_INDEX из SHARD_COUNT) делится на processes частей,
+    так что процессы разных экземпляров не пересекаются.
+    """
+    return SHARD_INDEX + SHARD_COUNT * index, SHARD_COUNT * processes
+
+
+def _parent_alive() -> bool:
+    parent = multiprocessing.parent_process()
+    return parent is None or parent.is_alive()
+
+
+async def run_sender(index: int, processes: int, wakeups: Any, bot: Bot):
+    """
+    Цикл процесса-отправителя: воркер outbox своего подшарда, который просыпается
+    по сигналам из очереди wakeups. None в очереди (или смерть основного
+    процесса) — сигнал остановки.
+    """
+    shard_index, shard_count = sub_shard(index, processes)
+    instance_id = f"{INSTANCE_ID}/{index}"
+    await resume_outbox(instance_id)
+    worker = OutboxWorker(
+        bot, shard_index=shard_index, shard_count=shard_count, instance_id=instance_id
+    )
+    worker.start()
+    logger.info(f"Процесс-отправитель {instance_id}: шард {shard_index} из {shard_count}.")
+
+    while True:
+        try:
+            message = await asyncio.to_thread(wakeups.get, True, PARENT_CHECK_INTERVAL)
+        except queue.Empty:
+            if _parent_alive():
+                continue
+            logger.warning(f"Основной процесс завершился, останавливаю {instance_id}.")
+            break
+        if message is None:
+            break
+        worker.notify()
+
+    await worker.stop()
+
+
+def _sender_process(index: int, processes: int, database_path: str, wakeups: Any):
+    """Точка входа процесса-отправителя: свой Bot (HTTP-сессия) и свои соединения с БД."""
+    # Ctrl+C получает вся группа процессов; останавливает отправителей основной процесс
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(
+        filename=None,
+        text_format="%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    database.DATABASE_PATH = database_path
+
+    async def main():
+        async with Bot(BOT_TOKEN, request=build_request(f"sender-{index}")) as bot:
+            await run_sender(index, processes, wakeups, bot)
+
+    try:
+        asyncio.run(main())
+    finally:
+        async_db.shutdown()
+        database.close_db()
+
+
+class SenderPool:
+    """
+    Пул процессов-отправителей. Основной процесс только ставит пакеты в outbox
+    и будит процессы через их очереди, а подготовка и отправка сообщений идут
+    в отдельных процессах и не задерживают обработку обновлений.
+    """
+
+    def __init__(self, processes: int):
+        self.processes = processes
+        # spawn: дочерний процесс не наследует event loop и соединения SQLite
+        self._context = multiprocessing.get_context("spawn")
+        self._queues: list[Any] = []
+        self._procs: list[multiprocessing.process.BaseProcess] = []
+
+    def _spawn(self, index: int) -> multiprocessing.process.BaseProcess:
+        proc = self._context.Process(
+            target=_sender_process,
+            args=(index, self.processes, database.DATABASE_PATH, self._queues[index]),
+            name=f"sender-{index}",
+            daemon=True,
+        )
+        proc.start()
+        return proc
+
+    def start(self):
+        # Одного сигнала в очереди достаточно: лишние пробуждения схлопываются
+        self._queues = [self._context.Queue(maxsize=1) for _ in range(self.processes)]
+        self._procs = [self._spawn(index) for index in range(self.processes)]
+
+    def notify(self):
+        """Будит все процессы после постановки нового пакета; упавшие перезапускает."""
+        for index, (proc, wakeups) in enumerate(zip(self._procs, self._queues)):
+            if not proc.is_alive():
+                logger.warning(
+                    f"Процесс {proc.name} завершился (код {proc.exitcode}), перезапускаю."
+                )
+                self._procs[index] = self._spawn(index)
+            with contextlib.suppress(queue.Full):
+                wakeups.put_nowait(True)
+
+    async def stop(self, timeout: float = 10.0):
+        """Просит процессы дослать текущую страницу и завершиться."""
+        for proc, wakeups in zip(self._procs, self._queues):
+            if not proc.is_alive():
+                continue
+            # Очередь может быть занята сигналом пробуждения — ждём места
+            with contextlib.suppress(queue.Full):
+                await asyncio.to_thread(wakeups.put, None, True, timeout)
+        for proc in self._procs:
+            await asyncio.to_thread(proc.join, timeout)
+            if proc.is_alive():
+                logger.warning(f"Процесс {proc.name} не остановился вовремя, завершаю.")
+                proc.terminate()
+                await asyncio.to_thread(proc.join)
+        self._queues.clear()
+        self._procs.clear()
+
+
+async def start_sender_pool(processes: int):
+    """
+    Запускает процессы-отправители вместо воркера outbox в основном процессе
+    (останавливаются через outbox.stop_outbox_worker).
+    """
+    await resume_outbox()
+    pool = SenderPool(processes)
+    pool.start()
+    attach_worker(pool)
+    logger.info(f"Рассылки отправляют {processes} процесс(ов).")
@@ -0,0 +1,128 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+from config import STATUS_CACHE_SIZE
+from timezones import local_date
+
+# Сколько последних дней (включая сегодня) хранится в счётчиках
+STATUS_WINDOW_DAYS = 7
+
+
+@dataclass
+class DailyStatus:
+    """Состояние пользователя на день: битовая маска выполненных сегодня задач
+    и количество выполненных задач за каждый из последних STATUS_WINDOW_DAYS дней.
+    Дни считаются по местному времени пользователя (пояс timezone)."""
+
+    day: date
+    completed_mask: int
+    daily_counts: list[int]  # от самого старого дня к сегодняшнему
+    timezone: Optional[str] = None
+
+    def roll_to(self, today: date):
+        """Сдвигает окно счётчиков на новый день (переход через полночь)."""
+        shift = (today - self.day).days
+        if shift <= 0:
+            return
+        if shift >= STATUS_WINDOW_DAYS:
+            self.daily_counts = [0] * STATUS_WINDOW_DAYS
+        else:
+            self.daily_counts = self.daily_counts[shift:] + [0] * shift
+        self.completed_mask = 0
+        self.day = today
+
+
+class StatusCache:
+    """
+    Ограниченный LRU-кэш DailyStatus по user_id. Заполняется при чтении из БД
+    и обновляется сквозной записью из mark_task_completed. Потокобезопасен:
+    к нему обращаются потоки исполнителя БД и event loop.
+    """
+
+    def __init__(self, maxsize: int = STATUS_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, DailyStatus] = OrderedDict()
+        self._lock = threading.Lock()
+        # Номера последних записей по пользователям: не даём загрузке, начатой
+        # до записи, положить в кэш устаревшее состояние
+        self._seq = 0
+        self._floor = 0
+        self._user_writes: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: int, today: Optional[date] = None) -> Optional[DailyStatus]:
+        """
+        Возвращает копию записи на сегодня (с учётом перехода через полночь) или None.
+        По умолчанию «сегодня» — по местному времени пользователя.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and today is None:
+                today = local_date(entry.timezone)
+            if entry is None or entry.day > today:
+                self.misses += 1
+                return None
+            entry.roll_to(today)
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return DailyStatus(
+                entry.day, entry.completed_mask, list(entry.daily_counts), entry.timezone
+            )
+
+    def begin_load(self) -> int:
+        """Возвращает метку, которую нужно передать в put() после чтения из БД."""
+        with self._lock:
+            return self._seq
+
+    def _note_write(self, user_id: int):
+        self._seq += 1
+        self._user_writes[user_id] = self._seq
+        if len(self._user_writes) > self.maxsize:
+            self._user_writes.clear()
+            self._floor = self._seq
+
+    def put(self, user_id: int, status: DailyStatus, token: Optional[int] = None):
+        """Кладёт запись в кэш, если с момента begin_load() пользователь не менялся."""
+        with self._lock:
+            if token is not None and (
+                token < self._floor or self._user_writes.get(user_id, -1) > token
+            ):
+                return
+            self._entries[user_id] = status
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def mark_completed(self, user_id: int, today: date, bit: int):
+        """Сквозная запись: отмечает выполнение задачи, если пользователь уже в кэше."""
+        with self._lock:
+            self._note_write(user_id)
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            if entry.day > today:
+                del self._entries[user_id]
+                return
+            entry.roll_to(today)
+            if not entry.completed_mask & bit:
+                entry.completed_mask |= bit
+                entry.daily_counts[-1] += 1
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._note_write(user_id)
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+status_cache = StatusCache()
@@ -0,0 +1,20 @@
+"""Shared fixtures."""
+
+import os
+import tempfile
+
+import pytest
+
+import database as db_module
+
+
+@pytest.fixture
+def temp_db(monkeypatch):
+    """Use a temporary, initialized database file for the test; yields its path."""
+    with tempfile.NamedTemporaryFile(suffix=".db", delete=False) as tmp:
+        tmp_path = tmp.name
+    monkeypatch.setattr(db_module, "DATABASE_PATH", tmp_path)
+    db_module.init_db()
+    yield tmp_path
+    db_module.close_db()
+    os.unlink(tmp_path)
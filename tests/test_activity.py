@@ -0,0 +1,54 @@
+"""Tests for activity.py — write-behind buffer for users.last_activity."""
+
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import database as db_module
+from activity import ActivityBuffer
+
+pytestmark = pytest.mark.usefixtures("temp_db")
+
+
+def read_last_activity(user_id):
+    conn = sqlite3.connect(db_module.DATABASE_PATH)
+    row = conn.execute("SELECT last_activity FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    conn.close()
+    return datetime.fromisoformat(row[0])
+
+
+def test_touch_coalesces_per_user():
+    buffer = ActivityBuffer()
+    for _ in range(5):
+        buffer.touch(1)
+    buffer.touch(2)
+    assert len(buffer) == 2
+
+
+def test_flush_writes_batched_activity():
+    db_module.register_user(user_id=1, username=None, first_name=None)
+    db_module.register_user(user_id=2, username=None, first_name=None)
+    before = read_last_activity(1)
+
+    buffer = ActivityBuffer()
+    buffer.touch(1)
+    buffer.touch(2)
+    assert asyncio.run(buffer.flush()) == 2
+    assert len(buffer) == 0
+    assert read_last_activity(1) >= before
+
+
+def test_flush_empty_buffer_is_noop():
+    assert asyncio.run(ActivityBuffer().flush()) == 0
+
+
+def test_restore_keeps_newer_touch():
+    buffer = ActivityBuffer()
+    buffer.touch(1)
+    newer = buffer._drain()[0][1]
+    buffer._restore([(1, newer - timedelta(minutes=5))])
+    buffer.touch(1)
+    buffer._restore([(1, newer - timedelta(minutes=10))])
+    assert buffer._drain()[0][1] >= newer
@@ -0,0 +1,42 @@
+"""Tests for async_db.py — async facade over database.py."""
+
+import asyncio
+
+import pytest
+
+import async_db
+
+pytestmark = pytest.mark.usefixtures("temp_db")
+
+
+def test_async_wrappers_return_database_results():
+    async def scenario():
+        await async_db.register_user(user_id=1, username="test", first_name="Test")
+        assert await async_db.mark_task_completed(1, "lunch") is True
+        assert await async_db.mark_task_completed(1, "lunch") is False
+        return await async_db.get_today_tasks_status(1)
+
+    status = asyncio.run(scenario())
+    assert status["lunch"] is True
+    assert status["dinner"] is False
+
+
+def test_run_db_executes_off_the_event_loop_thread():
+    import threading
+
+    async def scenario():
+        return await async_db.run_db(threading.get_ident)
+
+    assert asyncio.run(scenario()) != threading.get_ident()
+
+
+def test_run_db_records_wait_metrics():
+    calls_before = async_db.stats.calls
+
+    async def scenario():
+        await asyncio.gather(*(async_db.get_all_active_user_ids() for _ in range(5)))
+
+    asyncio.run(scenario())
+    assert async_db.stats.calls == calls_before + 5
+    assert async_db.stats.queue_depth == 0
+    assert async_db.stats.wait_seconds_max >= 0
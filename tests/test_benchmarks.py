@@ -0,0 +1,38 @@
+"""Smoke test for benchmarks/ — the suite must stay runnable offline."""
+
+import json
+
+import database as db_module
+from benchmarks import run
+
+
+def test_benchmark_suite_runs_on_tiny_dataset(tmp_path):
+    orig_path = db_module.DATABASE_PATH
+    output = tmp_path / "results.json"
+    results = run.main(
+        [
+            "--users",
+            "40",
+            "--days",
+            "3",
+            "--calls",
+            "5",
+            "--latency",
+            "0",
+            "--data-dir",
+            str(tmp_path),
+            "--output",
+            str(output),
+        ]
+    )
+
+    # The suite works on its own copy of the data and restores the module state
+    restored_path = db_module.DATABASE_PATH
+    assert restored_path == orig_path
+    names = {result.name for result in results}
+    assert {"get_completion_rate", "mark_task_completed", "job:daily_summary"} <= names
+    saved = json.loads(output.read_text())
+    assert saved["meta"]["users"] == [40]
+    summary = next(r for r in saved["results"] if r["name"] == "job:daily_summary")
+    assert summary["calls"] > 0
+    assert summary["p99_ms"] >= summary["p50_ms"]
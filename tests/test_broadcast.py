@@ -0,0 +1,124 @@
+"""Tests for broadcast.py — uses a fake bot instead of the Telegram API."""
+
+import asyncio
+
+from telegram.error import Forbidden, RetryAfter
+
+from broadcast import PerChatLimiter, TokenBucket, broadcast
+
+
+class FakeBot:
+    def __init__(self, fail_for=None, retry_after_for=None):
+        self.sent = []
+        self.fail_for = fail_for or {}
+        self.retry_after_for = set(retry_after_for or ())
+
+    async def send_message(self, chat_id, **kwargs):
+        if chat_id in self.retry_after_for:
+            self.retry_after_for.discard(chat_id)
+            raise RetryAfter(0)
+        if chat_id in self.fail_for:
+            raise self.fail_for[chat_id]
+        self.sent.append((chat_id, kwargs))
+
+
+def run_broadcast(bot, recipients, build_message, **kwargs):
+    kwargs.setdefault("limiter", TokenBucket(10_000))
+    kwargs.setdefault("per_chat", PerChatLimiter(0))
+    return asyncio.run(broadcast(bot, "test", recipients, build_message, **kwargs))
+
+
+def test_broadcast_sends_to_all_recipients():
+    bot = FakeBot()
+    stats = run_broadcast(bot, range(50), lambda user_id: {"text": f"hi {user_id}"})
+    assert stats.total == 50
+    assert stats.sent == 50
+    assert sorted(chat_id for chat_id, _ in bot.sent) == list(range(50))
+
+
+def test_broadcast_skips_recipients_without_message():
+    bot = FakeBot()
+    stats = run_broadcast(bot, range(10), lambda user_id: None if user_id % 2 else {"text": "x"})
+    assert stats.sent == 5
+    assert stats.skipped == 5
+
+
+def test_broadcast_accepts_async_builder():
+    async def build(user_id):
+        return {"text": str(user_id)}
+
+    bot = FakeBot()
+    stats = run_broadcast(bot, [1, 2, 3], build)
+    assert stats.sent == 3
+
+
+def test_broadcast_retries_after_retry_after():
+    bot = FakeBot(retry_after_for=[1])
+    stats = run_broadcast(bot, [1, 2], lambda user_id: {"text": "x"})
+    assert stats.sent == 2
+    assert stats.retries == 1
+
+
+def test_broadcast_counts_failures_without_retry():
+    bot = FakeBot(fail_for={2: Forbidden("blocked")})
+    stats = run_broadcast(bot, [1, 2, 3], lambda user_id: {"text": "x"})
+    assert stats.sent == 2
+    assert stats.failed == 1
+    assert stats.retries == 0
+
+
+def test_broadcast_respects_concurrency_limit():
+    in_flight = 0
+    peak = 0
+
+    class SlowBot:
+        async def send_message(self, chat_id, **kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.001)
+            in_flight -= 1
+
+    stats = run_broadcast(SlowBot(), range(40), lambda user_id: {"text": "x"}, concurrency=4)
+    assert stats.sent == 40
+    assert peak == 4
+
+
+def test_token_bucket_limits_rate():
+    async def acquire_many():
+        bucket = TokenBucket(rate=200, capacity=1)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(11):
+            await bucket.acquire()
+        return loop.time() - start
+
+    # 10 tokens beyond the initial one at 200 tokens/s take at least ~50 ms
+    assert asyncio.run(acquire_many()) >= 0.045
+
+
+def test_broadcast_accepts_async_recipients():
+    async def recipients():
+        for user_id in range(20):
+            await asyncio.sleep(0)
+            yield user_id
+
+    bot = FakeBot()
+    stats = run_broadcast(bot, recipients(), lambda user_id: {"text": "x"}, concurrency=5)
+    assert stats.sent == 20
+    assert sorted(chat_id for chat_id, _ in bot.sent) == list(range(20))
+
+
+def test_broadcast_reports_results_per_item():
+    bot = FakeBot(fail_for={2: Forbidden("blocked")})
+    results = {}
+    rows = [{"id": 10, "user_id": 1}, {"id": 20, "user_id": 2}]
+    stats = run_broadcast(
+        bot,
+        rows,
+        lambda row: {"text": "x"},
+        chat_id_of=lambda row: row["user_id"],
+        on_result=lambda row, ok: results.__setitem__(row["id"], ok),
+    )
+    assert stats.sent == 1
+    assert results == {10: True, 20: False}
@@ -0,0 +1,145 @@
+"""Tests for the compact (bitmask per user and day) storage mode in database.py."""
+
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import database as db_module
+from config import SCHEDULE
+from status_cache import status_cache
+
+
+@pytest.fixture(autouse=True)
+def compact_db(monkeypatch, request):
+    """Use a temporary database file in compact storage mode for each test."""
+    monkeypatch.setattr(db_module, "COMPACT_STORAGE", True)
+    return request.getfixturevalue("temp_db")
+
+
+def count_rows(path, table):
+    conn = sqlite3.connect(path)
+    count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_completions_are_stored_as_one_row_per_day(compact_db):
+    for task_key in SCHEDULE:
+        assert db_module.mark_task_completed(1, task_key) is True
+    assert count_rows(compact_db, "daily_completions") == 1
+    assert count_rows(compact_db, "tasks") == 0
+
+
+def test_duplicate_completion_returns_false():
+    assert db_module.mark_task_completed(1, "lunch") is True
+    assert db_module.mark_task_completed(1, "lunch") is False
+
+
+def test_status_and_stats_read_from_bitmask():
+    db_module.mark_task_completed(1, "breakfast")
+    db_module.mark_task_completed(1, "dinner")
+    status_cache.clear()
+
+    status = db_module.get_today_tasks_status(1)
+    assert status["breakfast"] is True
+    assert status["lunch"] is False
+    assert db_module.is_task_completed_today(1, "dinner") is True
+
+    stats = db_module.get_user_stats(1, days=7)
+    assert stats == {
+        date.today().isoformat(): [
+            SCHEDULE["breakfast"]["button_text"],
+            SCHEDULE["dinner"]["button_text"],
+        ]
+    }
+
+
+def test_completion_rate_matches_row_storage():
+    db_module.mark_task_completed(1, "lunch")
+    expected = 1 / len(SCHEDULE) * 100
+    assert db_module.get_completion_rate(1, days=7) == pytest.approx(expected)
+    assert db_module.get_completion_rate(1, days=30) == pytest.approx(expected)
+
+
+def test_init_db_backfills_existing_rows(monkeypatch):
+    monkeypatch.setattr(db_module, "COMPACT_STORAGE", False)
+    db_module.init_db()
+    db_module.mark_task_completed(5, "lunch")
+    db_module.mark_task_completed(5, "dinner")
+
+    monkeypatch.setattr(db_module, "COMPACT_STORAGE", True)
+    db_module.init_db()
+    assert db_module.get_today_tasks_status(5)["dinner"] is True
+    assert db_module.mark_task_completed(5, "lunch") is False
+
+
+def test_upgrade_from_row_storage_builds_daily_stats(monkeypatch, tmp_path):
+    """A pre-migration database opened in compact mode keeps its long-window history."""
+    db_module.close_db()
+    path = str(tmp_path / "legacy.db")
+    monkeypatch.setattr(db_module, "DATABASE_PATH", path)
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE users (
+            user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT,
+            last_activity TIMESTAMP NOT NULL
+        );
+        CREATE TABLE tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+            task_key TEXT NOT NULL, completion_date DATE NOT NULL,
+            completion_time TIMESTAMP NOT NULL
+        );
+    """)
+    day = date.today() - timedelta(days=10)
+    conn.executemany(
+        "INSERT INTO tasks (user_id, task_key, completion_date, completion_time)"
+        " VALUES (?, ?, ?, ?)",
+        [(7, task_key, day, datetime.now()) for task_key in ("breakfast", "lunch")],
+    )
+    conn.commit()
+    conn.close()
+
+    db_module.init_db()
+    expected = 2 / len(SCHEDULE) * 100
+    assert db_module.get_completion_rate(7, days=30) == pytest.approx(expected)
+    assert db_module.get_completion_rate(7, days=90) == pytest.approx(expected)
+    assert count_rows(path, "daily_completions") == 1
+
+
+def test_switching_back_to_rows_keeps_completions(monkeypatch, compact_db):
+    db_module.mark_task_completed(5, "lunch")
+    db_module.mark_task_completed(5, "dinner")
+
+    monkeypatch.setattr(db_module, "COMPACT_STORAGE", False)
+    db_module.init_db()
+    assert count_rows(compact_db, "tasks") == 2
+    assert db_module.get_today_tasks_status(5)["dinner"] is True
+    assert db_module.mark_task_completed(5, "lunch") is False
+    assert db_module.get_completion_rate(5, days=30) == pytest.approx(2 / len(SCHEDULE) * 100)
+
+    db_module.init_db()  # idempotent
+    assert count_rows(compact_db, "tasks") == 2
+
+
+def test_restart_in_same_mode_skips_conversion(compact_db):
+    assert db_module.get_scheduler_state(db_module.STORAGE_MODE_KEY) == "compact"
+    # A stray row in tasks is not folded into the masks unless the mode changes
+    conn = sqlite3.connect(compact_db)
+    with conn:
+        conn.execute(
+            "INSERT INTO tasks (user_id, task_key, completion_date, completion_time)"
+            " VALUES (5, 'lunch', ?, ?)",
+            (date.today().isoformat(), datetime.now().isoformat()),
+        )
+    conn.close()
+
+    db_module.init_db()
+    assert count_rows(compact_db, "daily_completions") == 0
+
+
+def test_task_bits_are_stable_across_restarts(compact_db):
+    bits_before = dict(db_module.TASK_BITS)
+    db_module.close_db()
+    db_module.init_db()
+    assert bits_before == db_module.TASK_BITS
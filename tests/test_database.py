@@ -2,14 +2,18 @@
 
 import os
 import tempfile
-from datetime import date
+from datetime import date, time
 
 import pytest
+import pytz
 
+import db_pool
 from config import DATABASE_PATH, SCHEDULE
 from database import (
+    SCHEMA_VERSION,
     get_all_active_user_ids,
     get_completion_rate,
+    get_today_completion_masks,
     get_today_tasks_status,
     get_user_stats,
     init_db,
@@ -30,6 +34,7 @@ def temp_db():
     db_module.DATABASE_PATH = tmp_path
     init_db()
     yield
+    db_module.close_db()
     os.unlink(tmp_path)
     db_module.DATABASE_PATH = orig_path
 
@@ -160,3 +165,376 @@ def test_multiple_days_stats():
     today_str = date.today().isoformat()
     assert today_str in stats
     assert len(stats[today_str]) == 2
+
+
+def test_connections_use_wal_mode():
+    import sqlite3
+
+    import database as db_module
+
+    register_user(user_id=1, username="test", first_name="Test")
+    conn = sqlite3.connect(db_module.DATABASE_PATH)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+
+
+def test_init_db_records_schema_version():
+    import sqlite3
+
+    import database as db_module
+
+    init_db()  # re-running migrations must be a no-op
+    conn = sqlite3.connect(db_module.DATABASE_PATH)
+    versions = [row[0] for row in conn.execute("SELECT version FROM schema_version")]
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    conn.close()
+    assert versions == sorted(set(versions))
+    assert max(versions) == SCHEMA_VERSION
+    assert {"idx_users_active_tz", "idx_tasks_user_date"} <= indexes
+
+
+@pytest.fixture
+def traced_statements(monkeypatch):
+    """Collect every SQL statement executed through the connection pool."""
+    import database as db_module
+
+    statements = []
+    original_connect = db_pool.ConnectionPool._connect
+
+    def connect(self):
+        conn = original_connect(self)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    db_module.close_db()
+    monkeypatch.setattr(db_pool.ConnectionPool, "_connect", connect)
+    yield statements
+    db_module.close_db()
+
+
+@pytest.mark.parametrize("compact", [False, True], ids=["rows", "compact"])
+def test_read_queries_do_not_full_scan(traced_statements, monkeypatch, compact):
+    import sqlite3
+
+    import database as db_module
+
+    monkeypatch.setattr(db_module, "COMPACT_STORAGE", compact)
+    init_db()
+    traced_statements.clear()  # startup-only queries over tiny tables are out of scope
+    register_user(user_id=1, username="test", first_name="Test")
+    mark_task_completed(1, "lunch")
+    get_today_tasks_status(1)
+    get_user_stats(1, days=30)
+    get_completion_rate(1, days=7)
+    get_completion_rate(1, days=30)
+    is_task_completed_today(1, "lunch")
+    get_all_active_user_ids()
+    get_today_completion_masks()
+    get_today_completion_masks(22 * 60)
+    db_module.add_custom_task(1, time(7, 0), "Meditation")
+    db_module.get_due_reminders(13 * 60)
+
+    selects = [
+        sql
+        for sql in traced_statements
+        if sql.lstrip().upper().startswith("SELECT") and "schema_version" not in sql
+    ]
+    assert selects
+
+    conn = sqlite3.connect(db_module.DATABASE_PATH)
+    conn.create_function("local_date", 1, lambda timezone_name: None)
+    try:
+        for sql in selects:
+            plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+            for step in plan:
+                # Table lookups must be served by a covering index or the rowid, never a scan
+                assert not step.startswith("SCAN "), f"Full scan {plan} for: {sql}"
+                if step.startswith("SEARCH "):
+                    assert "COVERING INDEX" in step or "PRIMARY KEY" in step, (
+                        f"Non-covering lookup {plan} for: {sql}"
+                    )
+                # Every tasks query is date-bounded, so the index must seek on the date too
+                if step.startswith(("SEARCH tasks ", "SEARCH t ")):
+                    assert "completion_date" in step, f"Unbounded date range {plan} for: {sql}"
+    finally:
+        conn.close()
+
+
+def _insert_history(rows):
+    """Insert past completions directly and rebuild aggregates via migration 4."""
+    import sqlite3
+    from datetime import datetime, timedelta
+
+    import database as db_module
+
+    db_module.close_db()
+    conn = sqlite3.connect(db_module.DATABASE_PATH)
+    for user_id, task_key, days_ago in rows:
+        day = date.today() - timedelta(days=days_ago)
+        conn.execute(
+            "INSERT INTO tasks (user_id, task_key, completion_date, completion_time) "
+            "VALUES (?, ?, ?, ?)",
+            (user_id, task_key, day, datetime.now()),
+        )
+    conn.execute("DELETE FROM schema_version WHERE version >= 4")
+    conn.execute("DROP TABLE daily_stats")
+    conn.commit()
+    conn.close()
+    init_db()
+
+
+def test_completion_rate_long_windows_from_prefix_sums():
+    _insert_history(
+        [
+            (1, "lunch", 3),
+            (1, "dinner", 3),
+            (1, "lunch", 20),
+            (1, "breakfast", 60),
+            (1, "lunch", 200),
+        ]
+    )
+    mark_task_completed(1, "lunch")
+    per_day = len(SCHEDULE)
+    # today + 3 days ago (2 tasks) + 20 days ago
+    assert get_completion_rate(1, days=30) == pytest.approx(4 / (3 * per_day) * 100)
+    # plus 60 days ago
+    assert get_completion_rate(1, days=90) == pytest.approx(5 / (4 * per_day) * 100)
+    assert get_completion_rate(1, days=7) == pytest.approx(3 / (2 * per_day) * 100)
+
+
+def test_daily_stats_maintained_on_completion():
+    import sqlite3
+
+    import database as db_module
+
+    _insert_history([(1, "lunch", 1)])
+    mark_task_completed(1, "breakfast")
+    mark_task_completed(1, "dinner")
+    mark_task_completed(1, "dinner")  # duplicate must not be counted
+
+    conn = sqlite3.connect(db_module.DATABASE_PATH)
+    row = conn.execute(
+        "SELECT completed, cum_completed, cum_active_days FROM daily_stats "
+        "WHERE user_id = 1 AND day = ?",
+        (date.today(),),
+    ).fetchone()
+    conn.close()
+    assert row == (2, 3, 2)
+
+
+@pytest.mark.parametrize("compact", [False, True], ids=["rows", "compact"])
+def test_get_today_completion_masks(monkeypatch, compact):
+    import database as db_module
+
+    monkeypatch.setattr(db_module, "COMPACT_STORAGE", compact)
+    init_db()
+    for user_id in (1, 2):
+        register_user(user_id=user_id, username=None, first_name=None)
+    mark_task_completed(1, "lunch")
+    mark_task_completed(1, "dinner")
+
+    user_ids, masks = get_today_completion_masks()
+    by_user = dict(zip(user_ids, masks))
+    assert by_user == {
+        1: db_module.TASK_BITS["lunch"] | db_module.TASK_BITS["dinner"],
+        2: 0,
+    }
+
+
+def test_summary_goes_out_at_local_evening(monkeypatch):
+    import database as db_module
+
+    monkeypatch.setattr("timezones.TIMEZONE", "UTC")
+    for user_id in (1, 2):
+        register_user(user_id=user_id, username=None, first_name=None)
+    db_module.set_user_timezone(2, "Asia/Tokyo")
+    mark_task_completed(2, "lunch")
+
+    # 22:00 in Tokyo is 13:00 UTC: only the Tokyo user gets the summary
+    user_ids, masks = get_today_completion_masks(13 * 60)
+    assert dict(zip(user_ids, masks)) == {2: db_module.TASK_BITS["lunch"]}
+    user_ids, _ = get_today_completion_masks(22 * 60)
+    assert list(user_ids) == [1]
+    # The summary slot is not a reminder
+    assert [row[:2] for row in db_module.get_due_reminders(13 * 60)] == [(1, "lunch")]
+
+
+def _slots(user_id):
+    import sqlite3
+
+    import database as db_module
+
+    with sqlite3.connect(db_module.DATABASE_PATH) as conn:
+        return dict(
+            conn.execute(
+                "SELECT task_key, due_minute FROM reminder_slots WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        )
+
+
+def test_register_user_builds_reminder_slots(monkeypatch):
+    import database as db_module
+
+    monkeypatch.setattr("timezones.TIMEZONE", "UTC")
+    register_user(user_id=1, username="test", first_name="Test")
+    assert _slots(1)["lunch"] == 13 * 60
+    assert db_module.get_user_timezone(1) is None
+
+
+def test_set_user_timezone_rebuilds_slots(monkeypatch):
+    import database as db_module
+
+    monkeypatch.setattr("timezones.TIMEZONE", "UTC")
+    register_user(user_id=1, username="test", first_name="Test")
+    assert db_module.set_user_timezone(1, "Asia/Tokyo") is True
+    assert db_module.get_user_timezone(1) == "Asia/Tokyo"
+    assert _slots(1)["lunch"] == 4 * 60
+    assert _slots(1)[db_module.SUMMARY_SLOT] == 13 * 60
+    assert len(_slots(1)) == len(SCHEDULE) + 1
+
+    assert db_module.set_user_timezone(1, "Mars/Olympus") is False
+    assert db_module.set_user_timezone(999, "Asia/Tokyo") is False
+
+
+def test_refresh_reminder_slots_rebuilds_changed_zones_only(monkeypatch):
+    import database as db_module
+
+    monkeypatch.setattr("timezones.TIMEZONE", "UTC")
+    register_user(user_id=1, username="a", first_name="A")
+    register_user(user_id=2, username="b", first_name="B")
+    db_module.set_user_timezone(2, "Asia/Tokyo")
+    assert db_module.refresh_reminder_slots() == 2
+    assert db_module.refresh_reminder_slots() == 0
+
+    # Changing the default zone moves users without their own timezone
+    monkeypatch.setattr("timezones.TIMEZONE", "Asia/Tokyo")
+    assert db_module.refresh_reminder_slots() == 1
+    assert _slots(1)["lunch"] == 4 * 60
+    assert _slots(2)["lunch"] == 4 * 60
+
+
+@pytest.mark.parametrize("compact", [False, True], ids=["rows", "compact"])
+def test_get_due_reminders_skips_completed_and_inactive(monkeypatch, compact):
+    import sqlite3
+    from datetime import datetime, timedelta
+
+    import database as db_module
+
+    monkeypatch.setattr(db_module, "COMPACT_STORAGE", compact)
+    monkeypatch.setattr("timezones.TIMEZONE", "UTC")
+    for user_id in (1, 2, 3):
+        register_user(user_id=user_id, username=None, first_name=None)
+    db_module.set_user_timezone(3, "Asia/Tokyo")
+    mark_task_completed(2, "lunch")
+
+    today = date.today()
+    tokyo_today = datetime.now(pytz.timezone("Asia/Tokyo")).date()
+    assert db_module.get_due_reminders(13 * 60) == [(1, "lunch", None, today)]
+    assert db_module.get_due_reminders(4 * 60) == [(3, "lunch", None, tokyo_today)]
+
+    db_module.close_db()
+    with sqlite3.connect(db_module.DATABASE_PATH) as conn:
+        stale = datetime.now() - timedelta(days=db_module.ACTIVE_USER_DAYS + 1)
+        conn.execute("UPDATE users SET last_activity = ? WHERE user_id = 1", (stale,))
+    assert db_module.get_due_reminders(13 * 60) == []
+
+
+def test_today_is_the_users_local_date(monkeypatch):
+    import sqlite3
+    from datetime import datetime
+
+    import database as db_module
+
+    # At any moment one of the extreme zones is on a different date than the server
+    zone = next(
+        name
+        for name in ("Pacific/Kiritimati", "Etc/GMT+12")
+        if datetime.now(pytz.timezone(name)).date() != date.today()
+    )
+    local_today = datetime.now(pytz.timezone(zone)).date()
+    monkeypatch.setattr("timezones.TIMEZONE", "UTC")
+    register_user(user_id=1, username=None, first_name=None)
+    db_module.set_user_timezone(1, zone)
+    lunch_minute = _slots(1)["lunch"]
+
+    # A completion on the server's date is not today's for the user
+    with sqlite3.connect(db_module.DATABASE_PATH) as conn:
+        conn.execute(
+            "INSERT INTO tasks (user_id, task_key, completion_date, completion_time)"
+            " VALUES (1, 'lunch', ?, ?)",
+            (date.today(), datetime.now()),
+        )
+    assert db_module.get_due_reminders(lunch_minute) == [(1, "lunch", None, local_today)]
+    assert get_today_tasks_status(1)["lunch"] is False
+
+    assert mark_task_completed(1, "lunch") is True
+    assert db_module.get_due_reminders(lunch_minute) == []
+    assert db_module.peek_task_completed_today(1, "lunch") is True
+    assert str(local_today) in get_user_stats(1, days=1)
+
+
+def test_schedule_overrides_shape_user_schedule(monkeypatch):
+    import database as db_module
+
+    monkeypatch.setattr("timezones.TIMEZONE", "UTC")
+    register_user(user_id=1, username="test", first_name="Test")
+    register_user(user_id=2, username="other", first_name="Other")
+
+    assert db_module.set_task_time(1, "morning_workout", time(7, 0)) is True
+    assert db_module.remove_task(1, "dinner") is True
+    task_key = db_module.add_custom_task(1, time(6, 30), "Meditation")
+    assert task_key == "custom_1"
+
+    schedule = db_module.get_user_schedule(1)
+    assert schedule["morning_workout"]["time"] == time(7, 0)
+    assert "dinner" not in schedule
+    assert schedule[task_key]["button_text"] == "Meditation ✅"
+    assert db_module.get_user_schedule(2) == SCHEDULE
+
+    slots = _slots(1)
+    assert slots["morning_workout"] == 7 * 60
+    assert slots[task_key] == 6 * 60 + 30
+    assert "dinner" not in slots
+
+    # Custom tasks show up in status and count towards the completion rate
+    assert mark_task_completed(1, task_key) is True
+    status = get_today_tasks_status(1)
+    assert status[task_key] is True
+    assert "dinner" not in status
+    assert get_completion_rate(1, days=7) == pytest.approx(100 / len(schedule))
+    assert db_module.get_due_reminders(7 * 60) == [(1, "morning_workout", None, date.today())]
+
+    # Removing a custom task deletes it; reset restores the shared schedule
+    assert db_module.remove_task(1, task_key) is True
+    assert task_key not in db_module.get_user_schedule(1)
+    db_module.reset_user_schedule(1)
+    assert db_module.get_user_schedule(1) == SCHEDULE
+    assert _slots(1)["dinner"] == SCHEDULE["dinner"]["time"].hour * 60
+
+
+def test_custom_task_limit_and_unknown_tasks(monkeypatch):
+    import database as db_module
+
+    monkeypatch.setattr(db_module, "CUSTOM_TASK_KEYS", ["custom_1", "custom_2"])
+    register_user(user_id=1, username="test", first_name="Test")
+    assert db_module.add_custom_task(1, time(6, 0), "One") == "custom_1"
+    assert db_module.add_custom_task(1, time(6, 5), "Two") == "custom_2"
+    assert db_module.add_custom_task(1, time(6, 10), "Three") is None
+    assert db_module.set_task_time(1, "no_such_task", time(6, 0)) is False
+    assert db_module.remove_task(1, "no_such_task") is False
+
+
+def test_refresh_keeps_override_slots(monkeypatch):
+    import database as db_module
+
+    monkeypatch.setattr("timezones.TIMEZONE", "UTC")
+    register_user(user_id=1, username="test", first_name="Test")
+    db_module.set_task_time(1, "lunch", time(12, 30))
+    db_module.add_custom_task(1, time(6, 0), "Meditation")
+
+    monkeypatch.setattr("timezones.TIMEZONE", "Asia/Tokyo")
+    assert db_module.refresh_reminder_slots() == 1
+    slots = _slots(1)
+    assert slots["lunch"] == 3 * 60 + 30
+    assert slots["custom_1"] == 21 * 60
+    assert slots["breakfast"] == 0
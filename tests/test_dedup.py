@@ -0,0 +1,50 @@
+"""Tests for dedup.py."""
+
+from dedup import CALLBACK_DEDUP, DedupWindow
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_repeat_within_window_is_seen():
+    clock = FakeClock()
+    window = DedupWindow(ttl=5, maxsize=100, clock=clock)
+    misses = CALLBACK_DEDUP.value(result="miss")
+
+    assert not window.seen("a")
+    clock.now = 4.9
+    assert window.seen("a")
+    assert not window.seen("b")
+    assert CALLBACK_DEDUP.value(result="miss") == misses + 2
+
+
+def test_keys_expire_after_ttl():
+    clock = FakeClock()
+    window = DedupWindow(ttl=5, maxsize=100, clock=clock)
+    window.seen("a")
+    clock.now = 5.0
+    assert not window.seen("a")
+    clock.now = 20.0
+    window.seen("b")
+    assert len(window) == 1
+
+
+def test_size_is_bounded():
+    window = DedupWindow(ttl=60, maxsize=3, clock=FakeClock())
+    for key in "abcd":
+        window.seen(key)
+    assert len(window) == 3
+    assert not window.seen("a")  # evicted as the oldest
+
+
+def test_forget_allows_retry():
+    window = DedupWindow(ttl=60, maxsize=10, clock=FakeClock())
+    window.seen("a")
+    window.forget("a")
+    window.forget("missing")
+    assert not window.seen("a")
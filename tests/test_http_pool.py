@@ -0,0 +1,72 @@
+"""Tests for http_pool.py — Bot API connection pools and their counters."""
+
+import asyncio
+
+import httpx
+import pytest
+from telegram.error import TimedOut
+
+import http_pool
+
+
+def make_request(handler, pool_size=4):
+    request = http_pool.InstrumentedRequest("test", connection_pool_size=pool_size)
+    request._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return request
+
+
+def test_counts_concurrent_requests():
+    async def handler(_request):
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"ok": True, "result": True})
+
+    async def scenario():
+        request = make_request(handler)
+        await asyncio.gather(*(request.do_request("https://x/send", "POST") for _ in range(3)))
+        stats = request.stats()
+        await request.shutdown()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert (stats.requests, stats.peak, stats.in_flight) == (3, 3, 0)
+    assert stats.pool_timeouts == 0
+    assert stats.avg_latency > 0
+
+
+def test_load_counts_requests_waiting_for_a_connection():
+    async def handler(_request):
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"ok": True, "result": True})
+
+    async def scenario():
+        request = make_request(handler, pool_size=2)
+        send = request.do_request
+        calls = [asyncio.create_task(send("https://x/send", "POST")) for _ in range(3)]
+        await asyncio.sleep(0)
+        stats = request.stats()
+        await asyncio.gather(*calls)
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert (stats.in_flight, stats.size) == (3, 2)
+    assert stats.load == 1.5
+
+
+def test_counts_pool_timeouts():
+    def handler(_request):
+        raise httpx.PoolTimeout("pool exhausted")
+
+    async def scenario():
+        request = make_request(handler)
+        with pytest.raises(TimedOut):
+            await request.do_request("https://x/send", "POST")
+        return request.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats.requests, stats.pool_timeouts, stats.in_flight) == (1, 1, 0)
+
+
+def test_http2_falls_back_without_h2(monkeypatch):
+    monkeypatch.setattr(http_pool, "BOT_HTTP_VERSION", "2")
+    monkeypatch.setattr(http_pool.importlib.util, "find_spec", lambda name: None)
+    assert http_pool.http_version() == "1.1"
@@ -0,0 +1,58 @@
+"""Tests for leader.py and the lease rows in database.py."""
+
+import asyncio
+import sqlite3
+
+import pytest
+
+import database as db_module
+from leader import LeaderLease
+
+pytestmark = pytest.mark.usefixtures("temp_db")
+
+
+def test_lease_is_exclusive_until_released():
+    assert db_module.try_acquire_lease("scheduler", "a", 30)
+    assert db_module.try_acquire_lease("scheduler", "a", 30)  # renewal
+    assert not db_module.try_acquire_lease("scheduler", "b", 30)
+
+    db_module.release_lease("scheduler", "b")  # not the holder: no effect
+    assert not db_module.try_acquire_lease("scheduler", "b", 30)
+
+    db_module.release_lease("scheduler", "a")
+    assert db_module.try_acquire_lease("scheduler", "b", 30)
+
+
+def test_expired_lease_is_taken_over(temp_db):
+    assert db_module.try_acquire_lease("scheduler", "a", 30)
+    with sqlite3.connect(temp_db) as conn:
+        conn.execute("UPDATE leases SET expires_at = expires_at - 60")
+    assert db_module.try_acquire_lease("scheduler", "b", 30)
+    assert not db_module.try_acquire_lease("scheduler", "a", 30)
+
+
+def test_scheduler_state_roundtrip():
+    assert db_module.get_scheduler_state("reminders_last_minute") is None
+    db_module.set_scheduler_state("reminders_last_minute", "100")
+    db_module.set_scheduler_state("reminders_last_minute", "101")
+    assert db_module.get_scheduler_state("reminders_last_minute") == "101"
+
+
+def test_only_one_instance_becomes_leader():
+    async def scenario():
+        first = LeaderLease("scheduler", holder="a", ttl=30)
+        second = LeaderLease("scheduler", holder="b", ttl=30)
+        await first.start()
+        await second.start()
+        roles = (first.is_leader, second.is_leader)
+
+        # Stopping the leader releases the lease for the other instance
+        await first.stop()
+        await second.renew()
+        handover = (first.is_leader, second.is_leader)
+        await second.stop()
+        return roles, handover
+
+    roles, handover = asyncio.run(scenario())
+    assert roles == (True, False)
+    assert handover == (False, True)
@@ -0,0 +1,85 @@
+"""Tests for logs.py."""
+
+import json
+import logging
+import os
+import tempfile
+
+import pytest
+
+from logs import LOG_DROPPED, JsonFormatter, RateLimitFilter, setup_logging, stop_logging
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_record(msg: str = "user %s failed", args=(1,), lineno: int = 10, level=logging.ERROR):
+    return logging.LogRecord("bot.test", level, "/app/broadcast.py", lineno, msg, args, None)
+
+
+def test_json_formatter_includes_extra_fields():
+    record = make_record()
+    record.job_id = "reminders_08:00"
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "user 1 failed"
+    assert entry["level"] == "ERROR"
+    assert entry["logger"] == "bot.test"
+    assert entry["job_id"] == "reminders_08:00"
+    assert "args" not in entry
+
+
+def test_rate_limit_per_call_site_and_summary():
+    clock = FakeClock()
+    limiter = RateLimitFilter(limit=2, window=10, clock=clock)
+    dropped = LOG_DROPPED.value(reason="rate_limited")
+
+    results = [limiter.filter(make_record(args=(n,))) for n in range(5)]
+    assert results == [True, True, False, False, False]
+    assert LOG_DROPPED.value(reason="rate_limited") == dropped + 3
+    # Another call site has its own budget
+    assert limiter.filter(make_record(lineno=20))
+
+    clock.now = 10.0
+    record = make_record(args=(7,))
+    assert limiter.filter(record)
+    assert record.getMessage() == "user 7 failed [пропущено похожих: 3]"
+    assert record.suppressed == 3
+
+
+def test_critical_and_disabled_limits_pass():
+    limiter = RateLimitFilter(limit=1, window=10, clock=FakeClock())
+    assert limiter.filter(make_record())
+    assert not limiter.filter(make_record())
+    assert limiter.filter(make_record(level=logging.CRITICAL))
+    assert RateLimitFilter(limit=0, window=10).filter(make_record())
+
+
+@pytest.fixture
+def root_logger():
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    stop_logging()
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+def test_pipeline_writes_json_from_background_thread(root_logger):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bot.log")
+        setup_logging(filename=path, fmt="json", level="info")
+        logger = logging.getLogger("bot.pipeline")
+        logger.debug("hidden %s", 1)
+        logger.info("Пользователь %s недоступен", 42, extra={"job_id": "motivational"})
+        stop_logging()
+
+        with open(path, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f]
+    assert len(entries) == 1
+    assert entries[0]["message"] == "Пользователь 42 недоступен"
+    assert entries[0]["job_id"] == "motivational"
@@ -0,0 +1,66 @@
+"""Tests for metrics.py — Prometheus text exposition and instrumentation hooks."""
+
+import asyncio
+
+import pytest
+
+import metrics
+import outbox
+
+pytestmark = pytest.mark.usefixtures("temp_db")
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Register test metrics in a fresh registry."""
+    fresh = metrics.Registry()
+    monkeypatch.setattr(metrics, "REGISTRY", fresh)
+    return fresh
+
+
+def test_counter_and_gauge_render(registry):
+    counter = metrics.Counter("test_total", "Test counter", ["kind"])
+    counter.inc(kind="a")
+    counter.inc(2, kind='quote"d')
+    gauge = metrics.Gauge("test_depth", "Test gauge")
+    gauge.set_function(lambda: 7)
+
+    text = registry.render()
+    assert "# TYPE test_total counter" in text
+    assert 'test_total{kind="a"} 1' in text
+    assert 'test_total{kind="quote\\"d"} 2' in text
+    assert "test_depth 7" in text
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = metrics.Histogram("test_seconds", "Test histogram", ["op"], buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, op="x")
+
+    text = registry.render()
+    assert 'test_seconds_bucket{op="x",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{op="x",le="1"} 2' in text
+    assert 'test_seconds_bucket{op="x",le="+Inf"} 3' in text
+    assert 'test_seconds_count{op="x"} 3' in text
+    assert 'test_seconds_sum{op="x"} 5.55' in text
+
+
+def test_wrong_labels_are_rejected(registry):
+    counter = metrics.Counter("test_total", "Test counter", ["kind"])
+    with pytest.raises(ValueError):
+        counter.inc(other="a")
+
+
+def test_collect_includes_db_timings_and_outbox_depth():
+    outbox.enqueue_batch("reminders_08:15", [(1, None, "{}"), (2, None, "{}")])
+    text = asyncio.run(metrics.REGISTRY.collect())
+    assert 'bot_db_query_duration_seconds_count{function="enqueue_batch"}' in text
+    assert "bot_outbox_pending 2" in text
+
+
+def test_finished_batch_metrics_use_job_without_time():
+    batch = outbox.FinishedBatch(1, "reminders_08:15", total=3, sent=2, failed=1, duration=2.0)
+    before = outbox.BROADCAST_MESSAGES.value(job="reminders", result="sent")
+    batch.record_metrics()
+    assert outbox.BROADCAST_MESSAGES.value(job="reminders", result="sent") == before + 2
+    assert outbox.BROADCAST_THROUGHPUT.value(job="reminders") == 1.0
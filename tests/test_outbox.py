@@ -0,0 +1,274 @@
+"""Tests for outbox.py — durable broadcast queue and its worker."""
+
+import asyncio
+import sqlite3
+
+import pytest
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import Forbidden
+
+import outbox
+from broadcast import PerChatLimiter, TokenBucket
+
+pytestmark = pytest.mark.usefixtures("temp_db")
+
+
+@pytest.fixture(autouse=True)
+def fast_limits(monkeypatch):
+    """Do not throttle sends in tests."""
+    monkeypatch.setattr("broadcast.global_limiter", TokenBucket(10_000))
+    monkeypatch.setattr("broadcast.chat_limiter", PerChatLimiter(0))
+
+
+class FakeBot:
+    def __init__(self, fail_for=None):
+        self.sent = []
+        self.fail_for = fail_for or {}
+
+    async def send_message(self, chat_id, **kwargs):
+        if chat_id in self.fail_for:
+            raise self.fail_for[chat_id]
+        self.sent.append((chat_id, kwargs))
+
+
+def outbox_statuses(path):
+    with sqlite3.connect(path) as conn:
+        return dict(conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+
+
+def test_payload_roundtrip_with_keyboard():
+    button = InlineKeyboardButton("Done", callback_data="complete_lunch")
+    keyboard = InlineKeyboardMarkup([[button]])
+    payload = outbox.encode_payload("Обед", reply_markup=keyboard)
+    message = outbox.decode_payload(payload)
+    assert message["text"] == "Обед"
+    assert message["reply_markup"] == keyboard
+    assert "parse_mode" not in message
+
+
+def test_enqueue_and_claim(temp_db):
+    payload = outbox.encode_payload("hi")
+    batch_id = outbox.enqueue_batch("test", ((user_id, None, payload) for user_id in range(5)))
+
+    first = outbox.claim_rows(3)
+    second = outbox.claim_rows(3)
+    assert [row.user_id for row in first] == [0, 1, 2]
+    assert [row.user_id for row in second] == [3, 4]
+    assert {row.batch_id for row in first + second} == {batch_id}
+    assert outbox.claim_rows(3) == []
+    assert outbox_statuses(temp_db) == {"sending": 5}
+
+
+def test_ack_finishes_batch_and_deletes_rows(temp_db):
+    outbox.enqueue_batch("test", [(1, None, "{}"), (2, None, "{}")])
+    rows = outbox.claim_rows(10)
+
+    finished = outbox.ack_rows([rows[0].id], [rows[1].id])
+    assert len(finished) == 1
+    assert (finished[0].job_id, finished[0].total) == ("test", 2)
+    assert (finished[0].sent, finished[0].failed) == (1, 1)
+    assert outbox_statuses(temp_db) == {}
+
+
+def test_partial_ack_keeps_batch_open(temp_db):
+    outbox.enqueue_batch("test", [(1, None, "{}"), (2, None, "{}")])
+    rows = outbox.claim_rows(1)
+    assert outbox.ack_rows([rows[0].id], []) == []
+    assert outbox_statuses(temp_db) == {"sent": 1, "pending": 1}
+
+
+def test_batch_counters_grow_per_page_and_ignore_repeated_acks(temp_db):
+    outbox.enqueue_batch("test", [(user_id, None, "{}") for user_id in range(3)])
+    first = outbox.claim_rows(2)
+    assert outbox.ack_rows([first[0].id], [first[1].id]) == []
+    assert outbox.ack_rows([first[0].id], []) == []  # already acked
+    with sqlite3.connect(temp_db) as conn:
+        assert conn.execute("SELECT sent, failed FROM outbox_batches").fetchone() == (1, 1)
+
+    last = outbox.claim_rows(2)
+    finished = outbox.ack_rows([last[0].id], [])
+    assert [(batch.sent, batch.failed) for batch in finished] == [(2, 1)]
+
+
+def test_prune_drops_old_finished_batches_only(temp_db):
+    old = outbox.enqueue_batch("old", [])
+    outbox.enqueue_batch("open", [(1, None, "{}")])
+    with sqlite3.connect(temp_db) as conn:
+        conn.execute(
+            "UPDATE outbox_batches SET finished_at = '2000-01-01 00:00:00' WHERE batch_id = ?",
+            (old,),
+        )
+    outbox.enqueue_batch("recent", [])
+
+    assert outbox.prune_finished_batches(retention_days=7) == 1
+    with sqlite3.connect(temp_db) as conn:
+        jobs = [row[0] for row in conn.execute("SELECT job_id FROM outbox_batches ORDER BY 1")]
+        plan = [
+            row[3]
+            for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT batch_id FROM outbox_batches WHERE finished_at IS NULL"
+            )
+        ]
+    assert jobs == ["open", "recent"]
+    assert "idx_outbox_batches_open" in " ".join(plan)
+
+
+def test_resume_requeues_claimed_rows(temp_db):
+    outbox.enqueue_batch("test", [(1, None, "{}"), (2, None, "{}")])
+    outbox.claim_rows(10)
+
+    assert outbox.resume_unfinished() == 2
+    assert outbox_statuses(temp_db) == {"pending": 2}
+    assert len(outbox.claim_rows(10)) == 2
+
+
+def test_empty_batch_is_finished_immediately(temp_db):
+    outbox.enqueue_batch("test", [])
+    with sqlite3.connect(temp_db) as conn:
+        total, finished_at = conn.execute(
+            "SELECT total, finished_at FROM outbox_batches"
+        ).fetchone()
+    assert total == 0
+    assert finished_at is not None
+
+
+def test_worker_drains_outbox(temp_db):
+    payload = outbox.encode_payload("hi")
+    outbox.enqueue_batch("test", ((user_id, None, payload) for user_id in range(1, 8)))
+    bot = FakeBot(fail_for={3: Forbidden("blocked")})
+    worker = outbox.OutboxWorker(bot, page_size=3)
+
+    async def scenario():
+        processed = []
+        while count := await worker.drain_once():
+            processed.append(count)
+        return processed
+
+    assert asyncio.run(scenario()) == [3, 3, 1]
+    assert sorted(chat_id for chat_id, _ in bot.sent) == [1, 2, 4, 5, 6, 7]
+    assert outbox_statuses(temp_db) == {}
+    with sqlite3.connect(temp_db) as conn:
+        sent, failed = conn.execute("SELECT sent, failed FROM outbox_batches").fetchone()
+    assert (sent, failed) == (6, 1)
+
+
+def test_worker_acks_undecodable_payload(temp_db):
+    outbox.enqueue_batch("test", [(1, None, outbox.encode_payload("hi")), (2, None, "{broken")])
+    bot = FakeBot()
+    worker = outbox.OutboxWorker(bot)
+
+    assert asyncio.run(worker.drain_once()) == 2
+    assert [chat_id for chat_id, _ in bot.sent] == [1]
+    assert outbox_statuses(temp_db) == {}
+    with sqlite3.connect(temp_db) as conn:
+        sent, failed, finished_at = conn.execute(
+            "SELECT sent, failed, finished_at FROM outbox_batches"
+        ).fetchone()
+    assert (sent, failed) == (1, 1)
+    assert finished_at is not None
+
+
+def test_worker_wakes_up_on_notify(temp_db):
+    bot = FakeBot()
+
+    async def scenario():
+        worker = outbox.OutboxWorker(bot, poll_interval=60)
+        worker.start()
+        outbox.enqueue_batch("test", [(1, None, outbox.encode_payload("hi"))])
+        worker.notify()
+        for _ in range(100):
+            if bot.sent:
+                break
+            await asyncio.sleep(0.01)
+        await worker.stop()
+
+    asyncio.run(scenario())
+    assert [chat_id for chat_id, _ in bot.sent] == [1]
+
+
+class HangingBot(FakeBot):
+    """Never finishes sending to one chat, like a send cut off by shutdown."""
+
+    def __init__(self, hang_for):
+        super().__init__()
+        self.hang_for = hang_for
+
+    async def send_message(self, chat_id, **kwargs):
+        if chat_id == self.hang_for:
+            await asyncio.Event().wait()
+        await super().send_message(chat_id, **kwargs)
+
+
+def test_stop_mid_page_acks_delivered_rows(temp_db):
+    payload = outbox.encode_payload("hi")
+    outbox.enqueue_batch("test", [(user_id, None, payload) for user_id in range(1, 6)])
+    bot = HangingBot(hang_for=3)
+
+    async def scenario():
+        worker = outbox.OutboxWorker(bot, poll_interval=60)
+        worker.start()
+        for _ in range(100):
+            if len(bot.sent) == 4:
+                break
+            await asyncio.sleep(0.01)
+        await worker.stop(timeout=0.1)
+
+    asyncio.run(scenario())
+    assert outbox_statuses(temp_db) == {"sent": 4, "sending": 1}
+    # After a restart only the unfinished row is sent again
+    assert outbox.resume_unfinished() == 1
+
+
+def test_jitter_offset_is_stable_and_spread_across_window():
+    offsets = [outbox.jitter_offset("motivational", user_id, 300) for user_id in range(3000)]
+    assert offsets == [outbox.jitter_offset("motivational", u, 300) for u in range(3000)]
+    assert all(0 <= offset < 300 for offset in offsets)
+    # Roughly uniform: every minute of the window gets a similar share of users
+    buckets = [0] * 5
+    for offset in offsets:
+        buckets[int(offset // 60)] += 1
+    assert min(buckets) > 500
+    assert outbox.jitter_offset("motivational", 1, 0) == 0.0
+
+
+def test_spread_batch_is_claimed_as_rows_become_due():
+    import time
+
+    payload = outbox.encode_payload("hi")
+    outbox.enqueue_batch("test", ((u, None, payload) for u in range(100)), spread=60)
+    start = time.time()
+
+    due_now = outbox.claim_rows(1000, now=start)
+    assert len(due_now) < 10
+    due_later = outbox.claim_rows(1000, now=start + 30)
+    assert 20 < len(due_now) + len(due_later) < 80
+    assert outbox.next_due_at() >= start + 30
+    remaining = outbox.claim_rows(1000, now=start + 61)
+    assert len(due_now) + len(due_later) + len(remaining) == 100
+    assert outbox.next_due_at() is None
+
+
+def test_shards_claim_disjoint_rows():
+    outbox.enqueue_batch("test", [(user_id, None, "{}") for user_id in range(10)])
+
+    even = outbox.claim_rows(100, shard_index=0, shard_count=2, instance_id="a")
+    odd = outbox.claim_rows(100, shard_index=1, shard_count=2, instance_id="b")
+    assert [row.user_id for row in even] == [0, 2, 4, 6, 8]
+    assert [row.user_id for row in odd] == [1, 3, 5, 7, 9]
+    assert outbox.next_due_at(shard_index=0, shard_count=2) is None
+
+
+def test_resume_only_requeues_own_or_stale_claims(temp_db):
+    outbox.enqueue_batch("test", [(1, None, "{}"), (2, None, "{}"), (3, None, "{}")])
+    outbox.claim_rows(1, instance_id="a")
+    outbox.claim_rows(1, instance_id="b")
+    outbox.claim_rows(1, instance_id="c")
+    with sqlite3.connect(temp_db) as conn:
+        conn.execute("UPDATE outbox SET claimed_at = claimed_at - 1000 WHERE claimed_by = 'c'")
+
+    # "a" restarts: its own row and the stale row of "c" go back to the queue
+    assert outbox.resume_unfinished("a", stale_after=300) == 2
+    assert outbox_statuses(temp_db) == {"pending": 2, "sending": 1}
+    with sqlite3.connect(temp_db) as conn:
+        holders = conn.execute("SELECT claimed_by FROM outbox WHERE status = 'sending'").fetchall()
+    assert holders == [("b",)]
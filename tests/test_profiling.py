@@ -0,0 +1,98 @@
+"""Tests for profiling.py — hot-path timing, slow-operation logs and the stack sampler."""
+
+import asyncio
+import logging
+import threading
+import time
+
+import pytest
+
+import metrics
+import profiling
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    """Turn detailed profiling on for one test."""
+    monkeypatch.setattr(profiling.profiler, "enabled", True)
+
+
+def test_profiled_handler_records_latency_and_errors():
+    @profiling.profiled_handler
+    async def failing_handler(update, context):
+        raise RuntimeError("boom")
+
+    before = metrics.HANDLER_SECONDS.count(handler="failing")
+    with pytest.raises(RuntimeError):
+        asyncio.run(failing_handler(None, None))
+    assert metrics.HANDLER_SECONDS.count(handler="failing") == before + 1
+    assert metrics.HANDLER_ERRORS.value(handler="failing") >= 1
+
+
+def test_cpu_time_excludes_awaits(enabled):
+    @profiling.profiled("test", "sleepy")
+    async def sleepy():
+        await asyncio.sleep(0.05)
+        return 42
+
+    before = profiling.CPU_SECONDS.count(kind="test", name="sleepy")
+    assert asyncio.run(sleepy()) == 42
+    assert profiling.CPU_SECONDS.count(kind="test", name="sleepy") == before + 1
+    (counts,) = [c for key, c in profiling.CPU_SECONDS._values.items() if key == ("test", "sleepy")]
+    # Sleeping does not burn CPU: the recorded CPU time is far below the wall time
+    assert counts[-1] < 0.04
+
+
+def test_cpu_timed_propagates_exceptions_into_coroutine(enabled):
+    @profiling.profiled("test", "cancelled")
+    async def waits_forever():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            return "cleaned up"
+
+    async def scenario():
+        task = asyncio.create_task(waits_forever())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        return await task
+
+    assert asyncio.run(scenario()) == "cleaned up"
+
+
+def test_slow_operations_are_logged(monkeypatch, caplog):
+    monkeypatch.setattr(profiling, "SLOW_OPERATION_SECONDS", 0.01)
+
+    @profiling.profiled("test", "slow")
+    async def slow():
+        await asyncio.sleep(0.02)
+
+    with caplog.at_level(logging.WARNING, logger="profiling"):
+        asyncio.run(slow())
+    assert "Медленная операция test slow" in caplog.text
+
+
+def test_sampler_produces_folded_stacks_and_is_exclusive():
+    stop = threading.Event()
+
+    def busy_loop_marker():
+        while not stop.is_set():
+            time.sleep(0.001)
+
+    worker = threading.Thread(target=busy_loop_marker, name="marker-thread")
+    worker.start()
+    sampler = profiling.StackSampler(interval=0.001)
+    try:
+        assert sampler._busy.acquire()
+        assert sampler.sample(0.01) is None  # already running
+        sampler._busy.release()
+        counts = sampler.sample(0.05)
+    finally:
+        stop.set()
+        worker.join()
+
+    folded = sampler.render(counts)
+    marker = [line for line in folded.splitlines() if line.startswith("marker-thread;")]
+    assert marker
+    assert "busy_loop_marker (test_profiling.py:" in marker[0]
+    assert marker[0].rsplit(" ", 1)[1].isdigit()
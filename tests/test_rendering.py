@@ -0,0 +1,97 @@
+"""Tests for rendering.py — precomputed response texts."""
+
+from datetime import date, time
+
+from config import SCHEDULE
+from database import TASK_BITS
+from handlers import get_main_keyboard
+from outbox import decode_payload
+from rendering import (
+    MAIN_KEYBOARD,
+    SUMMARY_EMPTY,
+    daily_summary_payloads,
+    daily_summary_templates,
+    reminder_payload,
+    render_daily_summary,
+    render_schedule_lines,
+    render_status_lines,
+    rows_by_time,
+    schedule_mask,
+)
+from schedules import build_schedule, custom_task_config
+
+
+def test_daily_summary_templates_cover_every_mask():
+    templates = daily_summary_templates()
+    assert len(templates) == 2 ** len(SCHEDULE)
+    assert templates[0]["text"] == SUMMARY_EMPTY
+    assert all(template["parse_mode"] == "Markdown" for template in templates.values())
+
+
+def test_daily_summary_template_matches_direct_render():
+    templates = daily_summary_templates()
+    mask = TASK_BITS["breakfast"] | TASK_BITS["language_study"]
+    assert templates[mask]["text"] == render_daily_summary(["breakfast", "language_study"])
+    assert "Выполнено задач: **2**" in templates[mask]["text"]
+
+
+def test_daily_summary_templates_are_built_once():
+    assert daily_summary_templates() is daily_summary_templates()
+    payloads = daily_summary_payloads()
+    assert payloads is daily_summary_payloads()
+    assert decode_payload(payloads[0]) == {"text": SUMMARY_EMPTY, "parse_mode": "Markdown"}
+
+
+def test_schedule_mask_drops_unknown_bits():
+    unknown_bit = 1 << 40
+    assert (schedule_mask() | unknown_bit) & schedule_mask() == schedule_mask()
+    assert schedule_mask() in daily_summary_templates()
+
+
+def test_main_keyboard_is_shared_and_immutable():
+    assert get_main_keyboard() is get_main_keyboard() is MAIN_KEYBOARD
+    assert MAIN_KEYBOARD.resize_keyboard
+
+
+def test_default_schedule_rows_are_precomputed():
+    assert rows_by_time(SCHEDULE) is rows_by_time(SCHEDULE)
+    lines = render_schedule_lines({"morning_workout": True}, SCHEDULE)
+    assert lines[0] == "1. ✅ 08:15 - Тренировка выполнена"
+    assert all("⏰" in line for line in lines[1:])
+
+
+def test_status_lines_follow_status_order_and_skip_unknown_tasks():
+    status = {"breakfast": False, "morning_workout": True, "gone": True}
+    assert render_status_lines(status, SCHEDULE) == [
+        "⏳ 09:00 - Завтрак готов",
+        "✅ 08:15 - Тренировка выполнена",
+    ]
+
+
+def test_user_schedule_rows_are_rendered_per_schedule():
+    schedule = build_schedule([("breakfast", "07:00", None, 0), ("custom_1", "06:00", "Йога", 0)])
+    lines = render_schedule_lines({}, schedule)
+    assert lines[0] == "1. ⏰ 06:00 - Йога"
+    assert lines[1] == "2. ⏰ 07:00 - Завтрак готов"
+    assert rows_by_time(SCHEDULE)[1].label == "09:00 - Завтрак готов"
+
+
+def test_custom_task_titles_are_escaped_in_summary():
+    schedule = build_schedule([("custom_1", "06:00", "my_task *now*", 0)])
+    text = render_daily_summary(["custom_1"], schedule)
+    assert "✅ my\\_task \\*now\\*" in text
+    assert "Выполнено задач: **1**" in text
+
+
+def test_reminder_payloads():
+    day = date(2024, 3, 5)
+    message = decode_payload(reminder_payload("breakfast", None, day))
+    assert message["text"] == SCHEDULE["breakfast"]["message"]
+    button = message["reply_markup"].inline_keyboard[0][0]
+    bit = TASK_BITS["breakfast"].bit_length() - 1
+    assert button.callback_data == f"c1:{bit}:20240305"
+
+    custom = decode_payload(reminder_payload("custom_1", "Йога", day))
+    assert custom["text"] == custom_task_config(time(), "Йога")["message"]
+    assert reminder_payload("custom_1", "Йога", day) is reminder_payload("custom_1", "Йога", day)
+    assert reminder_payload("unknown", None, day) is None
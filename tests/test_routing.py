@@ -0,0 +1,174 @@
+"""Tests for routing.py and the router in handlers.py."""
+
+import asyncio
+import itertools
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from typing import Optional
+
+import pytest
+import pytz
+
+import database as db_module
+import handlers
+from config import MESSAGES
+from dedup import CALLBACK_DEDUP
+from routing import (
+    COMPLETE_CODE,
+    LEGACY_COMPLETE_CODE,
+    CompleteTarget,
+    Router,
+    complete_callback_data,
+    parse_complete,
+    split_callback,
+)
+
+pytestmark = pytest.mark.usefixtures("temp_db")
+
+
+def test_text_routes_accept_label_with_or_without_emoji():
+    router = Router()
+
+    async def status(update, context):
+        pass
+
+    router.add_text(status, "📊 Статус")
+    assert router.text_handler("📊 Статус") is status
+    assert router.text_handler("  статус ") is status
+    assert router.text_handler("СТАТУС") is status
+    assert router.text_handler("статус!") is None
+
+
+def test_handlers_router_covers_keyboard():
+    for label, handler in [
+        ("📊 Статус", handlers.status_handler),
+        ("📈 Отчёт", handlers.report_handler),
+        ("🗓 Расписание", handlers.schedule_handler),
+        ("ℹ️ Помощь", handlers.start_handler),
+        ("помощь", handlers.start_handler),
+    ]:
+        assert handlers.router.text_handler(label) is handler
+
+
+def test_split_callback_new_and_legacy_formats():
+    assert split_callback("c1:3:20240305") == ("c1", ["3", "20240305"])
+    assert split_callback("complete_morning_workout") == ("complete", ["morning_workout"])
+
+
+def test_complete_callback_round_trip():
+    today = date.today()
+    for task_key in ["breakfast", "custom_3"]:
+        code, args = split_callback(complete_callback_data(task_key, today))
+        assert code == COMPLETE_CODE
+        assert parse_complete(code, args, today) == CompleteTarget(task_key)
+    assert len(complete_callback_data("custom_10", today).encode()) <= 64
+
+
+def test_complete_callback_from_another_day_is_stale():
+    today = date.today()
+    code, args = split_callback(complete_callback_data("lunch", today - timedelta(days=1)))
+    assert parse_complete(code, args, today) == CompleteTarget("lunch", stale=True)
+
+
+def test_malformed_complete_callbacks_are_rejected():
+    today = date.today()
+    assert parse_complete(COMPLETE_CODE, ["x", "20240305"], today) is None
+    assert parse_complete(COMPLETE_CODE, ["62", "20240305"], today) is None  # unassigned bit
+    assert parse_complete(COMPLETE_CODE, ["1"], today) is None
+    assert parse_complete(LEGACY_COMPLETE_CODE, [""], today) is None
+    assert parse_complete(LEGACY_COMPLETE_CODE, ["lunch"], today) == CompleteTarget("lunch")
+
+
+def test_bit_lookup_follows_stored_bits():
+    for task_key, mask in db_module.TASK_BITS.items():
+        assert db_module.TASK_KEYS_BY_BIT[mask.bit_length() - 1] == task_key
+
+
+_message_ids = itertools.count(1)
+
+
+class FakeQuery:
+    def __init__(self, data: str, user_id: int = 1, message_id: Optional[int] = None):
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id)
+        self.message = SimpleNamespace(message_id=message_id or next(_message_ids))
+        self.inline_message_id = None
+        self.edits: list[str] = []
+
+    async def answer(self):
+        pass
+
+    async def edit_message_text(self, text: str):
+        self.edits.append(text)
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent: list[str] = []
+
+    async def send_message(self, chat_id: int, text: str):
+        self.sent.append(text)
+
+
+def press(data: str, message_id: Optional[int] = None) -> tuple[FakeQuery, FakeBot]:
+    query = FakeQuery(data, message_id=message_id)
+    bot = FakeBot()
+    update = SimpleNamespace(callback_query=query)
+    asyncio.run(handlers.button_handler(update, SimpleNamespace(bot=bot)))
+    return query, bot
+
+
+def test_button_completes_task_once():
+    data = complete_callback_data("lunch", date.today())
+    query, bot = press(data)
+    assert query.edits[0].endswith(MESSAGES["task_completed"])
+    assert len(bot.sent) == 1
+    assert db_module.is_task_completed_today(1, "lunch")
+
+    query, bot = press(data)
+    assert query.edits[0].endswith(MESSAGES["task_already_completed"])
+
+
+def test_stale_button_is_rejected():
+    query, bot = press(complete_callback_data("lunch", date.today() - timedelta(days=1)))
+    assert query.edits == [MESSAGES["task_button_stale"]]
+    assert not db_module.is_task_completed_today(1, "lunch")
+
+
+def test_button_uses_the_users_local_day():
+    # A zone that is on a different date than the server right now
+    zone = next(
+        name
+        for name in ("Pacific/Kiritimati", "Etc/GMT+12")
+        if datetime.now(pytz.timezone(name)).date() != date.today()
+    )
+    db_module.register_user(user_id=1, username=None, first_name=None)
+    db_module.set_user_timezone(1, zone)
+
+    query, _ = press(complete_callback_data("lunch", date.today()))
+    assert query.edits == [MESSAGES["task_button_stale"]]
+    local_today = datetime.now(pytz.timezone(zone)).date()
+    query, _ = press(complete_callback_data("lunch", local_today))
+    assert query.edits[0].endswith(MESSAGES["task_completed"])
+
+
+def test_legacy_button_still_works():
+    query, _ = press("complete_lunch")
+    assert query.edits[0].endswith(MESSAGES["task_completed"])
+
+
+def test_unknown_callback_code():
+    query, _ = press("zz:1")
+    assert query.edits == ["Ошибка: задача не найдена."]
+
+
+def test_double_tap_is_handled_once():
+    data = complete_callback_data("dinner", date.today())
+    hits = CALLBACK_DEDUP.value(result="hit")
+    first, bot = press(data, message_id=10_000)
+    second, _ = press(data, message_id=10_000)
+
+    assert first.edits[0].endswith(MESSAGES["task_completed"])
+    assert second.edits == []
+    assert len(bot.sent) == 1
+    assert CALLBACK_DEDUP.value(result="hit") == hits + 1
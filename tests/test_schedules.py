@@ -0,0 +1,59 @@
+"""Tests for schedules.py — per-user schedule overrides and their cache."""
+
+from datetime import time
+
+from config import SCHEDULE
+from schedules import (
+    ScheduleCache,
+    build_schedule,
+    custom_task_config,
+    ordered_task_keys,
+    parse_task_time,
+)
+
+
+def test_parse_task_time():
+    assert parse_task_time("07:30") == time(7, 30)
+    assert parse_task_time(" 7:05 ") == time(7, 5)
+    assert parse_task_time("25:00") is None
+    assert parse_task_time("soon") is None
+
+
+def test_build_schedule_without_overrides_is_shared_schedule():
+    assert build_schedule([]) is SCHEDULE
+
+
+def test_build_schedule_applies_overrides():
+    schedule = build_schedule(
+        [
+            ("lunch", "12:30", None, 0),
+            ("dinner", None, None, 1),
+            ("custom_1", "06:00", "Meditation", 0),
+        ]
+    )
+    assert schedule["lunch"]["time"] == time(12, 30)
+    assert schedule["lunch"]["message"] == SCHEDULE["lunch"]["message"]
+    assert "dinner" not in schedule
+    assert schedule["custom_1"] == custom_task_config(time(6, 0), "Meditation")
+    assert SCHEDULE["lunch"]["time"] != time(12, 30)  # shared schedule untouched
+
+
+def test_ordered_task_keys_sorts_by_time():
+    schedule = build_schedule([("custom_1", "06:00", "Meditation", 0)])
+    keys = ordered_task_keys(schedule)
+    assert keys[0] == "custom_1"
+    assert keys[1:] == ordered_task_keys(SCHEDULE)
+
+
+def test_schedule_cache_drops_loads_that_race_with_writes():
+    cache = ScheduleCache(maxsize=2)
+    token = cache.begin_load()
+    cache.invalidate(1)
+    cache.put(1, SCHEDULE, token)
+    assert cache.get(1) is None
+
+    token = cache.begin_load()
+    for user_id in (1, 2, 3):
+        cache.put(user_id, SCHEDULE, token)
+    assert cache.get(1) is None
+    assert cache.get(3) is SCHEDULE
@@ -0,0 +1,57 @@
+"""Tests for sender_pool.py — outbox sending from worker processes."""
+
+import asyncio
+import queue
+
+import pytest
+
+import outbox
+import sender_pool
+from broadcast import PerChatLimiter, TokenBucket
+
+pytestmark = pytest.mark.usefixtures("temp_db")
+
+
+@pytest.fixture(autouse=True)
+def fast_limits(monkeypatch):
+    """Do not throttle sends in tests."""
+    monkeypatch.setattr("broadcast.global_limiter", TokenBucket(10_000))
+    monkeypatch.setattr("broadcast.chat_limiter", PerChatLimiter(0))
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, **kwargs):
+        self.sent.append(chat_id)
+
+
+def test_sub_shards_split_instance_shard(monkeypatch):
+    monkeypatch.setattr(sender_pool, "SHARD_INDEX", 1)
+    monkeypatch.setattr(sender_pool, "SHARD_COUNT", 2)
+    shards = [sender_pool.sub_shard(index, 3) for index in range(3)]
+    assert shards == [(1, 6), (3, 6), (5, 6)]
+    # Every process of instance 1 only sees users of that instance's shard
+    for shard_index, shard_count in shards:
+        assert all(u % 2 == 1 for u in range(100) if u % shard_count == shard_index)
+
+
+def test_sender_sends_only_its_sub_shard_and_stops_on_sentinel():
+    payload = outbox.encode_payload("hi")
+    outbox.enqueue_batch("test", [(user_id, None, payload) for user_id in range(10)])
+    bot = FakeBot()
+    wakeups = queue.Queue()
+
+    async def scenario():
+        task = asyncio.create_task(sender_pool.run_sender(1, 2, wakeups, bot))
+        wakeups.put(True)
+        for _ in range(100):
+            if len(bot.sent) == 5:
+                break
+            await asyncio.sleep(0.01)
+        wakeups.put(None)
+        await asyncio.wait_for(task, 5)
+
+    asyncio.run(scenario())
+    assert sorted(bot.sent) == [1, 3, 5, 7, 9]
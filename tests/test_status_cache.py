@@ -0,0 +1,76 @@
+"""Tests for status_cache.py and the cached read paths in database.py."""
+
+from datetime import date, timedelta
+
+import pytest
+
+import database as db_module
+from status_cache import STATUS_WINDOW_DAYS, DailyStatus, StatusCache, status_cache
+
+pytestmark = pytest.mark.usefixtures("temp_db")
+
+
+def make_status(day, mask=0, counts=None):
+    return DailyStatus(day, mask, counts or [0] * STATUS_WINDOW_DAYS)
+
+
+def test_roll_to_shifts_counters_and_resets_mask():
+    today = date.today()
+    status = make_status(today - timedelta(days=2), mask=0b11, counts=[1, 2, 3, 4, 5, 6, 7])
+    status.roll_to(today)
+    assert status.day == today
+    assert status.completed_mask == 0
+    assert status.daily_counts == [3, 4, 5, 6, 7, 0, 0]
+
+
+def test_roll_to_after_long_absence_clears_counters():
+    today = date.today()
+    status = make_status(today - timedelta(days=30), counts=[1] * STATUS_WINDOW_DAYS)
+    status.roll_to(today)
+    assert status.daily_counts == [0] * STATUS_WINDOW_DAYS
+
+
+def test_cache_evicts_least_recently_used():
+    cache = StatusCache(maxsize=2)
+    today = date.today()
+    cache.put(1, make_status(today))
+    cache.put(2, make_status(today))
+    cache.get(1, today)
+    cache.put(3, make_status(today))
+    assert cache.get(2, today) is None
+    assert cache.get(1, today) is not None
+
+
+def test_put_ignores_load_started_before_write():
+    cache = StatusCache()
+    today = date.today()
+    token = cache.begin_load()
+    cache.mark_completed(1, today, 0b1)
+    cache.put(1, make_status(today), token)
+    assert cache.get(1, today) is None
+
+
+def test_mark_task_completed_writes_through_cache():
+    assert db_module.get_today_tasks_status(1)["lunch"] is False
+    assert db_module.peek_task_completed_today(1, "lunch") is False
+
+    db_module.mark_task_completed(1, "lunch")
+    assert db_module.peek_task_completed_today(1, "lunch") is True
+    assert db_module.peek_today_tasks_status(1)["lunch"] is True
+
+
+def test_cached_completion_rate_matches_database():
+    for task_key in ("lunch", "dinner"):
+        db_module.mark_task_completed(1, task_key)
+    cached = db_module.get_completion_rate(1, days=7)
+    status_cache.clear()
+    assert db_module.peek_completion_rate(1, days=7) is None
+    assert db_module.get_completion_rate(1, days=7) == cached
+    assert cached == pytest.approx(2 / len(db_module.SCHEDULE) * 100)
+
+
+def test_cache_is_cleared_when_database_closes():
+    db_module.get_today_tasks_status(1)
+    assert len(status_cache) == 1
+    db_module.close_db()
+    assert len(status_cache) == 0
@@ -0,0 +1,35 @@
+"""Tests for timezones.py — local reminder times converted to UTC minutes."""
+
+from datetime import date, datetime, time, timezone
+
+import timezones
+from config import SCHEDULE
+
+
+def test_get_zone_rejects_unknown_names():
+    assert timezones.get_zone("Europe/Berlin") is not None
+    assert timezones.get_zone("Mars/Olympus") is None
+    assert timezones.get_zone("") is None
+
+
+def test_utc_minute_follows_daylight_saving_time():
+    berlin = timezones.get_zone("Europe/Berlin")
+    assert timezones.utc_minute(time(8, 15), berlin, date(2026, 1, 10)) == 7 * 60 + 15
+    assert timezones.utc_minute(time(8, 15), berlin, date(2026, 7, 10)) == 6 * 60 + 15
+
+
+def test_utc_minute_wraps_across_midnight():
+    tokyo = timezones.get_zone("Asia/Tokyo")
+    assert timezones.utc_minute(time(8, 0), tokyo, date(2026, 1, 10)) == 23 * 60
+
+
+def test_reminder_minutes_cover_schedule_and_default_zone(monkeypatch):
+    monkeypatch.setattr(timezones, "TIMEZONE", "UTC")
+    minutes = timezones.reminder_minutes(None, date(2026, 1, 10))
+    assert set(minutes) == set(SCHEDULE)
+    assert minutes["lunch"] == 13 * 60
+
+
+def test_current_utc_minute():
+    now = datetime(2026, 1, 10, 13, 5, 42, tzinfo=timezone.utc)
+    assert timezones.current_utc_minute(now) % timezones.MINUTES_PER_DAY == 13 * 60 + 5
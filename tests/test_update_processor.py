@@ -0,0 +1,118 @@
+"""Tests for update_processor.py."""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+from telegram import Chat, Message, Update, User
+
+from update_processor import PerUserUpdateProcessor, ordering_key
+
+
+def make_update(update_id: int, user_id: int) -> Update:
+    user = User(id=user_id, first_name="Test", is_bot=False)
+    chat = Chat(id=user_id, type=Chat.PRIVATE)
+    message = Message(
+        message_id=update_id, date=datetime.now(), chat=chat, from_user=user, text="/status"
+    )
+    return Update(update_id=update_id, message=message)
+
+
+class Recorder:
+    """Handler stand-in that records start/end events and peak concurrency."""
+
+    def __init__(self):
+        self.events: list[tuple[str, int]] = []
+        self.running = 0
+        self.peak = 0
+
+    async def handle(self, update_id: int, delay: float = 0.01):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        self.events.append(("start", update_id))
+        await asyncio.sleep(delay)
+        self.events.append(("end", update_id))
+        self.running -= 1
+
+
+def run_all(processor: PerUserUpdateProcessor, recorder: Recorder, updates, delay=0.01):
+    async def main():
+        await asyncio.gather(
+            *(
+                processor.process_update(update, recorder.handle(update.update_id, delay))
+                for update in updates
+            )
+        )
+
+    asyncio.run(main())
+
+
+def test_same_user_updates_are_sequential_and_ordered():
+    processor = PerUserUpdateProcessor(8)
+    recorder = Recorder()
+    run_all(processor, recorder, [make_update(i, user_id=1) for i in range(5)])
+
+    assert recorder.peak == 1
+    assert recorder.events == [(kind, i) for i in range(5) for kind in ("start", "end")]
+
+
+def test_different_users_run_concurrently():
+    processor = PerUserUpdateProcessor(8)
+    recorder = Recorder()
+    run_all(processor, recorder, [make_update(i, user_id=i) for i in range(5)])
+
+    assert recorder.peak == 5
+
+
+def test_concurrency_limit_is_respected():
+    processor = PerUserUpdateProcessor(3)
+    recorder = Recorder()
+    run_all(processor, recorder, [make_update(i, user_id=i) for i in range(10)])
+
+    assert recorder.peak == 3
+
+
+def test_busy_user_does_not_hold_slots_for_others():
+    processor = PerUserUpdateProcessor(2)
+    recorder = Recorder()
+    busy = [make_update(i, user_id=1) for i in range(5)]
+    other = make_update(100, user_id=2)
+    run_all(processor, recorder, [*busy, other])
+
+    # The other user's update starts while the busy user's first update is running
+    assert recorder.events.index(("start", 100)) < recorder.events.index(("end", 0))
+
+
+def test_user_queues_are_released():
+    processor = PerUserUpdateProcessor(4)
+    recorder = Recorder()
+    run_all(processor, recorder, [make_update(i, user_id=i % 3) for i in range(9)])
+
+    assert processor.users_in_progress == 0
+
+
+def test_failed_update_does_not_block_user():
+    processor = PerUserUpdateProcessor(4)
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            await processor.process_update(make_update(1, user_id=1), fail())
+        done = asyncio.Event()
+
+        async def succeed():
+            done.set()
+
+        await asyncio.wait_for(processor.process_update(make_update(2, user_id=1), succeed()), 1)
+        return done.is_set()
+
+    assert asyncio.run(main())
+    assert processor.users_in_progress == 0
+
+
+def test_ordering_key():
+    assert ordering_key(make_update(1, user_id=42)) == 42
+    assert ordering_key(Update(update_id=2)) is None
+    assert ordering_key("not an update") is None
@@ -0,0 +1,63 @@
+from datetime import date, datetime, time, timezone, tzinfo
+from functools import lru_cache
+from typing import Optional
+
+import pytz
+
+from config import SCHEDULE, TIMEZONE
+
+MINUTES_PER_DAY = 24 * 60
+
+
+@lru_cache(maxsize=1024)
+def get_zone(name: str) -> Optional[tzinfo]:
+    """Возвращает часовой пояс по имени IANA (например, Europe/Moscow) или None."""
+    try:
+        return pytz.timezone(name)
+    except (pytz.UnknownTimeZoneError, ValueError):
+        return None
+
+
+def effective_timezone(name: Optional[str]) -> str:
+    """Часовой пояс пользователя; если он не задан — пояс бота из config.TIMEZONE."""
+    return name or TIMEZONE
+
+
+def local_date(tz_name: Optional[str], now: Optional[datetime] = None) -> date:
+    """Сегодняшняя дата по местному времени пояса tz_name (None — пояс по умолчанию)."""
+    zone = get_zone(effective_timezone(tz_name)) or pytz.utc
+    return (now or datetime.now(timezone.utc)).astimezone(zone).date()
+
+
+def utc_minute(local_time: time, zone: tzinfo, day: date) -> int:
+    """Минута суток по UTC, соответствующая местному времени local_time в день day."""
+    utc = zone.localize(datetime.combine(day, local_time)).astimezone(timezone.utc)
+    return utc.hour * 60 + utc.minute
+
+
+def reminder_minute(task_time: time, tz_name: Optional[str], day: Optional[date] = None) -> int:
+    """
+    UTC-минута суток, в которую пользователю из пояса tz_name нужно напомнить о
+    задаче на местное время task_time. Смещение берётся на день day (по умолчанию —
+    сегодня по местному времени), поэтому после перехода на летнее/зимнее время
+    минуты нужно пересчитать.
+    """
+    zone = get_zone(effective_timezone(tz_name)) or pytz.utc
+    return utc_minute(task_time, zone, day or datetime.now(zone).date())
+
+
+def reminder_minutes(
+    tz_name: Optional[str], day: Optional[date] = None, schedule: Optional[dict] = None
+) -> dict[str, int]:
+    """UTC-минуты напоминаний по расписанию schedule (по умолчанию — общему SCHEDULE)."""
+    schedule = SCHEDULE if schedule is None else schedule
+    return {
+        task_key: reminder_minute(config["time"], tz_name, day)
+        for task_key, config in schedule.items()
+    }
+
+
+def current_utc_minute(now: Optional[datetime] = None) -> int:
+    """Номер текущей минуты от начала эпохи (UTC); по модулю MINUTES_PER_DAY — минута суток."""
+    now = now or datetime.now(timezone.utc)
+    return int(now.timestamp()) // 60
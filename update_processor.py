@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from collections.abc import Awaitable
+from typing import Any, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+UPDATE_USERS_IN_PROGRESS = Gauge(
+    "bot_update_users_in_progress",
+    "Пользователи, обновления которых обрабатываются или ждут своей очереди",
+)
+
+
+class _UserQueue:
+    """Замок пользователя и число его обновлений, которые его держат или ждут."""
+
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+def ordering_key(update: object) -> Optional[int]:
+    """Чьи обновления нельзя обрабатывать одновременно: пользователь, иначе чат."""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обновления разных пользователей обрабатываются параллельно (не больше
+    max_concurrent_updates одновременно), обновления одного пользователя — строго
+    по очереди в порядке поступления. Так нажатие кнопки и следующая за ним
+    /status не гоняются за одну и ту же запись в БД.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._queues: dict[int, _UserQueue] = {}
+
+    @property
+    def users_in_progress(self) -> int:
+        return len(self._queues)
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Сначала очередь пользователя, потом общий семафор: иначе обновления
+        # одного активного пользователя, ждущие своей очереди, заняли бы слоты,
+        # нужные остальным. asyncio.Lock пропускает ожидающих в порядке прихода
+        key = ordering_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = _UserQueue()
+        queue.users += 1
+        try:
+            async with queue.lock:
+                await super().process_update(update, coroutine)
+        finally:
+            queue.users -= 1
+            if queue.users == 0:
+                del self._queues[key]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        UPDATE_USERS_IN_PROGRESS.set_function(lambda: self.users_in_progress)
+        logger.info(
+            f"Параллельная обработка обновлений: до {self.max_concurrent_updates} одновременно, "
+            f"по очереди для каждого пользователя."
+        )
+
+    async def shutdown(self) -> None:
+        pass